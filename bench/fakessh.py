@@ -0,0 +1,226 @@
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+"""
+A network of fake ssh hosts on loopback, to benchmark scans against.
+
+All of 127.0.0.0/8 is loopback on linux, so one socket listening on
+0.0.0.0 answers for every address in it, and the address a connection
+came in on tells us which host it's for. The hosts that are meant to be
+unreachable get a port nobody listens on instead.
+
+The hosts don't run anything. Each command gets the output it had when
+we ran it here once, bundled scripts included, so what we measure is
+the scanner and not a shell.
+"""
+
+import multiprocessing
+import random
+import re
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+import paramiko
+
+USERNAME = "rho"
+PASSWORD = "rho"
+
+# each command of a script from ssh_jobs.bundle_cmd_strings(), with its
+# tag. The commands can span lines.
+BUNDLE_BEGIN = re.compile(r"^echo '(RHO-[0-9a-f]+:\d+):begin'")
+BUNDLE_CMD = re.compile(r"^echo '(RHO-[0-9a-f]+:\d+):begin'.*?\n"
+                        r"\( eval '(.*?)' \) < /dev/null$",
+                        re.MULTILINE | re.DOTALL)
+
+
+def ip_to_int(ip):
+    return struct.unpack("!L", socket.inet_aton(ip))[0]
+
+
+def int_to_ip(number):
+    return socket.inet_ntoa(struct.pack("!L", number))
+
+
+def run_locally(cmd_string):
+    """ (stdout, stderr, exit status) of cmd_string, run here. """
+    process = subprocess.Popen(cmd_string, shell=True, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    return out, err, process.returncode
+
+
+class FakeHost(paramiko.ServerInterface):
+
+    def __init__(self, network, index):
+        self.network = network
+        self.index = index
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        time.sleep(self.network.latency)
+        if self.index in self.network.failing_auth:
+            return paramiko.AUTH_FAILED
+        if (username, password) != (USERNAME, PASSWORD):
+            return paramiko.AUTH_FAILED
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        thread = threading.Thread(target=self.respond,
+                                  args=(channel, command))
+        thread.setDaemon(True)
+        thread.start()
+        return True
+
+    def respond(self, channel, command):
+        time.sleep(self.network.latency)
+        out, err, status = self.network.output(command)
+        try:
+            channel.sendall(out)
+            channel.sendall_stderr(err)
+            channel.send_exit_status(status)
+            # not close(): that can beat paramiko's reply to the exec
+            # request, and the client would take it for a failure. The
+            # client closes it once it's read everything.
+            channel.shutdown_write()
+        except (socket.error, EOFError, paramiko.SSHException):
+            # the scanner gave up on us
+            pass
+
+
+class FakeNetwork(object):
+    """
+    hosts fake ssh hosts, from first_ip up. latency is slept before every
+    login and every command's output, auth_fail is the fraction of hosts
+    no login works on, and unreachable the fraction with nothing listening.
+    servers is how many processes share the serving, so the fake hosts
+    aren't what runs out of cpu first.
+    """
+
+    def __init__(self, hosts, first_ip="127.1.0.1", latency=0, auth_fail=0,
+                 unreachable=0, servers=1, canned=None, seed=0):
+        self.hosts = hosts
+        self.first_ip = ip_to_int(first_ip)
+        self.latency = latency
+        self.servers = servers
+        # command: (stdout, stderr, exit status)
+        self.canned = canned or {}
+        self.canned_lock = threading.Lock()
+
+        # the same hosts fail the same way every run
+        rand = random.Random(seed)
+        indexes = range(hosts)
+        rand.shuffle(indexes)
+        unreachable_count = int(hosts * unreachable)
+        self.unreachable = set(indexes[:unreachable_count])
+        self.failing_auth = set(indexes[unreachable_count:unreachable_count +
+                                        int(hosts * auth_fail)])
+
+        self.listener = None
+        self.port = None
+        self.closed_port = None
+        self.processes = []
+        self.host_key = paramiko.RSAKey.generate(1024)
+
+    def add_canned(self, cmd_strings):
+        """ Run each of cmd_strings here, for the hosts to answer with. """
+        for cmd_string in cmd_strings:
+            if cmd_string not in self.canned:
+                self.canned[cmd_string] = run_locally(cmd_string)
+
+    def targets(self):
+        """ (ip, port) for every host. """
+        for index in range(self.hosts):
+            port = self.port
+            if index in self.unreachable:
+                port = self.closed_port
+            yield int_to_ip(self.first_ip + index), port
+
+    def start(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(("0.0.0.0", 0))
+        self.listener.listen(1024)
+        self.port = self.listener.getsockname()[1]
+
+        # a port that was free a moment ago is as closed as we can get
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(("0.0.0.0", 0))
+        self.closed_port = closed.getsockname()[1]
+        closed.close()
+
+        # they all accept() on the one socket
+        for server in range(self.servers):
+            process = multiprocessing.Process(target=self.serve,
+                                              name="fakessh-%s" % server)
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+            process.join()
+        self.processes = []
+        self.listener.close()
+
+    def serve(self):
+        while True:
+            conn, addr = self.listener.accept()
+            index = ip_to_int(conn.getsockname()[0]) - self.first_ip
+            thread = threading.Thread(target=self.handshake,
+                                      args=(conn, index))
+            thread.setDaemon(True)
+            thread.start()
+
+    def handshake(self, conn, index):
+        time.sleep(self.latency)
+        try:
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=FakeHost(self, index))
+        except (socket.error, EOFError, paramiko.SSHException):
+            conn.close()
+
+    def output(self, command):
+        if BUNDLE_BEGIN.match(command):
+            return self.bundle_output(command)
+        return self.command_output(command)
+
+    def command_output(self, cmd_string):
+        self.canned_lock.acquire()
+        try:
+            if cmd_string not in self.canned:
+                self.canned[cmd_string] = run_locally(cmd_string)
+            return self.canned[cmd_string]
+        finally:
+            self.canned_lock.release()
+
+    def bundle_output(self, script):
+        """ What the script would have printed, going by the canned output. """
+        outs = []
+        errs = []
+        for match in BUNDLE_CMD.finditer(script):
+            tag = match.group(1)
+            cmd_string = match.group(2).replace("'\\''", "'")
+            out, err, status = self.command_output(cmd_string)
+            outs.append("%s:begin\n%s\n%s:end:%s\n" % (tag, out, tag, status))
+            errs.append("%s:begin\n%s\n%s:end\n" % (tag, err, tag))
+        return "".join(outs), "".join(errs), 0
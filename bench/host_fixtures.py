@@ -0,0 +1,88 @@
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+"""
+Output of the rho commands, one directory per host under
+bench/fixtures. Each command's output is in <rho_cmd name>.<index>, its
+stderr in <rho_cmd name>.<index>.err, and a missing file is no output.
+The hosts there now are synthetic, written by synthetic_fixtures.py;
+this records real ones.
+
+To record a host, run this on it as the user rho would log in as:
+
+    PYTHONPATH=src python bench/host_fixtures.py bench/fixtures/<name>
+"""
+
+import os
+import os.path
+import subprocess
+import sys
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "fixtures")
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return ""
+    fileobj = open(path)
+    try:
+        return fileobj.read()
+    finally:
+        fileobj.close()
+
+
+def _write(path, buf):
+    if not buf:
+        return
+    fileobj = open(path, "w")
+    try:
+        fileobj.write(buf)
+    finally:
+        fileobj.close()
+
+
+def hosts(fixtures_dir=FIXTURES_DIR):
+    return sorted([name for name in os.listdir(fixtures_dir)
+                   if os.path.isdir(os.path.join(fixtures_dir, name))])
+
+
+def load(host, rho_cmd, fixtures_dir=FIXTURES_DIR):
+    """ [(stdout, stderr)] for each of rho_cmd's cmd_strings on host. """
+    results = []
+    for index in range(len(rho_cmd.cmd_strings)):
+        path = os.path.join(fixtures_dir, host, "%s.%s" % (rho_cmd.name, index))
+        results.append((_read(path), _read(path + ".err")))
+    return results
+
+
+def record(host_dir, rho_cmd_classes):
+    if not os.path.isdir(host_dir):
+        os.makedirs(host_dir)
+    for rho_cmd_class in rho_cmd_classes:
+        rho_cmd = rho_cmd_class()
+        for index, cmd_string in enumerate(rho_cmd.cmd_strings):
+            process = subprocess.Popen(cmd_string, shell=True,
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            out, err = process.communicate()
+            path = os.path.join(host_dir, "%s.%s" % (rho_cmd.name, index))
+            _write(path, out)
+            _write(path + ".err", err)
+
+
+if __name__ == "__main__":
+    from rho import rho_cmds
+    if len(sys.argv) != 2:
+        print "usage: %s HOST_DIR" % sys.argv[0]
+        sys.exit(1)
+    record(sys.argv[1], rho_cmds.ALL_CMDS)
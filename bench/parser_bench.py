@@ -0,0 +1,185 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+"""
+Parser benchmark, over the host output in bench/fixtures (synthetic,
+see bench/fixtures/README).
+
+Each parser in rho_cmds.ALL_CMDS gets fed the fixture hosts in turn,
+--hosts times in all, in a process of its own. We time it, and measure
+how much the process grew at its peak and how much it kept, holding on
+to each host's data the way the scan report does.
+
+    PYTHONPATH=src python bench/parser_bench.py --hosts 10000 --save
+    PYTHONPATH=src python bench/parser_bench.py --hosts 10000
+
+With --save the results become the baseline; without it they're
+compared to the baseline, if there is one, and we exit 1 if a parser
+got slower or bigger than --tolerance allows.
+"""
+
+import multiprocessing
+import optparse
+import os
+import Queue
+import resource
+import sys
+import time
+
+import simplejson as json
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import host_fixtures
+
+from rho import rho_cmds
+
+DEFAULT_HOSTS = 10000
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "parser_baseline.json")
+PAGE_KB = os.sysconf("SC_PAGE_SIZE") / 1024
+
+
+def current_rss():
+    """ KB, linux only """
+    statm = open("/proc/self/statm")
+    try:
+        return int(statm.read().split()[1]) * PAGE_KB
+    finally:
+        statm.close()
+
+
+def run(rho_cmd_class, hosts, results):
+    outputs = [host_fixtures.load(host, rho_cmd_class())
+               for host in host_fixtures.hosts()]
+    start_rss = current_rss()
+    start_maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    kept = []
+    start = time.time()
+    for index in range(hosts):
+        rho_cmd = rho_cmd_class()
+        rho_cmd.populate_data(outputs[index % len(outputs)])
+        kept.append(rho_cmd.data)
+    elapsed = time.time() - start
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put({'seconds': elapsed,
+                 'us_per_host': elapsed / hosts * 1000000,
+                 # ru_maxrss only ever goes up, so this is only right if
+                 # the parsing took us past where we started
+                 'peak_kb': max(0, maxrss - start_maxrss),
+                 'kept_kb': max(0, current_rss() - start_rss)})
+
+
+def get_result(process, results):
+    """ What process put on results, or None if it died without a word. """
+    while True:
+        try:
+            return results.get(True, 1)
+        except Queue.Empty:
+            if process.is_alive():
+                continue
+            # anything it sent before it went is already here
+            try:
+                return results.get(True, 1)
+            except Queue.Empty:
+                return None
+
+
+def compare(name, result, baseline, tolerance):
+    """ Lines about anything in result worse than baseline by tolerance. """
+    worse = []
+    for key in ('us_per_host', 'kept_kb'):
+        if not baseline.get(key):
+            continue
+        ratio = float(result[key]) / baseline[key]
+        if ratio > tolerance:
+            worse.append("%s: %s went from %.1f to %.1f (%.2fx)" %
+                         (name, key, baseline[key], result[key], ratio))
+    return worse
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--hosts", type="int", default=DEFAULT_HOSTS,
+                      help="hosts to parse the output of for each parser "
+                           "(default %default)")
+    parser.add_option("--parsers", default="",
+                      help="comma separated rho_cmd names to run, "
+                           "default all")
+    parser.add_option("--baseline", default=DEFAULT_BASELINE,
+                      help="baseline file (default %default)")
+    parser.add_option("--save", action="store_true", default=False,
+                      help="save the results as the baseline")
+    parser.add_option("--tolerance", type="float", default=1.25,
+                      help="how many times worse than the baseline counts "
+                           "as a regression (default %default)")
+    options, args = parser.parse_args()
+
+    names = [name for name in options.parsers.split(",") if name]
+    print "%s hosts, going round %s" % (options.hosts,
+                                        ", ".join(host_fixtures.hosts()))
+    print "%-24s %10s %12s %10s %10s" % ("parser", "seconds", "us/host",
+                                         "peak KB", "kept KB")
+    summary = {}
+    for rho_cmd_class in rho_cmds.ALL_CMDS:
+        if names and rho_cmd_class.name not in names:
+            continue
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run,
+                                          args=(rho_cmd_class, options.hosts,
+                                                results))
+        process.start()
+        result = get_result(process, results)
+        process.join()
+        if result is None:
+            print "%s died, exit code %s" % (rho_cmd_class.name,
+                                             process.exitcode)
+            sys.exit(1)
+        summary[rho_cmd_class.name] = result
+        print "%-24s %10.2f %12.1f %10s %10s" % (rho_cmd_class.name,
+                                                 result['seconds'],
+                                                 result['us_per_host'],
+                                                 result['peak_kb'],
+                                                 result['kept_kb'])
+
+    if options.save:
+        fileobj = open(options.baseline, "w")
+        try:
+            json.dump({'hosts': options.hosts, 'parsers': summary}, fileobj,
+                      sort_keys=True, indent=2)
+        finally:
+            fileobj.close()
+        print "saved the baseline to %s" % options.baseline
+        return
+
+    if not os.path.exists(options.baseline):
+        return
+    baseline = json.load(open(options.baseline))
+    if baseline['hosts'] != options.hosts:
+        print "the baseline is for %s hosts, not comparing" % baseline['hosts']
+        return
+    worse = []
+    for name, result in sorted(summary.items()):
+        if name in baseline['parsers']:
+            worse.extend(compare(name, result, baseline['parsers'][name],
+                                 options.tolerance))
+    if worse:
+        print "regressions against %s:" % options.baseline
+        print "\n".join(worse)
+        sys.exit(1)
+    print "no regressions against %s" % options.baseline
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+"""
+Scan throughput benchmark, against a FakeNetwork of fake ssh hosts.
+
+For each of the --hosts sizes, scans that many fake hosts with
+SshJobs.run_jobs() and prints the hosts a second, the peak memory of the
+scanning process and how the time went on each phase of the host scans.
+
+    PYTHONPATH=src python bench/scan_bench.py --hosts 100,1000,10000
+"""
+
+import multiprocessing
+import optparse
+import os
+import Queue
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakessh
+
+from rho import config
+from rho import rho_cmds
+from rho import ssh_jobs
+
+DEFAULT_SIZES = "100,1000,10000"
+
+
+def run(options, size, results):
+    """ Scan size hosts, in a process of its own for the memory figure. """
+    network = fakessh.FakeNetwork(size, latency=options.latency,
+                                  auth_fail=options.auth_fail,
+                                  unreachable=options.unreachable,
+                                  servers=options.servers)
+    cmd_strings = rho_cmds.DATA_SOURCES.values()
+    for rho_cmd_class in rho_cmds.DEFAULT_CMDS:
+        cmd_strings.extend(rho_cmd_class().cmd_strings)
+    network.add_canned(cmd_strings)
+    network.start()
+
+    auth = config.SshAuth({'name': "bench", 'username': fakessh.USERNAME,
+                           'password': fakessh.PASSWORD, 'type': 'ssh'})
+
+    def gen_jobs():
+        for ip, port in network.targets():
+            yield ssh_jobs.SshJob(ip=ip, ports=[port], auths=[auth],
+                                  rho_cmds=[rho_cmd_class() for rho_cmd_class
+                                            in rho_cmds.DEFAULT_CMDS],
+                                  timeout=options.timeout,
+                                  bundle_cmds=options.bundle)
+
+    jobs = ssh_jobs.SshJobs(max_threads=options.threads,
+                            progress_interval=options.progress_interval)
+    jobs.total = size
+    start = time.time()
+    try:
+        jobs.run_jobs(ssh_jobs=gen_jobs())
+    finally:
+        network.stop()
+    elapsed = time.time() - start
+
+    report = jobs.output_thread.report
+    results.put({'hosts': size,
+                 'seconds': elapsed,
+                 'rate': size / elapsed,
+                 # kilobytes, on linux
+                 'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                 'results': report.metrics.hosts,
+                 'timing': report.timing.format()})
+
+
+def get_result(process, results):
+    """ What process put on results, or None if it died without a word. """
+    while True:
+        try:
+            return results.get(True, 1)
+        except Queue.Empty:
+            if process.is_alive():
+                continue
+            # anything it sent before it went is already here
+            try:
+                return results.get(True, 1)
+            except Queue.Empty:
+                return None
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--hosts", default=DEFAULT_SIZES,
+                      help="comma separated numbers of hosts to scan "
+                           "(default %default)")
+    parser.add_option("--threads", type="int",
+                      default=ssh_jobs.DEFAULT_MAX_THREADS,
+                      help="ssh threads (default %default)")
+    parser.add_option("--latency", type="float", default=0,
+                      help="seconds each host takes to answer a login or "
+                           "command (default %default)")
+    parser.add_option("--auth-fail", dest="auth_fail", type="float",
+                      default=0,
+                      help="fraction of hosts no login works on "
+                           "(default %default)")
+    parser.add_option("--unreachable", type="float", default=0,
+                      help="fraction of hosts with nothing listening "
+                           "(default %default)")
+    parser.add_option("--bundle", action="store_true", default=False,
+                      help="run each host's commands in one exec")
+    parser.add_option("--servers", type="int", default=2,
+                      help="processes serving the fake hosts "
+                           "(default %default)")
+    parser.add_option("--timeout", type="float", default=30,
+                      help="ssh connect timeout (default %default)")
+    parser.add_option("--progress-interval", dest="progress_interval",
+                      type="float", default=10,
+                      help="seconds between progress lines (default %default)")
+    options, args = parser.parse_args()
+
+    summary = []
+    for size in [int(size) for size in options.hosts.split(",")]:
+        print "== %s hosts" % size
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run,
+                                          args=(options, size, results))
+        process.start()
+        result = get_result(process, results)
+        process.join()
+        if result is None:
+            print "the scan of %s hosts died, exit code %s" % \
+                (size, process.exitcode)
+            sys.exit(1)
+
+        print "%(hosts)s hosts in %(seconds).1fs, %(rate).1f hosts/s, " \
+              "max rss %(maxrss)s KB" % result
+        print ", ".join(["%s %s" % item for item in
+                         sorted(result['results'].items())])
+        print "\n".join(result['timing'])
+        print
+        summary.append(result)
+
+    print "%8s %10s %10s %12s" % ("hosts", "seconds", "hosts/s", "max rss KB")
+    for result in summary:
+        print "%(hosts)8s %(seconds)10.1f %(rate)10.1f %(maxrss)12s" % result
+
+
+if __name__ == "__main__":
+    main()
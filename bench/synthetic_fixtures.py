@@ -0,0 +1,584 @@
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+"""
+Writes the synthetic hosts in bench/fixtures. They are not captured from
+real machines: the output is made up to be the size and shape of what
+the rho commands print, and each host is kept consistent with itself
+(cpuinfo, dmidecode and subscription-manager agree on the processors,
+the release package and kernel are in the package list, and so on).
+The package names are real package names, but the versions, dates and
+subpackages are random.
+
+    PYTHONPATH=src python bench/synthetic_fixtures.py
+
+rewrites them all the same way every time. A host recorded with
+bench/host_fixtures.py can go next to them, or replace them.
+"""
+
+import calendar
+import os
+import random
+import shutil
+import subprocess
+import time
+import uuid
+
+import host_fixtures
+from rho import rho_cmds
+
+SEED = 42
+SCAN_DATE = "Tue Dec 15 10:22:01 EST 2020"
+
+PACKAGES = """
+NetworkManager acl alsa-lib at attr audit authconfig avahi basesystem bash
+bc bind bind-utils binutils biosdevname bzip2 c-ares ca-certificates cairo
+checkpolicy chrony cifs-utils cpio cracklib cronie cryptsetup cups curl
+cyrus-sasl dbus dbus-glib device-mapper device-mapper-persistent-data dhcp
+diffutils dmidecode dnsmasq dosfstools dracut e2fsprogs ebtables ed
+efibootmgr elfutils ethtool expat file filesystem findutils firewalld
+fontconfig freetype gawk gdbm gdisk gettext git glib2 glibc gmp gnupg2
+gnutls gobject-introspection gpgme grep groff grub2 grubby gzip hardlink
+harfbuzz hdparm hostname hwdata info initscripts iproute iprutils iptables
+iputils irqbalance jansson jq json-c kbd kexec-tools keyutils kmod krb5
+less libX11 libXau libXext libXrender libacl libaio libarchive libassuan
+libattr libblkid libcap libcap-ng libcgroup libcom_err libcurl libdb
+libedit libevent libffi libgcc libgcrypt libgomp libgpg-error libidn
+libjpeg-turbo libmnl libmount libndp libnetfilter_conntrack libnfnetlink
+libnl3 libpcap libpng libpwquality libseccomp libselinux libsemanage
+libsepol libsmartcols libssh2 libsss_idmap libstdc++ libtasn1 libtiff
+libunistring libusbx libuser libutempter libuuid libverto libxml2 libxslt
+libyaml linux-firmware lm_sensors logrotate lsof lsscsi lvm2 lz4 lzo m4
+mailx make man-db mariadb mdadm mesa microcode_ctl mlocate mozjs nano
+ncurses net-snmp net-tools nettle newt nfs-utils nspr nss nss-softokn
+nss-util numactl openldap openssh openssl p11-kit pam pango parted passwd
+pciutils pcre perl pinentry pixman pkgconfig plymouth policycoreutils
+polkit popt postfix procps-ng psmisc pth python python-dateutil
+python-requests python-six python-urllib3 qrencode quota rdma-core
+readline rootfiles rpcbind rpm rsync rsyslog samba-client sed selinux-policy
+setup sg3_utils shadow-utils shared-mime-info slang snappy sqlite sssd
+strace sudo systemd sysstat tar tcpdump teamd time tmux traceroute tuned
+tzdata unzip usbutils usermode util-linux vim wget which xfsprogs xz yum
+yum-utils zip zlib
+""".split()
+
+PERL_MODULES = """
+Carp Data-Dumper Digest Digest-MD5 Encode Exporter File-Path File-Temp
+Getopt-Long HTTP-Tiny IO-Socket-IP IO-Socket-SSL JSON-PP Net-SSLeay
+PathTools Pod-Escapes Pod-Perldoc Pod-Simple Pod-Usage Scalar-List-Utils
+Socket Storable Term-ANSIColor Text-ParseWords Time-HiRes Time-Local
+constant libs macros parent podlators threads threads-shared
+""".split()
+
+PYTHON_MODULES = """
+babel chardet configobj decorator idna jinja2 jsonpatch jsonpointer
+jwcrypto ldap lxml markupsafe netaddr netifaces pexpect ply prettytable
+ptyprocess pyasn1 pycparser pycurl pyOpenSSL pyparsing pyserial pysocks
+pytz pyudev pyyaml setuptools
+""".split()
+
+SUBPACKAGES = ["", "-libs", "-devel", "-common", "-tools", "-doc", "-static",
+               "-utils", "-data", "-client"]
+
+LICENSES = ["GPLv2+", "GPLv2", "LGPLv2+", "GPLv3+", "MIT", "BSD", "ASL 2.0"]
+
+INTEL_FLAGS = (
+    "fpu vme de pse tsc msr pae mce cx8 apic sep mtrr pge mca cmov pat pse36 "
+    "clflush dts acpi mmx fxsr sse sse2 ss ht tm pbe syscall nx pdpe1gb rdtscp "
+    "lm constant_tsc arch_perfmon pebs bts rep_good nopl xtopology nonstop_tsc "
+    "aperfmperf eagerfpu pni pclmulqdq dtes64 monitor ds_cpl vmx smx est tm2 "
+    "ssse3 sdbg fma cx16 xtpr pdcm pcid dca sse4_1 sse4_2 x2apic movbe popcnt "
+    "tsc_deadline_timer aes xsave avx f16c rdrand lahf_lm abm epb "
+    "invpcid_single ssbd ibrs ibpb stibp tpr_shadow vnmi flexpriority ept vpid "
+    "fsgsbase tsc_adjust bmi1 avx2 smep bmi2 erms invpcid cqm xsaveopt cqm_llc "
+    "cqm_occup_llc dtherm ida arat pln pts md_clear spec_ctrl intel_stibp "
+    "flush_l1d")
+
+AMD_FLAGS = (
+    "fpu vme de pse tsc msr pae mce cx8 apic sep mtrr pge mca cmov pat pse36 "
+    "clflush mmx fxsr sse sse2 ht syscall nx mmxext fxsr_opt pdpe1gb rdtscp lm "
+    "constant_tsc rep_good nopl nonstop_tsc cpuid extd_apicid aperfmperf pni "
+    "pclmulqdq monitor ssse3 fma cx16 sse4_1 sse4_2 x2apic movbe popcnt aes "
+    "xsave avx f16c rdrand lahf_lm cmp_legacy svm extapic cr8_legacy abm sse4a "
+    "misalignsse 3dnowprefetch osvw ibs skinit wdt tce topoext perfctr_core "
+    "perfctr_nb bpext perfctr_llc mwaitx cpb cat_l3 cdp_l3 hw_pstate sme ssbd "
+    "mba sev ibrs ibpb stibp vmmcall fsgsbase bmi1 avx2 smep bmi2 cqm rdt_a "
+    "rdseed adx smap clflushopt clwb sha_ni xsaveopt xsavec xgetbv1 xsaves "
+    "cqm_llc cqm_occup_llc cqm_mbm_total cqm_mbm_local clzero irperf "
+    "xsaveerptr wbnoinvd arat npt lbrv svm_lock nrip_save tsc_scale "
+    "vmcb_clean flushbyasid decodeassists pausefilter pfthreshold avic "
+    "v_vmsave_vmload vgif umip rdpid overflow_recov succor smca")
+
+QEMU_FLAGS = (
+    "fpu de pse tsc msr pae mce cx8 apic sep mtrr pge mca cmov pat pse36 "
+    "clflush mmx fxsr sse sse2 syscall nx lm rep_good nopl cpuid pni cx16 "
+    "x2apic hypervisor lahf_lm")
+
+SYSTEMID = """<?xml version="1.0"?>
+<params>
+<param>
+<value><struct>
+<member>
+<name>username</name>
+<value><string>admin</string></value>
+</member>
+<member>
+<name>operating_system</name>
+<value><string>%(release)s</string></value>
+</member>
+<member>
+<name>description</name>
+<value><string>Initial Registration Parameters:
+OS: %(release)s
+Release: %(os_release)s
+CPU Arch: x86_64</string></value>
+</member>
+<member>
+<name>profile_name</name>
+<value><string>%(hostname)s</string></value>
+</member>
+<member>
+<name>system_id</name>
+<value><string>ID-%(system_id)d</string></value>
+</member>
+<member>
+<name>architecture</name>
+<value><string>x86_64</string></value>
+</member>
+<member>
+<name>os_release</name>
+<value><string>%(os_release)s</string></value>
+</member>
+<member>
+<name>type</name>
+<value><string>REAL</string></value>
+</member>
+</struct></value>
+</param>
+</params>
+"""
+
+
+def _day(date):
+    """ seconds since the epoch at noon UTC on date, a "YYYY-MM-DD" """
+    year, month, day = [int(part) for part in date.split("-")]
+    return calendar.timegm((year, month, day, 12, 0, 0))
+
+
+def _rpm_date(seconds):
+    return time.strftime("%a %d %b %Y %I:%M:%S %p EST", time.gmtime(seconds))
+
+
+def _uuid(rand):
+    return str(uuid.UUID(int=rand.getrandbits(128)))
+
+
+def package_names(rand, count, python_prefix, exclude):
+    """ count names made from real package names and subpackages """
+    bases = [name for name in PACKAGES if name not in exclude]
+    bases.extend(["perl-%s" % name for name in PERL_MODULES])
+    bases.extend(["%s-%s" % (python_prefix, name) for name in PYTHON_MODULES])
+    names = ["%s%s" % (base, sub) for sub in SUBPACKAGES[1:] for base in bases]
+    rand.shuffle(names)
+    return sorted(bases + names[:count - len(bases)])
+
+
+def rpm_dump(rand, host):
+    """
+    What rho_cmds.PKG_QUERY prints: random versions and dates for the
+    host's packages, all installed between the host's install date and
+    its last update, plus the host's own kernel and release packages,
+    which came in with the last update.
+    """
+    installed = _day(host['installed'])
+    fixed = dict([(name, (version, release))
+                  for name, version, release in host['packages']])
+    names = package_names(rand, host['package_count'] - len(fixed),
+                          host['python_prefix'], fixed.keys())
+    lines = []
+    for name in sorted(names + fixed.keys()):
+        if name in fixed:
+            version, release = fixed[name]
+            inst = host['last_update'] - rand.randint(0, 3600)
+            built = inst - rand.randint(86400, 86400 * 30)
+            redhat = host['redhat_fraction'] > 0
+        else:
+            version = "%d.%d.%d" % (rand.randint(0, 9), rand.randint(0, 30),
+                                    rand.randint(0, 20))
+            release = "%d.%s" % (rand.randint(1, 40), host['dist'])
+            inst = rand.randint(installed, host['last_update'])
+            built = inst - rand.randint(86400, 86400 * 400)
+            redhat = rand.random() < host['redhat_fraction']
+        if redhat:
+            vendor = "Red Hat, Inc."
+            build_host = "x86-vm-%02d.build.eng.bos.redhat.com" % \
+                rand.randint(1, 40)
+            packager = "Red Hat, Inc. <http://bugzilla.redhat.com/bugzilla>"
+        else:
+            vendor = "Fedora Project"
+            build_host = "buildvm-%02d.phx2.fedoraproject.org" % \
+                rand.randint(1, 40)
+            packager = "Fedora Project"
+        lines.append("|".join([name, version, release, str(inst), vendor,
+                               str(built), build_host,
+                               "%s-%s-%s.src.rpm" % (name, version, release),
+                               rand.choice(LICENSES), packager,
+                               _rpm_date(inst), _rpm_date(built)]))
+    # gpg-pubkey has no vendor or build host, like the real thing
+    lines.append("|".join(["gpg-pubkey", "fd431d51", "4ae0493b",
+                           str(installed), "(none)", "1256212795", "(none)",
+                           "(none)", "pubkey", "(none)", _rpm_date(installed),
+                           _rpm_date(1256212795)]))
+    return "".join(["%s\n" % line for line in lines])
+
+
+def cpuinfo(cpu):
+    processors = cpu['sockets'] * cpu['cores'] * cpu['threads']
+    siblings = cpu['cores'] * cpu['threads']
+    out = []
+    for index in range(processors):
+        out.append("processor\t: %d\n"
+                   "vendor_id\t: %s\n"
+                   "cpu family\t: %d\n"
+                   "model\t\t: %d\n"
+                   "model name\t: %s\n"
+                   "stepping\t: %d\n"
+                   "microcode\t: %s\n"
+                   "cpu MHz\t\t: %.3f\n"
+                   "cache size\t: %s\n"
+                   "physical id\t: %d\n"
+                   "siblings\t: %d\n"
+                   "core id\t\t: %d\n"
+                   "cpu cores\t: %d\n"
+                   "apicid\t\t: %d\n"
+                   "initial apicid\t: %d\n"
+                   "fpu\t\t: yes\n"
+                   "fpu_exception\t: yes\n"
+                   "cpuid level\t: %d\n"
+                   "wp\t\t: yes\n"
+                   "flags\t\t: %s\n"
+                   "bogomips\t: %.2f\n"
+                   "clflush size\t: 64\n"
+                   "cache_alignment\t: 64\n"
+                   "address sizes\t: %s\n"
+                   "power management:%s\n"
+                   % (index, cpu['vendor'], cpu['family'], cpu['model'],
+                      cpu['name'], cpu['stepping'], cpu['microcode'],
+                      cpu['mhz'], cpu['cache'], index // siblings, siblings,
+                      index % cpu['cores'], cpu['cores'], index, index,
+                      cpu['cpuid_level'], cpu['flags'], cpu['mhz'] * 2,
+                      cpu['address_sizes'], cpu['power']))
+    return "\n".join(out) + "\n"
+
+
+def dmidecode_processors(cpu):
+    """ what CpuRhoCmd's dmidecode pipeline prints """
+    out = ["# dmidecode 3.2", "Getting SMBIOS data from sysfs.",
+           "SMBIOS 3.0.0 present.", ""]
+    for socket in range(cpu['sockets']):
+        out.append("Handle 0x004%d, DMI type 4, 48 bytes\n"
+                   "Processor Information\n"
+                   "\tSocket Designation: CPU%d\n"
+                   "\tType: Central Processor\n"
+                   "\tFamily: %s\n"
+                   "\tManufacturer: %s\n"
+                   "\tID: %s\n"
+                   "\tVersion: %s\n"
+                   "\tVoltage: 1.8 V\n"
+                   "\tExternal Clock: 100 MHz\n"
+                   "\tMax Speed: %d MHz\n"
+                   "\tCurrent Speed: %d MHz\n"
+                   "\tStatus: Populated, Enabled\n"
+                   "\tUpgrade: %s\n"
+                   "\tCore Count: %d\n"
+                   "\tCore Enabled: %d\n"
+                   "\tThread Count: %d\n"
+                   "\tCharacteristics:\n"
+                   "\t\t64-bit capable\n"
+                   "\t\tMulti-Core\n"
+                   "\t\tHardware Thread\n"
+                   "\t\tExecute Protection\n"
+                   "\t\tEnhanced Virtualization\n"
+                   "\t\tPower/Performance Control\n"
+                   % (socket, socket + 1, cpu['dmi_family'],
+                      cpu['dmi_manufacturer'], cpu['dmi_id'], cpu['name'],
+                      cpu['max_mhz'], int(cpu['mhz']), cpu['dmi_upgrade'],
+                      cpu['cores'], cpu['cores'], cpu['dmi_threads']))
+    out.append("Handle 0x0050, DMI type 7, 27 bytes\n"
+               "Cache Information\n"
+               "\tSocket Designation: L1 Cache\n")
+    return "\n".join(out)
+
+
+def subman_facts(rand, host):
+    cpu = host['cpu']
+    facts = {
+        "cpu.core(s)_per_socket": str(cpu['cores']),
+        "cpu.cpu(s)": str(cpu['sockets'] * cpu['cores'] * cpu['threads']),
+        "cpu.cpu_socket(s)": str(cpu['sockets']),
+        "cpu.thread(s)_per_core": str(cpu['threads']),
+        "distribution.id": host['codename'],
+        "distribution.name": host['distribution'],
+        "distribution.version": host['version'],
+        "dmi.bios.vendor": host['bios_vendor'],
+        "dmi.bios.version": host['bios_version'],
+        "dmi.system.manufacturer": host['manufacturer'],
+        "dmi.system.product_name": host['product'],
+        "virt.host_type": "Not Applicable",
+        "virt.is_guest": "False",
+        "uname.machine": "x86_64",
+        "memory.memtotal": str(host['memory']),
+        "memory.swaptotal": "4194300",
+        "proc_stat.btime": str(_day(host['last_boot'])),
+        "system.certificate_version": "3.2",
+    }
+    for index in range(host['dimms']):
+        facts["dmi.memory.bank_locator.%d" % index] = "BANK %d" % index
+        facts["dmi.memory.locator.%d" % index] = "DIMM_%s%d" % \
+            ("AB"[index % 2], index // 2 + 1)
+    for index in range(host['nics']):
+        facts["net.interface.em%d.ipv4_address" % (index + 1)] = \
+            "10.%d.%d.%d" % (rand.randint(0, 255), rand.randint(0, 255),
+                             rand.randint(1, 254))
+        facts["net.interface.em%d.ipv4_netmask" % (index + 1)] = "24"
+        facts["net.interface.em%d.mac_address" % (index + 1)] = \
+            ":".join(["%02X" % rand.randint(0, 255) for i in range(6)])
+    # a tap device for each running guest
+    for index in range(host.get('running_guests', 0)):
+        facts["net.interface.vnet%d.mac_address" % index] = \
+            "FE:54:00:%02X:%02X:%02X" % (rand.randint(0, 255),
+                                         rand.randint(0, 255),
+                                         rand.randint(0, 255))
+    return "".join(["%s: %s\n" % (key, facts[key]) for key in sorted(facts)])
+
+
+def virsh_list(host):
+    out = [" Id    Name                           State",
+           "----------------------------------------------------"]
+    for index in range(host['guests']):
+        name = "guest-%03d.example.com" % index
+        if index < host['running_guests']:
+            out.append(" %-5d %-30s running" % (index + 1, name))
+        else:
+            out.append(" -     %-30s shut off" % name)
+    return "\n".join(out) + "\n\n"
+
+
+def write_host(rand, fixtures_dir, host):
+    host_dir = os.path.join(fixtures_dir, host['name'])
+    if os.path.isdir(host_dir):
+        shutil.rmtree(host_dir)
+    os.makedirs(host_dir)
+
+    def write(name, out="", err=""):
+        path = os.path.join(host_dir, name)
+        host_fixtures._write(path, out)
+        host_fixtures._write(path + ".err", err)
+
+    uname = ["Linux", host['hostname'], "x86_64", host['kernel'],
+             "Linux %s %s %s x86_64 x86_64 x86_64 GNU/Linux" %
+             (host['hostname'], host['kernel'], host['kernel_built']),
+             "x86_64"]
+    for index, out in enumerate(uname):
+        write("uname.%d" % index, out + "\n")
+
+    release = host.get('release')
+    if release:
+        write("redhat-release.0", "%s\n%s\n%s\n" % release)
+    else:
+        write("redhat-release.0", "no package provides redhat-release\n")
+    if host.get('os_release'):
+        write("systemid.0", SYSTEMID % {'release': release[0],
+                                        'os_release': host['os_release'],
+                                        'hostname': host['hostname'],
+                                        'system_id': rand.randint(1000000000,
+                                                                  1099999999)})
+
+    write("cpu.0", cpuinfo(host['cpu']))
+    write("virt.0", cpuinfo(host['cpu']))
+    if host.get('root'):
+        write("cpu.1", dmidecode_processors(host['cpu']))
+        write("virt.1", dmidecode_processors(host['cpu']))
+        write("dmi.0", host['bios_vendor'] + "\n")
+        write("dmi.1", host['bios_version'] + "\n")
+        write("dmi.2", host['manufacturer'] + "\n")
+        write("virt.2", host['manufacturer'] + "\n")
+        write("dmi.3", "%s\n" % host['cpu']['dmi_family'] *
+              host['cpu']['sockets'])
+    else:
+        denied = "/dev/mem: Permission denied\n"
+        for name in ("cpu.1", "virt.1", "virt.2",
+                     "dmi.0", "dmi.1", "dmi.2", "dmi.3"):
+            write(name, err=denied)
+
+    write("etc-release.0", host['etc_release'] + "\n")
+    write("etc-issue.0", "\\S\nKernel \\r on an \\m\n\n")
+    write("virt.4", "false\n")
+    write("virt.5", "true\n" if host.get('guests') else "false\n")
+    if host.get('guests'):
+        write("virt.6", virsh_list(host))
+        write("virt.7", "\n".join([_uuid(rand) for index in
+                                   range(host['running_guests'])]) + "\n\n")
+    else:
+        missing = "bash: virsh: command not found\n"
+        write("virt.6", err=missing)
+        write("virt.7", err=missing)
+    write("virt-what.0", host['virt_what'])
+
+    packages = rpm_dump(rand, host)
+    write("redhat-packages.0", packages)
+    summary = subprocess.Popen(rho_cmds.PKG_SUMMARY, shell=True,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    write("redhat-packages-summary.0", summary.communicate(packages)[0])
+
+    write("date.0", SCAN_DATE + "\n")
+    if host.get('root'):
+        write("date.1", host['installed'] + "\n")
+    else:
+        write("date.1", err="ls: cannot access '/root/anaconda-ks.cfg': "
+              "Permission denied\n")
+    write("date.2", host['installed'] + "\n")
+    write("date.3", (host['installed'] if host.get('root') else "") + "\n")
+    write("date.4", "".join(["%s\n" % day for day in host['history']]))
+
+    if host.get('distribution'):
+        write("subscription-manager.0", subman_facts(rand, host))
+        write("subscription-manager.1", "custom.facts\n")
+    else:
+        write("subscription-manager.0",
+              err="bash: subscription-manager: command not found\n")
+
+
+HOSTS = [
+    # a registered RHEL 7 database server, scanned as root
+    {'name': "rhel7-server",
+     'hostname': "db01.example.com",
+     'root': True,
+     'kernel': "3.10.0-1160.6.1.el7.x86_64",
+     'kernel_built': "#1 SMP Wed Oct 21 13:44:38 EDT 2020",
+     'release': ("redhat-release-server", "7.9", "7.el7"),
+     'os_release': "7Server",
+     'etc_release': "Red Hat Enterprise Linux Server release 7.9 (Maipo)",
+     'distribution': "Red Hat Enterprise Linux Server",
+     'codename': "Maipo",
+     'version': "7.9",
+     'packages': [("kernel", "3.10.0", "1160.6.1.el7"),
+                  ("redhat-release-server", "7.9", "7.el7"),
+                  ("subscription-manager", "1.24.45", "1.el7_9"),
+                  ("rhn-client-tools", "2.0.2", "24.el7")],
+     'package_count': 1400,
+     'dist': "el7",
+     'python_prefix': "python",
+     'redhat_fraction': 0.92,
+     'installed': "2019-03-12",
+     'last_update': _day("2020-12-01"),
+     'history': ["2020-12-01", "2020-11-10", "2020-10-06"],
+     'last_boot': "2020-12-01",
+     'manufacturer': "Dell Inc.",
+     'product': "PowerEdge R630",
+     'bios_vendor': "Dell Inc.",
+     'bios_version': "2.11.0",
+     'memory': 131746788,
+     'dimms': 8,
+     'nics': 4,
+     'virt_what': "0\n",
+     'cpu': {'sockets': 2, 'cores': 8, 'threads': 2,
+             'vendor': "GenuineIntel", 'family': 6, 'model': 63,
+             'stepping': 2, 'microcode': "0x44",
+             'name': "Intel(R) Xeon(R) CPU E5-2640 v3 @ 2.60GHz",
+             'mhz': 2600.0, 'max_mhz': 4000, 'cache': "20480 KB",
+             'cpuid_level': 15,
+             'address_sizes': "46 bits physical, 48 bits virtual",
+             'power': "", 'flags': INTEL_FLAGS,
+             'dmi_family': "Xeon", 'dmi_manufacturer': "Intel",
+             'dmi_id': "F2 06 03 00 FF FB EB BF",
+             'dmi_upgrade': "Socket LGA2011-3", 'dmi_threads': 16}},
+    # a RHEL 8 KVM host with SMT turned off, scanned as root
+    {'name': "rhel8-kvm-host",
+     'hostname': "virt07.example.com",
+     'root': True,
+     'kernel': "4.18.0-240.el8.x86_64",
+     'kernel_built': "#1 SMP Wed Sep 23 05:13:10 EDT 2020",
+     'release': ("redhat-release", "8.3", "1.0.el8"),
+     'etc_release': "Red Hat Enterprise Linux release 8.3 (Ootpa)",
+     'distribution': "Red Hat Enterprise Linux",
+     'codename': "Ootpa",
+     'version': "8.3",
+     'packages': [("kernel", "4.18.0", "240.el8"),
+                  ("redhat-release", "8.3", "1.0.el8"),
+                  ("subscription-manager", "1.28.5", "1.el8"),
+                  ("libvirt", "6.0.0", "28.module+el8.3.0+7827+5e65edd7"),
+                  ("qemu-kvm", "4.2.0",
+                   "34.module+el8.3.0+7976+077be4ec")],
+     'package_count': 1900,
+     'dist': "el8",
+     'python_prefix': "python3",
+     'redhat_fraction': 0.95,
+     'installed': "2019-06-03",
+     'last_update': _day("2020-11-24"),
+     'history': ["2020-11-24", "2020-11-05", "2020-08-12"],
+     'last_boot': "2020-11-24",
+     'manufacturer': "Dell Inc.",
+     'product': "PowerEdge R7525",
+     'bios_vendor': "Dell Inc.",
+     'bios_version': "2.0.3",
+     'memory': 1055827340,
+     'dimms': 32,
+     'nics': 4,
+     'guests': 80,
+     'running_guests': 64,
+     'virt_what': "0\n",
+     'cpu': {'sockets': 2, 'cores': 64, 'threads': 1,
+             'vendor': "AuthenticAMD", 'family': 23, 'model': 49,
+             'stepping': 0, 'microcode': "0x8301038",
+             'name': "AMD EPYC 7742 64-Core Processor",
+             'mhz': 2250.0, 'max_mhz': 3400, 'cache': "512 KB",
+             'cpuid_level': 16,
+             'address_sizes': "43 bits physical, 48 bits virtual",
+             'power': " ts ttp tm hwpstate cpb eff_freq_ro [13] [14]",
+             'flags': AMD_FLAGS,
+             'dmi_family': "Zen", 'dmi_manufacturer': "AMD",
+             'dmi_id': "10 0F 83 00 FF FB 8B 17",
+             'dmi_upgrade': "Socket SP3", 'dmi_threads': 128}},
+    # a Fedora KVM guest, scanned as a user without root
+    {'name': "fedora-guest",
+     'hostname': "build-guest.example.com",
+     'kernel': "5.8.15-301.fc33.x86_64",
+     'kernel_built': "#1 SMP Thu Oct 15 16:58:06 UTC 2020",
+     'etc_release': "Fedora release 33 (Thirty Three)",
+     'packages': [("kernel", "5.8.15", "301.fc33"),
+                  ("fedora-release", "33", "1")],
+     'package_count': 2600,
+     'dist': "fc33",
+     'python_prefix': "python3",
+     'redhat_fraction': 0.0,
+     'installed': "2020-11-02",
+     'last_update': _day("2020-12-11"),
+     'history': ["2020-12-11", "2020-11-20", "2020-11-02"],
+     'virt_what': "kvm\n0\n",
+     'cpu': {'sockets': 4, 'cores': 1, 'threads': 1,
+             'vendor': "GenuineIntel", 'family': 6, 'model': 6,
+             'stepping': 3, 'microcode': "0x1",
+             'name': "QEMU Virtual CPU version 2.5+",
+             'mhz': 2399.996, 'cache': "16384 KB", 'cpuid_level': 13,
+             'address_sizes': "40 bits physical, 48 bits virtual",
+             'power': "", 'flags': QEMU_FLAGS}},
+]
+
+
+def write_all(fixtures_dir=host_fixtures.FIXTURES_DIR):
+    rand = random.Random(SEED)
+    for host in HOSTS:
+        write_host(rand, fixtures_dir, host)
+
+
+if __name__ == "__main__":
+    write_all()
@@ -30,9 +30,14 @@ from rho.log import log, setup_logging
 
 from rho import config
 from rho import crypto
+from rho import metrics
+from rho import profiling
+from rho import recording
 from rho import rho_ips
 from rho import scanner
 from rho import scan_report
+from rho import scan_state
+from rho import ssh_jobs
 
 
 RHO_PASSWORD = "RHO_PASSWORD"
@@ -107,6 +112,75 @@ def _read_hosts_file(filename):
     return result
 
 
+def _open_report(rho_config, report_name, report_file, report_format):
+    """
+    The file to write a report to and the fields to put in it, going by
+    the --report, --output and --report-format options.
+    """
+    fileobj = sys.stdout
+    fields = None
+
+    if report_name:
+        reportobj = rho_config.get_report(report_name)
+
+        # if report doesn't exist exit gracefully. If it is pack-scan, the
+        # default report, the user didn't run initconfig. Instead of
+        # exiting we simply add it to the in-memory config before running
+        # the scan. While it seems like a good idea to write the report to
+        # the config, we modify the config with other temporary runtime
+        # options which would pollute the config if written. For now, we
+        # are opting to simply add the report in-memory.
+        if reportobj is None:
+            if report_name == 'pack-scan':
+                # automatically add pack-scan to the config
+                reportobj = config.Report(
+                   name="pack-scan",
+                   report_format=['date.date',
+                                  'uname.hostname',
+                                  'redhat-release.release',
+                                  'redhat-packages.is_redhat',
+                                  'redhat-packages.num_rh_packages',
+                                  'redhat-packages.num_installed_packages',
+                                  'redhat-packages.last_installed',
+                                  'redhat-packages.last_built',
+                                  'date.anaconda_log', 'date.machine_id',
+                                  'date.filesystem_create',
+                                  'date.yum_history', 'virt-what.type',
+                                  'virt.virt', 'virt.num_guests',
+                                  'virt.num_running_guests', 'cpu.count',
+                                  'cpu.socket_count', 'ip', 'port',
+                                  'auth.name', 'auth.type',
+                                  'auth.username', 'error',
+                                  'dmi.system-manufacturer',
+                                  'etc-release.etc-release',
+                                  'instnum.instnum',
+                                  'redhat-release.version',
+                                  'subman.virt.host_type',
+                                  'systemid.system_id',
+                                  'subman.virt.is_guest',
+                                  'uname.hardware_platform'],
+                   output_filename="pack-scan.csv")
+
+                rho_config.add_report(reportobj)
+            else:
+                print(_("ERROR: Report %s was not found.") %
+                      report_name)
+                sys.exit(1)
+
+        fileobj = open(os.path.expanduser(os.path.expandvars(
+            reportobj.output_filename)), "w")
+        fields = reportobj.report_format
+
+    elif report_file:
+        fileobj = open(os.path.expanduser(os.path.expandvars(
+            report_file)), "w")
+
+    if not fields and report_format:
+        fields = string.split(report_format, ',')
+
+    return fileobj, fields
+
+
 class OutputPrinter(object):
 
     def __init__(self, keys, delimeter="\t", pad=2, dontpad=[]):
@@ -409,6 +483,95 @@ class ScanCommand(CliCommand):
         self.parser.add_option("--allow-agent", dest="allowagent", action="store_true",
                                metavar="ALLOWAGENT", default=False,
                                help=_("Use keys from local ssh-agent"))
+        self.parser.add_option("--bundle-cmds", dest="bundlecmds", action="store_true",
+                               default=False,
+                               help=_("run all commands on a host in a single ssh exec"))
+        self.parser.add_option("--summarize-packages", dest="summarizepackages",
+                               action="store_true", default=False,
+                               help=_("work out the redhat-packages fields on each host, "
+                                      "rather than fetching the whole package list"))
+        self.parser.add_option("--threads", dest="threads", type="int",
+                               metavar="THREADS",
+                               default=ssh_jobs.DEFAULT_MAX_THREADS,
+                               help=_("number of hosts to scan at once (default %default)"))
+        self.parser.add_option("--workers", dest="workers", type="int",
+                               metavar="WORKERS", default=1,
+                               help=_("number of processes to split the scan over, "
+                                      "each with its own --threads (default %default)"))
+        self.parser.add_option("--adaptive", dest="adaptive", action="store_true",
+                               default=False,
+                               help=_("adjust the number of hosts scanned at once, up to "
+                                      "--threads, based on how the network is coping"))
+        self.parser.add_option("--probe-timeout", dest="probetimeout", type="float",
+                               metavar="SECONDS", default=0,
+                               help=_("check every ip/port with a quick TCP connect first, "
+                                      "waiting at most this long for an answer"))
+        self.parser.add_option("--cmd-timeout", dest="cmdtimeout", type="float",
+                               metavar="SECONDS",
+                               default=ssh_jobs.DEFAULT_CMD_TIMEOUT,
+                               help=_("seconds each remote command may run for, "
+                                      "0 for no limit (default %default)"))
+        self.parser.add_option("--host-timeout", dest="hosttimeout", type="float",
+                               metavar="SECONDS", default=0,
+                               help=_("seconds to spend on each host in all, "
+                                      "0 for no limit (default %default)"))
+        self.parser.add_option("--max-output", dest="maxoutput", type="int",
+                               metavar="BYTES",
+                               default=ssh_jobs.DEFAULT_MAX_OUTPUT,
+                               help=_("most output to take from any one remote command, "
+                                      "0 for no limit (default %default)"))
+        self.parser.add_option("--connect-rate", dest="connectrate", type="float",
+                               metavar="RATE", default=0,
+                               help=_("most new connections to open a second, "
+                                      "0 for no limit (default %default)"))
+        self.parser.add_option("--max-per-subnet", dest="maxpersubnet", type="int",
+                               metavar="HOSTS", default=0,
+                               help=_("most hosts of any one subnet to scan at once, "
+                                      "0 for no limit (default %default)"))
+        self.parser.add_option("--subnet-prefix", dest="subnetprefix", type="int",
+                               metavar="BITS", default=24,
+                               help=_("prefix length of the subnets for --max-per-subnet "
+                                      "(default %default)"))
+        self.parser.add_option("--state-file", dest="statefile",
+                               metavar="STATEFILE",
+                               default=scan_state.DEFAULT_STATE_FILE,
+                               help=_("where to remember what worked on each host "
+                                      "between scans (default %default)"))
+        self.parser.add_option("--no-state", dest="nostate", action="store_true",
+                               default=False,
+                               help=_("don't read or update the scan state"))
+        self.parser.add_option("--rescan", dest="rescan", action="store_true",
+                               default=False,
+                               help=_("scan every host in full, even ones that have "
+                                      "been unreachable lately"))
+        self.parser.add_option("--no-auth-learning", dest="noauthlearning",
+                               action="store_true", default=False,
+                               help=_("always try auths in the order given, rather than "
+                                      "the ones working on the same subnet first"))
+        self.parser.add_option("--timing", dest="timing", action="store_true",
+                               default=False,
+                               help=_("print how long each phase of the host "
+                                      "scans took, once the scan is done"))
+        self.parser.add_option("--metrics-file", dest="metricsfile",
+                               metavar="METRICSFILE",
+                               help=_("write scan metrics to METRICSFILE once "
+                                      "the scan is done"))
+        self.parser.add_option("--metrics-format", dest="metricsformat",
+                               metavar="FORMAT", default=metrics.PROMETHEUS_FORMAT,
+                               help=_("format of the --metrics-file, one of %s "
+                                      "(default %%default)") %
+                               ", ".join(metrics.METRICS_FORMATS))
+        self.parser.add_option("--profile-output", dest="profileoutput",
+                               metavar="DIR",
+                               help=_("profile the scan, and write the stats "
+                                      "and a summary of them to DIR"))
+        self.parser.add_option("--record", dest="record", metavar="FILE",
+                               help=_("append the raw output of every command "
+                                      "to FILE, for 'rho replay'"))
+        self.parser.add_option("--progress-interval", dest="progressinterval",
+                               type="float", metavar="SECONDS", default=0,
+                               help=_("print a line of scan totals every SECONDS, "
+                                      "rather than every connection attempt"))
         self.parser.add_option("--show-fields", dest="showfields", action="store_true",
                                metavar="SHOWFIELDS",
                                help=_("show fields available for reports"))
@@ -452,6 +615,57 @@ class ScanCommand(CliCommand):
             if not os.path.exists(self.options.cachefile):
                 self.parser.error(_("No such file: %s" % self.options.cachefile))
 
+        if self.options.threads < 1:
+            self.parser.error(_("--threads must be at least 1"))
+
+        if self.options.workers < 1:
+            self.parser.error(_("--workers must be at least 1"))
+
+        if self.options.probetimeout < 0:
+            self.parser.error(_("--probe-timeout can not be negative"))
+
+        if self.options.cmdtimeout < 0:
+            self.parser.error(_("--cmd-timeout can not be negative"))
+
+        if self.options.hosttimeout < 0:
+            self.parser.error(_("--host-timeout can not be negative"))
+
+        if self.options.maxoutput < 0:
+            self.parser.error(_("--max-output can not be negative"))
+
+        if self.options.connectrate < 0:
+            self.parser.error(_("--connect-rate can not be negative"))
+
+        if self.options.progressinterval < 0:
+            self.parser.error(_("--progress-interval can not be negative"))
+
+        if self.options.metricsformat not in metrics.METRICS_FORMATS:
+            self.parser.error(_("--metrics-format must be one of: %s") %
+                              ", ".join(metrics.METRICS_FORMATS))
+
+        if self.options.profileoutput:
+            try:
+                self.options.profileoutput = \
+                    profiling.prepare(self.options.profileoutput)
+            except OSError as e:
+                self.parser.error(_("Unable to use --profile-output %s: %s") %
+                                  (self.options.profileoutput, e))
+
+        self.recorder = None
+        if self.options.record:
+            path = os.path.expanduser(self.options.record)
+            try:
+                self.recorder = recording.Recorder(path)
+            except OSError as e:
+                self.parser.error(_("Unable to use --record %s: %s") %
+                                  (self.options.record, e))
+
+        if self.options.maxpersubnet < 0:
+            self.parser.error(_("--max-per-subnet can not be negative"))
+
+        if self.options.subnetprefix < 0 or self.options.subnetprefix > 32:
+            self.parser.error(_("--subnet-prefix must be between 0 and 32"))
+
         if hasRanges:
             self._validate_ranges(self.options.ranges)
 
@@ -507,8 +721,34 @@ class ScanCommand(CliCommand):
         if self.options.cachefile:
             cache = self._build_cache(self.options.cachefile)
 
+        state = None
+        if not self.options.nostate:
+            try:
+                state = scan_state.ScanState(self.options.statefile)
+            except scan_state.ScanStateError as e:
+                log.warn("Not using the scan state: %s" % e)
+                print _("Unable to use the scan state: %s") % e
+
         self.scanner = scanner.Scanner(config=self.config, cache=cache,
-                                       allow_agent=self.options.allowagent)
+                                       allow_agent=self.options.allowagent,
+                                       bundle_cmds=self.options.bundlecmds,
+                                       max_threads=self.options.threads,
+                                       probe_timeout=self.options.probetimeout,
+                                       adaptive=self.options.adaptive,
+                                       workers=self.options.workers,
+                                       cmd_timeout=self.options.cmdtimeout,
+                                       host_timeout=self.options.hosttimeout,
+                                       max_output=self.options.maxoutput,
+                                       connect_rate=self.options.connectrate,
+                                       max_per_subnet=self.options.maxpersubnet,
+                                       subnet_prefix=self.options.subnetprefix,
+                                       state=state,
+                                       rescan=self.options.rescan,
+                                       learn_auths=not self.options.noauthlearning,
+                                       progress_interval=self.options.progressinterval,
+                                       profile_dir=self.options.profileoutput,
+                                       recorder=self.recorder,
+                                       summarize_packages=self.options.summarizepackages)
 
         # If username was specified, we need to prompt for a password
         # to go with it:
@@ -578,70 +818,99 @@ class ScanCommand(CliCommand):
                 for name in missing:
                     print name
 
-        fileobj = sys.stdout
-        fields = None
+        if self.recorder:
+            self.recorder.close()
 
-        if self.options.report:
-            reportobj = self.config.get_report(self.options.report)
-
-            # if report doesn't exist exit gracefully. If it is pack-scan, the
-            # default report, the user didn't run initconfig. Instead of
-            # exiting we simply add it to the in-memory config before running
-            # the scan. While it seems like a good idea to write the report to
-            # the config, we modify the config with other temporary runtime
-            # options which would pollute the config if written. For now, we
-            # are opting to simply add the report in-memory.
-            if reportobj is None:
-                if self.options.report == 'pack-scan':
-                    # automatically add pack-scan to the config
-                    reportobj = config.Report(
-                       name="pack-scan",
-                       report_format=['date.date',
-                                      'uname.hostname',
-                                      'redhat-release.release',
-                                      'redhat-packages.is_redhat',
-                                      'redhat-packages.num_rh_packages',
-                                      'redhat-packages.num_installed_packages',
-                                      'redhat-packages.last_installed',
-                                      'redhat-packages.last_built',
-                                      'date.anaconda_log', 'date.machine_id',
-                                      'date.filesystem_create',
-                                      'date.yum_history', 'virt-what.type',
-                                      'virt.virt', 'virt.num_guests',
-                                      'virt.num_running_guests', 'cpu.count',
-                                      'cpu.socket_count', 'ip', 'port',
-                                      'auth.name', 'auth.type',
-                                      'auth.username', 'error',
-                                      'dmi.system-manufacturer',
-                                      'etc-release.etc-release',
-                                      'instnum.instnum',
-                                      'redhat-release.version',
-                                      'subman.virt.host_type',
-                                      'systemid.system_id',
-                                      'subman.virt.is_guest',
-                                      'uname.hardware_platform'],
-                       output_filename="pack-scan.csv")
-
-                    self.config.add_report(reportobj)
-                else:
-                    print(_("ERROR: Report %s was not found.") %
-                          self.options.report)
-                    sys.exit(1)
+        fileobj, fields = _open_report(self.config, self.options.report,
+                                       self.options.reportfile,
+                                       self.options.reportformat)
 
-            fileobj = open(os.path.expanduser(os.path.expandvars(
-                reportobj.output_filename)), "w")
-            fields = reportobj.report_format
+        if self.options.profileoutput:
+            merged = profiling.merge(self.options.profileoutput)
+            if merged:
+                print _("Profile written to %s, summary in %s") % merged
 
-        elif self.options.reportfile:
-            fileobj = open(os.path.expanduser(os.path.expandvars(
-                self.options.reportfile)), "w")
+        if self.options.metricsfile:
+            try:
+                metrics.write(self.scanner.scan_report,
+                              self.options.metricsfile,
+                              self.options.metricsformat,
+                              self.scanner.scan_duration)
+            except (IOError, OSError) as e:
+                log.error("Unable to write %s: %s" %
+                          (self.options.metricsfile, e))
+                print _("Unable to write the metrics file: %s") % e
+
+        if self.options.timing:
+            print _("Time spent on each phase, in seconds:")
+            for line in self.scanner.scan_report.timing.format():
+                print line
+            print
 
-        if not fields and self.options.reportformat:
-            fields = string.split(self.options.reportformat, ',')
         self.scanner.report(fileobj, report_format=fields)
         fileobj.close()
 
 
+class ReplayCommand(CliCommand):
+
+    def __init__(self):
+        usage = _("usage: %prog replay [options] FILE")
+        shortdesc = _("report on a scan recorded with --record")
+        desc = _("parses the output recorded by 'rho scan --record' again, "
+                 "and writes the report the scan would have")
+
+        CliCommand.__init__(self, "replay", usage, shortdesc, desc)
+
+        self.parser.add_option("--output", dest="reportfile",
+                               metavar="REPORTFILE",
+                               help=_("write out to this file"),
+                               default="")
+        self.parser.add_option("--report-format", dest="reportformat",
+                               metavar="REPORTFORMAT",
+                               help=_("specify report format (see 'rho scan --show-fields' for options)"),
+                               default="")
+        self.parser.add_option("--report", dest="report",
+                               metavar="REPORT",
+                               help=_("specify the report to run"),
+                               action="store",
+                               default="")
+
+    def _validate_options(self):
+        CliCommand._validate_options(self)
+
+        if len(self.args) != 1:
+            self.parser.print_help()
+            sys.exit(1)
+        self.recording = os.path.abspath(os.path.expanduser(self.args[0]))
+        if not os.path.exists(self.recording):
+            self.parser.error(_("No such file: %s") % self.args[0])
+
+        if self.options.report:
+            if self.options.reportformat:
+                self.parser.error(_(
+                    "Cannot specify both report-format and report."))
+            if self.options.reportfile:
+                self.parser.error(_(
+                    "Cannot specify both report and output filename."))
+
+    def _do_command(self):
+        report = scan_report.ScanReport()
+        try:
+            for record in recording.read(self.recording):
+                report.add(recording.from_record(record))
+        except (IOError, recording.RecordingError) as e:
+            print _("Unable to replay %s: %s") % (self.recording, e)
+            sys.exit(1)
+        log.info("Replayed %s hosts from %s" % (len(report.ips),
+                                                self.recording))
+
+        fileobj, fields = _open_report(self.config, self.options.report,
+                                       self.options.reportfile,
+                                       self.options.reportformat)
+        report.report(fileobj, report_format=fields)
+        fileobj.close()
+
+
 class DumpConfigCommand(CliCommand):
 
     """
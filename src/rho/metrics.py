@@ -0,0 +1,208 @@
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+""" Scan metrics, written out for monitoring once a scan is done """
+
+import os
+import time
+
+import simplejson as json
+
+from rho import scan_stats
+
+PROMETHEUS_FORMAT = "prometheus"
+JSON_FORMAT = "json"
+METRICS_FORMATS = [PROMETHEUS_FORMAT, JSON_FORMAT]
+
+# the host results we count, in the order we write them
+HOST_RESULTS = ["attempted", "succeeded", "auth_failed", "unreachable",
+                "skipped", "failed"]
+
+
+class ScanMetrics(object):
+    """
+    Counts of how the hosts went, the bytes we got back from them, the
+    commands we didn't have to run, and which rho_cmds failed how. The
+    ScanReport adds every host to its own, and merges them along with the
+    reports from --workers.
+    """
+
+    def __init__(self):
+        self.hosts = dict([(result, 0) for result in HOST_RESULTS])
+        self.bytes_received = 0
+        self.execs_saved = 0
+        # {rho_cmd name: {error: count}}
+        self.cmd_errors = {}
+
+    def add(self, ssh_job):
+        if ssh_job.skipped:
+            self.hosts['skipped'] = self.hosts['skipped'] + 1
+            return
+
+        self.hosts['attempted'] = self.hosts['attempted'] + 1
+        if ssh_job.unreachable:
+            result = 'unreachable'
+        elif ssh_job.auth_failed:
+            result = 'auth_failed'
+        elif ssh_job.error:
+            result = 'failed'
+        else:
+            result = 'succeeded'
+        self.hosts[result] = self.hosts[result] + 1
+        self.bytes_received = self.bytes_received + ssh_job.bytes_received
+        self.execs_saved = self.execs_saved + ssh_job.execs_saved
+
+        for rho_cmd in ssh_job.rho_cmds:
+            errors = self.cmd_errors.setdefault(rho_cmd.name, {})
+            if rho_cmd.error:
+                errors[rho_cmd.error] = errors.get(rho_cmd.error, 0) + 1
+
+    def merge(self, other):
+        for result, count in other.hosts.items():
+            self.hosts[result] = self.hosts[result] + count
+        self.bytes_received = self.bytes_received + other.bytes_received
+        self.execs_saved = self.execs_saved + other.execs_saved
+        for name, other_errors in other.cmd_errors.items():
+            errors = self.cmd_errors.setdefault(name, {})
+            for error, count in other_errors.items():
+                errors[error] = errors.get(error, 0) + count
+
+
+def _bucket_bounds():
+    return [str(bound) for bound in scan_stats.TIMING_BUCKETS]
+
+
+def _cumulative(counts):
+    """ [(upper bound, hosts up to it)], the way Prometheus does buckets """
+    buckets = []
+    cumulative = 0
+    for bound, count in zip(_bucket_bounds(), counts):
+        cumulative = cumulative + count
+        buckets.append((bound, cumulative))
+    buckets.append(("+Inf", sum(counts)))
+    return buckets
+
+
+def _histograms(timing):
+    """ {phase: {'count', 'sum', 'max', 'buckets'}} from a TimingHistogram """
+    histograms = {}
+    for phase, (counts, total, longest) in timing.phases.items():
+        buckets = dict(_cumulative(counts))
+        histograms[phase] = {'count': sum(counts),
+                             'sum': total,
+                             'max': longest,
+                             'buckets': buckets}
+    return histograms
+
+
+def to_json(report, duration):
+    histograms = _histograms(report.timing)
+    commands = {}
+    for name, errors in report.metrics.cmd_errors.items():
+        commands[name] = {'errors': errors,
+                          'latency': histograms.pop("cmd.%s" % name, None)}
+    return json.dumps({'hosts': report.metrics.hosts,
+                       'bytes_received': report.metrics.bytes_received,
+                       'execs_saved': report.metrics.execs_saved,
+                       'scan_duration': duration,
+                       'end_time': time.time(),
+                       'commands': commands,
+                       'phases': histograms},
+                      sort_keys=True, indent=2) + "\n"
+
+
+def _labels(labels):
+    return "{%s}" % ",".join(['%s="%s"' % (name, value.replace('"', '\\"'))
+                              for name, value in labels])
+
+
+def _prometheus_histogram(lines, name, labels, counts, total):
+    for bound, cumulative in _cumulative(counts):
+        lines.append("%s_bucket%s %s" %
+                     (name, _labels(labels + [("le", bound)]), cumulative))
+    lines.append("%s_sum%s %s" % (name, _labels(labels), repr(total)))
+    lines.append("%s_count%s %s" % (name, _labels(labels), sum(counts)))
+
+
+def to_prometheus(report, duration):
+    """
+    The metrics in the node_exporter textfile collector format. Each file
+    is just the last scan, starting again from nothing, so the totals are
+    gauges and not counters Prometheus would take for resets.
+    """
+    metrics = report.metrics
+    lines = ["# HELP rho_last_scan_hosts Hosts in the last scan, by how they went.",
+             "# TYPE rho_last_scan_hosts gauge"]
+    for result in HOST_RESULTS:
+        lines.append("rho_last_scan_hosts%s %s" %
+                     (_labels([("result", result)]), metrics.hosts[result]))
+
+    lines.extend(["# HELP rho_last_scan_bytes_received Command output received in the last scan.",
+                  "# TYPE rho_last_scan_bytes_received gauge",
+                  "rho_last_scan_bytes_received %s" % metrics.bytes_received])
+    lines.extend(["# HELP rho_last_scan_execs_saved Commands not run in the last scan because their output was shared.",
+                  "# TYPE rho_last_scan_execs_saved gauge",
+                  "rho_last_scan_execs_saved %s" % metrics.execs_saved])
+    if duration is not None:
+        lines.extend(["# HELP rho_scan_duration_seconds How long the last scan took.",
+                      "# TYPE rho_scan_duration_seconds gauge",
+                      "rho_scan_duration_seconds %s" % repr(duration)])
+    lines.extend(["# HELP rho_scan_end_time_seconds When the last scan finished.",
+                  "# TYPE rho_scan_end_time_seconds gauge",
+                  "rho_scan_end_time_seconds %s" % repr(time.time())])
+
+    lines.extend(["# HELP rho_last_scan_cmd_errors Commands without usable output in the last scan, by why.",
+                  "# TYPE rho_last_scan_cmd_errors gauge"])
+    for name in sorted(metrics.cmd_errors.keys()):
+        errors = metrics.cmd_errors[name]
+        for error in sorted(errors.keys()):
+            lines.append("rho_last_scan_cmd_errors%s %s" %
+                         (_labels([("cmd", name), ("error", error)]),
+                          errors[error]))
+
+    lines.extend(["# HELP rho_cmd_duration_seconds Time running each command on a host.",
+                  "# TYPE rho_cmd_duration_seconds histogram"])
+    phases = report.timing.phases
+    for phase in sorted(phases.keys()):
+        if phase.startswith("cmd."):
+            counts, total, longest = phases[phase]
+            _prometheus_histogram(lines, "rho_cmd_duration_seconds",
+                                  [("cmd", phase[4:])], counts, total)
+
+    lines.extend(["# HELP rho_phase_duration_seconds Time spent on each phase of a host scan.",
+                  "# TYPE rho_phase_duration_seconds histogram"])
+    for phase in sorted(phases.keys()):
+        if not phase.startswith("cmd."):
+            counts, total, longest = phases[phase]
+            _prometheus_histogram(lines, "rho_phase_duration_seconds",
+                                  [("phase", phase)], counts, total)
+    return "\n".join(lines) + "\n"
+
+
+def write(report, path, metrics_format=PROMETHEUS_FORMAT, duration=None):
+    """
+    Write the metrics for report to path. It's written next to it and
+    renamed into place, so whatever is collecting it never sees half a
+    file.
+    """
+    if metrics_format == JSON_FORMAT:
+        buf = to_json(report, duration)
+    else:
+        buf = to_prometheus(report, duration)
+
+    path = os.path.expanduser(os.path.expandvars(path))
+    tmp_path = "%s.%s.tmp" % (path, os.getpid())
+    fileobj = open(tmp_path, "w")
+    try:
+        fileobj.write(buf)
+    finally:
+        fileobj.close()
+    os.rename(tmp_path, path)
@@ -0,0 +1,118 @@
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+""" Quick TCP reachability checks, done before we bother with ssh """
+
+import errno
+import select
+import socket
+import time
+
+from rho.log import log
+
+# how many connect()s we have outstanding at once. Keep this well under
+# the usual 1024 open file limit.
+DEFAULT_MAX_SOCKETS = 512
+
+
+def _start_connect(endpoint):
+    """
+    Kick off a non-blocking connect to (host, port). Returns a tuple of
+    (socket, connected), or None if we already know it failed.
+    """
+    host, port = endpoint
+    try:
+        ip = socket.gethostbyname(host)
+    except socket.error as e:
+        log.debug("probe: can't resolve %s: %s" % (host, e))
+        return None
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(0)
+    err = sock.connect_ex((ip, port))
+    if err == 0:
+        return sock, True
+    if err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+        return sock, False
+    log.debug("probe: %s:%s %s" % (host, port, errno.errorcode.get(err, err)))
+    sock.close()
+    return None
+
+
+def _wait_writable(socks, timeout):
+    """ Return the subset of socks that are writable within timeout. """
+    if getattr(select, "poll", None) is None:
+        r, w, x = select.select([], socks, [], timeout)
+        return w
+
+    poller = select.poll()
+    by_fd = {}
+    for sock in socks:
+        by_fd[sock.fileno()] = sock
+        poller.register(sock, select.POLLOUT)
+    ready = []
+    for fd, event in poller.poll(timeout * 1000):
+        ready.append(by_fd[fd])
+    return ready
+
+
+def probe(endpoints, timeout, max_sockets=DEFAULT_MAX_SOCKETS, throttle=None):
+    """
+    Try a TCP connect to every (host, port) in endpoints, many at once,
+    giving each one timeout seconds to answer. If given, throttle gets
+    called before each connect, and can block to slow us down.
+
+    Returns the set of endpoints that accepted the connection.
+    """
+    open_endpoints = set()
+    pending = iter(endpoints)
+    # socket -> (endpoint, deadline)
+    in_flight = {}
+
+    while True:
+        while len(in_flight) < max_sockets:
+            try:
+                endpoint = pending.next()
+            except StopIteration:
+                break
+            if throttle is not None:
+                throttle()
+            started = _start_connect(endpoint)
+            if started is None:
+                continue
+            sock, connected = started
+            if connected:
+                open_endpoints.add(endpoint)
+                sock.close()
+                continue
+            in_flight[sock] = (endpoint, time.time() + timeout)
+
+        if not in_flight:
+            break
+
+        first_deadline = min([when for sock_endpoint, when
+                              in in_flight.values()])
+        wait = max(0, first_deadline - time.time())
+        for sock in _wait_writable(in_flight.keys(), wait):
+            endpoint, deadline = in_flight.pop(sock)
+            # writable just means the connect finished, one way or the other
+            if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                open_endpoints.add(endpoint)
+            sock.close()
+
+        now = time.time()
+        for sock, (endpoint, deadline) in in_flight.items():
+            if deadline <= now:
+                log.debug("probe: %s:%s timed out" % endpoint)
+                del in_flight[sock]
+                sock.close()
+
+    return open_endpoints
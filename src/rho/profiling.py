@@ -0,0 +1,125 @@
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+""" cProfile for a whole scan, over all its threads and processes """
+
+import cProfile
+import glob
+import os
+import os.path
+import pstats
+import threading
+
+# what merge() writes
+STATS_FILE = "rho.pstats"
+SUMMARY_FILE = "summary.txt"
+# how many functions each part of the summary lists
+TOP_N = 30
+# the parsing all happens in here
+PARSE_FILTER = "rho_cmds"
+
+
+def _process_files(directory):
+    return glob.glob(os.path.join(directory, "rho-*.pstats"))
+
+
+def prepare(directory):
+    """ Make sure directory exists, without anything from a past scan. """
+    directory = os.path.expanduser(directory)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for path in _process_files(directory):
+        os.unlink(path)
+    return directory
+
+
+class Profiler(object):
+    """
+    cProfile only sees the thread it's started in, so every thread we
+    want profiled gets a cProfile.Profile of its own, through wrap(). As
+    each one finishes, its stats get added up here. dump() writes the
+    total for this process to directory, for merge() to pick up.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.stats = None
+        self.lock = threading.Lock()
+
+    def add(self, profiler):
+        profiler.create_stats()
+        self.lock.acquire()
+        try:
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+        finally:
+            self.lock.release()
+
+    def runcall(self, func, *args, **kwargs):
+        """ func(*args, **kwargs), profiled, in this thread. """
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            self.add(profiler)
+
+    def wrap(self, thread):
+        """ Profile thread's run(). Call this before it's started. """
+        run = thread.run
+
+        def profiled_run():
+            self.runcall(run)
+        thread.run = profiled_run
+        return thread
+
+    def dump(self):
+        self.lock.acquire()
+        try:
+            if self.stats is None:
+                return
+            self.stats.dump_stats(os.path.join(self.directory,
+                                               "rho-%s.pstats" % os.getpid()))
+        finally:
+            self.lock.release()
+
+
+def merge(directory, top=TOP_N):
+    """
+    Merge the stats every process dumped in directory into STATS_FILE,
+    and write the top functions to SUMMARY_FILE. Returns the paths of
+    the two, or None if there was nothing to merge.
+    """
+    paths = _process_files(directory)
+    if not paths:
+        return None
+
+    stats_path = os.path.join(directory, STATS_FILE)
+    summary_path = os.path.join(directory, SUMMARY_FILE)
+    summary = open(summary_path, "w")
+    try:
+        stats = pstats.Stats(*paths, **{'stream': summary})
+        stats.dump_stats(stats_path)
+        stats.strip_dirs()
+
+        summary.write("Top %s functions by cumulative time\n" % top)
+        stats.sort_stats("cumulative").print_stats(top)
+        summary.write("Top %s functions by own time\n" % top)
+        stats.sort_stats("time").print_stats(top)
+        summary.write("Top %s functions parsing command output\n" % top)
+        stats.sort_stats("cumulative").print_stats(PARSE_FILTER, top)
+    finally:
+        summary.close()
+
+    for path in paths:
+        os.unlink(path)
+    return stats_path, summary_path
@@ -0,0 +1,185 @@
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+"""
+The raw command output of a scan, recorded so it can be parsed again
+later without scanning again.
+
+A recording is a run of records, one per host, each a 4 byte length and
+then that many bytes of zlib compressed JSON. Records are only ever
+appended, each with a single write, so the --workers can all write to
+the one file and a scan that dies part way leaves nothing worse than a
+short last record, which read() stops at.
+"""
+
+import os
+import struct
+import threading
+import zlib
+
+import simplejson as json
+
+from rho.log import log
+from rho import rho_cmds
+from rho import ssh_jobs
+
+VERSION = 1
+LENGTH = struct.Struct("!L")
+
+
+class RecordingError(Exception):
+    pass
+
+
+def _encode(output):
+    # JSON only does unicode, and the output is whatever bytes the host
+    # sent, so latin-1 gets us there and back without losing any
+    if output is None:
+        return None
+    return output.decode("latin-1")
+
+
+def _decode(output):
+    if output is None:
+        return None
+    return output.encode("latin-1")
+
+
+def to_record(ssh_job):
+    """ What we keep of ssh_job, as a dict. """
+    auth = None
+    if ssh_job.auth is not None:
+        # not the password
+        auth = {'name': ssh_job.auth.name,
+                'type': ssh_job.auth.type,
+                'username': ssh_job.auth.username}
+    cmds = []
+    for rho_cmd in ssh_job.rho_cmds:
+        cmds.append({'name': rho_cmd.name,
+                     'error': rho_cmd.error,
+                     'results': [(_encode(out), _encode(err))
+                                 for out, err in rho_cmd.cmd_results]})
+    return {'version': VERSION,
+            'ip': ssh_job.ip,
+            'port': ssh_job.port,
+            'auth': auth,
+            'error': ssh_job.error,
+            'unreachable': ssh_job.unreachable,
+            'skipped': ssh_job.skipped,
+            'auth_failed': ssh_job.auth_failed,
+            'handshakes': ssh_job.handshakes,
+            'auth_attempts': ssh_job.auth_attempts,
+            'duration': ssh_job.duration,
+            'timing': ssh_job.timing,
+            'auth_timing': ssh_job.auth_timing,
+            'bytes_received': ssh_job.bytes_received,
+            'execs_saved': ssh_job.execs_saved,
+            'cmds': cmds}
+
+
+class RecordedAuth(object):
+    """ Stands in for the config.Auth a host was scanned with. """
+
+    def __init__(self, name, type, username):
+        self.name = name
+        self.type = type
+        self.username = username
+        self.password = ""
+
+
+def from_record(record, rho_cmd_classes=None):
+    """
+    An SshJob like the one record was made from, its rho_cmds parsed
+    from the recorded output all over again. Commands that aren't in
+    rho_cmd_classes (ALL_CMDS by default) are left out.
+    """
+    if rho_cmd_classes is None:
+        rho_cmd_classes = rho_cmds.ALL_CMDS
+    classes = dict([(rho_cmd_class.name, rho_cmd_class)
+                    for rho_cmd_class in rho_cmd_classes])
+
+    ssh_job = ssh_jobs.SshJob(ip=record['ip'], ports=[record['port']],
+                              rho_cmds=[], auths=[])
+    ssh_job.port = record['port']
+    if record['auth'] is not None:
+        ssh_job.auth = RecordedAuth(**dict([(str(key), value) for key, value
+                                            in record['auth'].items()]))
+    for key in ('error', 'unreachable', 'skipped', 'auth_failed',
+                'handshakes', 'auth_attempts', 'duration', 'timing',
+                'bytes_received'):
+        setattr(ssh_job, key, record[key])
+    # not in the recordings from before commands shared their output
+    ssh_job.execs_saved = record.get('execs_saved', 0)
+    ssh_job.auth_timing = [tuple(auth_time)
+                           for auth_time in record['auth_timing']]
+
+    for cmd in record['cmds']:
+        if cmd['name'] not in classes:
+            log.debug("Not replaying %s, no such rho_cmd" % cmd['name'])
+            continue
+        rho_cmd = classes[cmd['name']]()
+        if cmd['error']:
+            rho_cmd._populate_all(cmd['error'])
+        elif cmd['results']:
+            # no results is a host we never got as far as running it on
+            rho_cmd.populate_data([(_decode(out), _decode(err))
+                                   for out, err in cmd['results']])
+        ssh_job.rho_cmds.append(rho_cmd)
+    return ssh_job
+
+
+class Recorder(object):
+    """ Appends a record of each SshJob it's given to path. """
+
+    def __init__(self, path):
+        self.path = path
+        # the command output can have anything in it
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0600)
+        self.lock = threading.Lock()
+
+    def write(self, ssh_job):
+        data = zlib.compress(json.dumps(to_record(ssh_job)))
+        buf = LENGTH.pack(len(data)) + data
+        self.lock.acquire()
+        try:
+            os.write(self.fd, buf)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        os.close(self.fd)
+
+
+def read(path):
+    """ Generator of the records in the recording at path, as dicts. """
+    fileobj = open(path, "rb")
+    try:
+        while True:
+            header = fileobj.read(LENGTH.size)
+            if not header:
+                return
+            data = ""
+            if len(header) == LENGTH.size:
+                (length,) = LENGTH.unpack(header)
+                data = fileobj.read(length)
+            if len(header) < LENGTH.size or len(data) < length:
+                log.warn("%s ends part way through a record" % path)
+                return
+            try:
+                record = json.loads(zlib.decompress(data))
+            except (zlib.error, ValueError) as e:
+                raise RecordingError("%s has a bad record: %s" % (path, e))
+            if record.get('version') != VERSION:
+                raise RecordingError("%s has a version %s record" %
+                                     (path, record.get('version')))
+            yield record
+    finally:
+        fileobj.close()
@@ -22,6 +22,69 @@ import gettext
 t = gettext.translation('rho', 'locale', fallback=True)
 _ = t.ugettext
 
+# what goes in every field of a RhoCmd whose commands didn't finish in time
+TIMEOUT_VALUE = "timeout"
+# and of one whose commands sent more output than we'd keep
+TOO_LARGE_VALUE = "output too large"
+
+# commands whose output several rho_cmds cut what they need from, see
+# RhoCmd.sources
+DATA_SOURCES = {'cpuinfo': "cat /proc/cpuinfo",
+                'dmidecode-full': "dmidecode"}
+
+
+def _grep_after(lines, text, after):
+    """ What grep -A<after> "text" prints of lines, "--" and all. """
+    found = []
+    last = None
+    until = -1
+    for index, line in enumerate(lines):
+        if text in line:
+            until = index + after
+        if index > until:
+            continue
+        if last is not None and index != last + 1:
+            found.append("--")
+        found.append(line)
+        last = index
+    return found
+
+
+def _lines(lines):
+    return "".join(["%s\n" % line for line in lines])
+
+
+DMI_END = re.compile("DMI type [0-3 5-9]")
+MANUFACTURER = re.compile(r"^.*Manufacturer:\s")
+
+
+def dmi_processors(dmidecode):
+    """
+    dmidecode output cut down to the processors, as
+    grep -A1000 'DMI type 4' | sed -n '1,/DMI type [0-3 5-9]/ p' would.
+    """
+    lines = _grep_after(dmidecode.splitlines(), "DMI type 4", 1000)
+    for index in range(1, len(lines)):
+        if DMI_END.search(lines[index]):
+            return _lines(lines[:index + 1])
+    return _lines(lines)
+
+
+def dmi_system_manufacturer(dmidecode):
+    """
+    The system manufacturer from dmidecode output, as grep -A4 'System
+    Information' | grep 'Manufacturer' | sed -n -e 's/^.*Manufacturer:\s//p'
+    would.
+    """
+    found = []
+    for line in _grep_after(dmidecode.splitlines(), "System Information", 4):
+        if "Manufacturer" not in line:
+            continue
+        match = MANUFACTURER.match(line)
+        if match:
+            found.append(line[match.end():])
+    return _lines(found)
+
 
 # basic idea, wrapper classes around the cli cmds we run on the machines
 # to be inventories. the rho_cmd class will have a string for the
@@ -41,6 +104,18 @@ _ = t.ugettext
 class RhoCmd(object):
     name = "base"
     fields = {}
+    # seconds each of the cmd_strings gets to run, None for the scan's
+    # default
+    timeout = None
+    # subclasses that set this get their stdout a line at a time through
+    # parse_line(), as it comes in, and None for it in cmd_results
+    line_parser = False
+    # why there's no real data, if the commands timed out or such
+    error = None
+    # {index in cmd_strings: (DATA_SOURCES name, function)} for the
+    # commands whose stdout is the function of a data source's. The
+    # source runs once on each host, for every rho_cmd that needs it.
+    sources = {}
 
     def __init__(self):
         #        self.cmd_strings = cmd
@@ -55,12 +130,38 @@ class RhoCmd(object):
     def populate_data(self, results):
         # results is a tuple of (stdout, stderr)
         self.cmd_results = results
+        if self.line_parser:
+            # the output came in all at once after all
+            for index, (stdout, stderr) in enumerate(results):
+                if stdout is None:
+                    continue
+                for line in stdout.splitlines():
+                    self.parse_line(index, line)
         # where do we error check? In the parse_data() step I guess... -akl
         #
         # FIXME: how do we handle errors in rho_cmds? we could add a "errors" list
         # to the ssh_job and include the info about each job that failed? --akl
         self.parse_data()
 
+    def populate_timeout(self):
+        # the commands didn't finish, say so in every field rather than
+        # try to parse whatever we got
+        self._populate_all(TIMEOUT_VALUE)
+
+    def populate_too_large(self):
+        self._populate_all(TOO_LARGE_VALUE)
+
+    def _populate_all(self, value):
+        self.error = value
+        self.cmd_results = []
+        for field in self.fields:
+            self.data[field] = value
+
+    # line_parser subclasses implement this, it gets each line of stdout
+    # from cmd_strings[index]
+    def parse_line(self, index, line):
+        raise NotImplementedError
+
     # subclasses need to implement this, this is what parses the output
     # and packs in the self.data.
     def parse_data(self):
@@ -140,14 +241,77 @@ class SubmanFactsRhoCmd(RhoCmd):
             self.data['subman.has_facts_file'] = "Y" if len(fact_files_list) > 0 else "N"
 
 
+# every installed package, a line each, in PKG_COLUMNS columns
+PKG_QUERY = 'rpm -qa --qf "%{NAME}|%{VERSION}|%{RELEASE}|%{INSTALLTIME}|%{VENDOR}|%{BUILDTIME}|%{BUILDHOST}|%{SOURCERPM}|%{LICENSE}|%{PACKAGER}|%{INSTALLTIME:date}|%{BUILDTIME:date}\n"'
+PKG_COLUMNS = 12
+
+# what RedhatPackagesRhoCmd works out from PKG_QUERY, worked out by awk
+# on the host instead: one line of packages|Red Hat packages|lines too
+# short to be a package|last installed|last built. The Red Hat test is
+# is_red_hat_build_host()'s, and the first of any tie wins.
+PKG_SUMMARY = ("awk -F'|' '"
+               "NF < 12 { bad++; next } "
+               "{ total++ } "
+               "index($7, \"redhat.com\") && !index($7, \"fedora\") && !index($7, \"rhndev\") { "
+               "rh++; "
+               "if (rh == 1 || $4 + 0 > installed) { installed = $4 + 0; last_installed = $1 \"-\" $2 \"-\" $3 \" Installed: \" $11 } "
+               "if (rh == 1 || $6 + 0 > built) { built = $6 + 0; last_built = $1 \"-\" $2 \"-\" $3 \" Built: \" $12 } "
+               "} "
+               "END { printf \"%d|%d|%d|%s|%s\\n\", total, rh, bad, last_installed, last_built }'")
+
+
+def is_red_hat_build_host(build_host):
+    return ('redhat.com' in build_host and
+            'fedora' not in build_host and
+            'rhndev' not in build_host)
+
+
 class RedhatPackagesRhoCmd(RhoCmd):
     name = "redhat-packages"
-    cmd_strings = ['rpm -qa --qf "%{NAME}|%{VERSION}|%{RELEASE}|%{INSTALLTIME}|%{VENDOR}|%{BUILDTIME}|%{BUILDHOST}|%{SOURCERPM}|%{LICENSE}|%{PACKAGER}|%{INSTALLTIME:date}|%{BUILDTIME:date}\n"']
+    cmd_strings = [PKG_QUERY]
     fields = {'redhat-packages.is_redhat': _('Whether or not the system has any Red Hat packages installed (Y/N)'),
               'redhat-packages.num_rh_packages': _('The number of Red Hat packages installed.'),
               'redhat-packages.num_installed_packages': _("The total number of installed packages."),
               'redhat-packages.last_installed': _('Details of the last installed Red Hat package.'),
               'redhat-packages.last_built': _('Details of the last built Red Hat package.')}
+    # this one can be several MB, don't hold on to all of it
+    line_parser = True
+
+    def __init__(self):
+        RhoCmd.__init__(self)
+        # all we keep of the packages is how many there were, and the
+        # columns of the two we report on, with the time they won on
+        self.num_packages = 0
+        self.num_rh_packages = 0
+        # lines too short to be a package, which we skip
+        self.bad_lines = 0
+        self.last_installed = None
+        self.last_built = None
+
+    def parse_line(self, index, line):
+        cols = line.split("|", PKG_COLUMNS)
+        if len(cols) < PKG_COLUMNS:
+            self.bad_lines = self.bad_lines + 1
+            return
+        self.num_packages = self.num_packages + 1
+        if not is_red_hat_build_host(cols[6]):
+            return
+        self.num_rh_packages = self.num_rh_packages + 1
+
+        # like awk, anything that isn't a number counts as 0
+        try:
+            install_time = long(cols[3])
+        except ValueError:
+            install_time = 0
+        try:
+            build_time = long(cols[5])
+        except ValueError:
+            build_time = 0
+        # the first of any tie wins, as it would with max()
+        if self.last_installed is None or install_time > self.last_installed[0]:
+            self.last_installed = (install_time, cols)
+        if self.last_built is None or build_time > self.last_built[0]:
+            self.last_built = (build_time, cols)
 
     def parse_data(self):
         if self.cmd_results[0][1]:
@@ -157,28 +321,59 @@ class RedhatPackagesRhoCmd(RhoCmd):
             self.data['redhat-packages.last_installed'] = "error"
             self.data['redhat-packages.last_built'] = "error"
             return
-        installed_packages = [PkgInfo(line, "|") for line in self.cmd_results[0][0].splitlines()]
-        rh_packages = filter(PkgInfo.is_red_hat_pkg, installed_packages)
-        if len(rh_packages) > 0:
-            last_installed = max(rh_packages, key=lambda x: x.install_time)
-            last_built = max(rh_packages, key=lambda x: x.build_time)
-            is_red_hat = "Y" if len(rh_packages) > 0 else "N"
-
-            self.data['redhat-packages.is_redhat'] = is_red_hat
-            self.data['redhat-packages.num_rh_packages'] = len(rh_packages)
-            self.data['redhat-packages.num_installed_packages'] = len(installed_packages)
-            self.data['redhat-packages.last_installed'] = last_installed.details_install()
-            self.data['redhat-packages.last_built'] = last_built.details_built()
-        else:
-            last_installed = ""
-            last_built = ""
-            is_red_hat = ""
 
-            self.data['redhat-packages.is_redhat'] = is_red_hat
-            self.data['redhat-packages.num_rh_packages'] = len(rh_packages)
-            self.data['redhat-packages.num_installed_packages'] = len(installed_packages)
-            self.data['redhat-packages.last_installed'] = last_installed
-            self.data['redhat-packages.last_built'] = last_built
+        is_red_hat = ""
+        last_installed = ""
+        last_built = ""
+        if self.num_rh_packages:
+            is_red_hat = "Y"
+            cols = self.last_installed[1]
+            last_installed = "%s-%s-%s Installed: %s" % (cols[0], cols[1],
+                                                         cols[2], cols[10])
+            cols = self.last_built[1]
+            last_built = "%s-%s-%s Built: %s" % (cols[0], cols[1], cols[2],
+                                                 cols[11])
+
+        self.data['redhat-packages.is_redhat'] = is_red_hat
+        self.data['redhat-packages.num_rh_packages'] = self.num_rh_packages
+        self.data['redhat-packages.num_installed_packages'] = self.num_packages
+        self.data['redhat-packages.last_installed'] = last_installed
+        self.data['redhat-packages.last_built'] = last_built
+
+
+class RedhatPackagesSummaryRhoCmd(RhoCmd):
+    """
+    The redhat-packages fields, without the whole package list coming
+    back over ssh: PKG_SUMMARY boils it down on the host.
+    """
+    name = "redhat-packages-summary"
+    cmd_strings = ["%s | %s" % (PKG_QUERY, PKG_SUMMARY)]
+    fields = RedhatPackagesRhoCmd.fields
+
+    def parse_data(self):
+        stdout, stderr = self.cmd_results[0]
+        if stderr:
+            for field in self.fields:
+                self.data[field] = "error"
+            return
+        cols = stdout.strip().split("|")
+        try:
+            if len(cols) != 5:
+                raise ValueError(stdout)
+            # lines too short to be a package are skipped, as they are
+            # by RedhatPackagesRhoCmd
+            total, rh_count = int(cols[0]), int(cols[1])
+        except ValueError:
+            # not what PKG_SUMMARY prints, so there's nothing we can use,
+            # but that's no reason to stop scanning the host
+            self._populate_all("error")
+            return
+
+        self.data['redhat-packages.is_redhat'] = "Y" if rh_count else ""
+        self.data['redhat-packages.num_rh_packages'] = rh_count
+        self.data['redhat-packages.num_installed_packages'] = total
+        self.data['redhat-packages.last_installed'] = cols[3]
+        self.data['redhat-packages.last_built'] = cols[4]
 
 
 class RedhatReleaseRhoCmd(RhoCmd):
@@ -250,6 +445,8 @@ class CpuRhoCmd(RhoCmd):
               'cpu.cpu_family': _("cpu family"),
               'cpu.model_name': _("name of cpu model"),
               'cpu.model_ver': _("cpu model version")}
+    sources = {0: ('cpuinfo', None),
+               1: ('dmidecode-full', dmi_processors)}
 
     def __init__(self):
         self.cmd_strings = ["cat /proc/cpuinfo", "dmidecode | grep -A1000 'DMI type 4' | sed -n '1,/DMI type [0-3 5-9]/ p'"]
@@ -374,6 +571,7 @@ class DmiRhoCmd(RhoCmd):
               'dmi.bios-version': _('BIOS version info from DMI'),
               'dmi.system-manufacturer': _('System manufacturer from DMI'),
               'dmi.processor-family': _('Processor family from DMI')}
+    sources = {2: ('dmidecode-full', dmi_system_manufacturer)}
 
     def __init__(self):
         self.cmd_strings = ["dmidecode -s bios-vendor",
@@ -422,6 +620,9 @@ class VirtRhoCmd(CpuRhoCmd):
               'virt.type': _("What type of virtualization a system is running"),
               'virt.num_guests': _("The number of virtualized guests"),
               'virt.num_running_guests': _("The number of running virtualized guests")}
+    sources = {0: ('cpuinfo', None),
+               1: ('dmidecode-full', dmi_processors),
+               2: ('dmidecode-full', dmi_system_manufacturer)}
 
     def __init__(self):
         CpuRhoCmd.__init__(self)
@@ -569,43 +770,10 @@ DEFAULT_CMDS = [UnameRhoCmd,
                 SubmanFactsRhoCmd
                 ]
 
+# and the ones that can stand in for them
+ALL_CMDS = DEFAULT_CMDS + [RedhatPackagesSummaryRhoCmd]
 
-class PkgInfo(object):
-    def __init__(self, row, separator):
-        cols = row.split(separator)
-        if len(cols) < 10:
-            raise PkgInfoParseException()
-        else:
-            self.name = cols[0]
-            self.version = cols[1]
-            self.release = cols[2]
-            self.install_time = long(cols[3])
-            self.vendor = cols[4]
-            self.build_time = long(cols[5])
-            self.build_host = cols[6]
-            self.source_rpm = cols[7]
-            self.license = cols[8]
-            self.packager = cols[9]
-            self.install_date = cols[10]
-            self.build_date = cols[11]
-            self.is_red_hat = False
-            if ('redhat.com' in self.build_host and
-                    'fedora' not in self.build_host and
-                    'rhndev' not in self.build_host):
-                self.is_red_hat = True
-
-    def is_red_hat_pkg(self):
-        return self.is_red_hat
-
-    def details_built(self):
-        return "%s Built: %s" % (self.details(), self.build_date)
-
-    def details_install(self):
-        return "%s Installed: %s" % (self.details(), self.install_date)
-
-    def details(self):
-        return "%s-%s-%s" % (self.name, self.version, self.release)
-
-
-class PkgInfoParseException(BaseException):
+
+# an Exception, so the scan of the host fails rather than the thread
+class PkgInfoParseException(Exception):
     pass
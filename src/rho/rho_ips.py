@@ -11,6 +11,7 @@
 import re
 import socket
 import string
+import struct
 
 import netaddr
 
@@ -22,6 +23,21 @@ _ = t.ugettext
 ip_regex = re.compile(r'\d+\.\d+\.\d+\.\d+')
 
 
+def subnet_key(ip, prefix=24):
+    """
+    The network ip is on, as a string like "10.1.2.0/24", for grouping
+    hosts by subnet. Hostnames we leave alone, as we don't want to look
+    them up just for this.
+    """
+    try:
+        packed = socket.inet_aton(ip)
+    except socket.error:
+        return ip
+    addr = struct.unpack("!L", packed)[0]
+    mask = (0xffffffffL << (32 - prefix)) & 0xffffffffL
+    return "%s/%s" % (socket.inet_ntoa(struct.pack("!L", addr & mask)), prefix)
+
+
 # aka, python-netaddr 0.5.2, aka, rhel5
 class _ReallyOldNetAddr(object):
 
@@ -9,6 +9,11 @@
 import csv
 import sys
 
+from rho.log import log
+from rho import metrics
+from rho import scan_state
+from rho import scan_stats
+
 import gettext
 t = gettext.translation('rho', 'locale', fallback=True)
 _ = t.ugettext
@@ -20,7 +25,15 @@ report_fields = {'ip': _('ip address'),
                  'auth.type': _('type of ssh authentication used'),
                  'auth.username': _('username ssh'),
                  'auth.name': _('name of authentication class'),
-                 'error': _('any errors that are found')}
+                 'error': _('any errors that are found'),
+                 'ssh.handshakes': _('number of ssh handshakes made'),
+                 'ssh.handshakes_saved': _('ssh handshakes saved by trying all auths over one connection'),
+                 'ssh.execs_saved': _('commands not run because their output was shared with other commands'),
+                 'timing.connect': _('seconds spent on tcp connects'),
+                 'timing.kex': _('seconds spent on ssh banners and key exchanges'),
+                 'timing.auth': _('seconds spent trying auths'),
+                 'timing.parse': _('seconds spent parsing command output'),
+                 'timing.total': _('seconds spent on the host in all')}
 
 
 class ScanReport(object):
@@ -37,11 +50,18 @@ class ScanReport(object):
                   "virt.virt", "virt.type",
                   "auth.type", "auth.username", "auth.name", "error"]
 
-    def __init__(self):
+    def __init__(self, state=None):
         self.ips = {}
         # ips is a dict of
         # {'ip:ip', 'uanme.os':unameresults... etc}
 
+        # a scan_state.ScanState to record each host in, if any
+        self.state = state
+        # how long each phase took, over all the hosts
+        self.timing = scan_stats.TimingHistogram()
+        # how the hosts went, for --metrics-file
+        self.metrics = metrics.ScanMetrics()
+
     def add(self, ssh_job):
         data = {}
         for rho_cmd in ssh_job.rho_cmds:
@@ -63,7 +83,40 @@ class ScanReport(object):
                                     'auth.name': ssh_job.auth.name,
                                     'auth.username': ssh_job.auth.username,
                                     'auth.password': ssh_job.auth.password}
+        # every auth we tried used to cost a handshake of its own
+        self.ips[ssh_job.ip]['ssh.handshakes'] = ssh_job.handshakes
+        self.ips[ssh_job.ip]['ssh.handshakes_saved'] = \
+            max(0, ssh_job.auth_attempts - ssh_job.handshakes)
+        self.ips[ssh_job.ip]['ssh.execs_saved'] = ssh_job.execs_saved
         self.ips[ssh_job.ip].update(data)
+        self.add_timing(ssh_job)
+        self.metrics.add(ssh_job)
+
+        if self.state is not None:
+            try:
+                self.state.update(ssh_job)
+            except scan_state.ScanStateError as e:
+                # the host is still in the report, we just won't remember
+                # it next time
+                log.error(e)
+
+    def add_timing(self, ssh_job):
+        timing = dict(ssh_job.timing)
+        if ssh_job.duration is not None:
+            timing['total'] = ssh_job.duration
+        for phase, seconds in timing.items():
+            self.ips[ssh_job.ip]["timing.%s" % phase] = round(seconds, 3)
+            # auths go in the histogram one attempt at a time
+            if phase != "auth":
+                self.timing.add(phase, seconds)
+        for auth_name, seconds in ssh_job.auth_timing:
+            self.timing.add("auth", seconds)
+
+    def merge(self, other):
+        """ Add in the hosts from another ScanReport. """
+        self.ips.update(other.ips)
+        self.timing.merge(other.timing)
+        self.metrics.merge(other.metrics)
 
     # generate a dict to feed to writerow to print a csv header
     def gen_header(self, fields):
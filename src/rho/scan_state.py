@@ -0,0 +1,209 @@
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+""" What we know about each host from past scans, kept between runs """
+
+import os
+import os.path
+import threading
+import time
+
+try:
+    import sqlite3
+except ImportError:
+    # python built without sqlite
+    sqlite3 = None
+
+from rho.log import log
+
+DEFAULT_STATE_FILE = "~/.rho/scan_state.db"
+
+# (name, type) of every column of the hosts table. Columns added here get
+# added to existing stores the next time they're opened.
+COLUMNS = [("ip", "TEXT PRIMARY KEY"),
+           ("port", "INTEGER"),
+           ("auth_name", "TEXT"),
+           ("last_success", "REAL"),
+           ("last_failure", "REAL"),
+           ("failure_reason", "TEXT"),
+           ("handshake_latency", "REAL"),
+           # scans in a row the host has been unreachable, and when it's
+           # worth trying again
+           ("fail_count", "INTEGER"),
+           ("next_attempt", "REAL"),
+           # seconds the whole scan of the host took last time
+           ("scan_duration", "REAL")]
+
+# after a host is unreachable, we leave it alone for BACKOFF_BASE seconds,
+# doubling with each scan it stays that way, up to BACKOFF_MAX
+BACKOFF_BASE = 12 * 60 * 60
+BACKOFF_MAX = 14 * 24 * 60 * 60
+
+# once we do try one of those again, we don't wait long for it
+RETRY_TIMEOUT = 3
+
+
+def backoff(fail_count):
+    """ Seconds to leave a host that's been unreachable fail_count times. """
+    return min(BACKOFF_BASE * 2 ** (fail_count - 1), BACKOFF_MAX)
+
+
+class ScanStateError(Exception):
+    pass
+
+
+class ScanState(object):
+    """
+    A little sqlite database of the hosts we've scanned: the port and auth
+    that last worked, when a scan last worked or failed and why, and how
+    long the ssh handshake took.
+
+    Safe to share between threads. Each process opens its own connection,
+    and pickling one (to hand it to a worker process) keeps just the path.
+    Every update is committed straight away, so --workers and other scans
+    using the same file never wait long on each other.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_FILE):
+        if sqlite3 is None:
+            raise ScanStateError("sqlite is not available")
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self._connect()
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def _connect(self):
+        """ Open (and create or upgrade) the database, once per process. """
+        if self.conn is not None and self.pid == os.getpid():
+            return
+        state_dir = os.path.dirname(self.path)
+        try:
+            if not os.path.exists(state_dir):
+                os.makedirs(state_dir, 0700)
+            self.conn = sqlite3.connect(self.path, timeout=30,
+                                        check_same_thread=False)
+            # readers don't hold up the writer, and a commit doesn't cost
+            # an fsync. Not every filesystem can do WAL, and we get by
+            # without it.
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+
+            columns = ", ".join(["%s %s" % column for column in COLUMNS])
+            self.conn.execute("CREATE TABLE IF NOT EXISTS hosts (%s)" %
+                              columns)
+            have = [row[1] for row in
+                    self.conn.execute("PRAGMA table_info(hosts)")]
+            for name, column_type in COLUMNS:
+                if name not in have:
+                    log.debug("adding %s to %s" % (name, self.path))
+                    self.conn.execute("ALTER TABLE hosts ADD COLUMN %s %s" %
+                                      (name, column_type))
+            self.conn.commit()
+        except (OSError, sqlite3.Error) as e:
+            # so we try again from scratch next time
+            self.conn = None
+            raise ScanStateError("unable to open %s: %s" % (self.path, e))
+        self.pid = os.getpid()
+
+    def get(self, ip):
+        """
+        A dict of what we know about ip, or None. Raises ScanStateError if
+        we can't tell.
+        """
+        self.lock.acquire()
+        try:
+            self._connect()
+            cursor = self.conn.execute("SELECT * FROM hosts WHERE ip = ?",
+                                       (ip,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            names = [description[0] for description in cursor.description]
+            return dict(zip(names, row))
+        except sqlite3.Error as e:
+            raise ScanStateError("unable to look up %s in %s: %s" %
+                                 (ip, self.path, e))
+        finally:
+            self.lock.release()
+
+    def _set(self, ip, values):
+        """ Update the columns in values for ip, adding its row if need be. """
+        names = values.keys()
+        self.conn.execute("INSERT OR IGNORE INTO hosts (ip) VALUES (?)", (ip,))
+        self.conn.execute("UPDATE hosts SET %s WHERE ip = ?" %
+                          ", ".join(["%s = ?" % name for name in names]),
+                          [values[name] for name in names] + [ip])
+        # holding the write lock any longer would hold up everyone else
+        # writing to the file
+        self.conn.commit()
+
+    def update(self, ssh_job):
+        """
+        Record how a scan of ssh_job's host went. Raises ScanStateError if
+        we can't.
+        """
+        if ssh_job.skipped:
+            # we didn't even try, so there's nothing new to know
+            return
+
+        now = time.time()
+        if ssh_job.error or ssh_job.auth is None:
+            values = {'last_failure': now,
+                      'failure_reason': ssh_job.error}
+        else:
+            values = {'port': ssh_job.port,
+                      'auth_name': ssh_job.auth.name,
+                      'last_success': now,
+                      'handshake_latency': ssh_job.handshake_latency}
+        values['fail_count'] = 0
+        values['next_attempt'] = None
+        if ssh_job.duration is not None:
+            values['scan_duration'] = ssh_job.duration
+
+        self.lock.acquire()
+        try:
+            self._connect()
+            if ssh_job.unreachable:
+                host = self.conn.execute("SELECT fail_count FROM hosts "
+                                         "WHERE ip = ?", (ssh_job.ip,)).fetchone()
+                fail_count = 1
+                if host is not None and host[0]:
+                    fail_count = host[0] + 1
+                values['fail_count'] = fail_count
+                values['next_attempt'] = now + backoff(fail_count)
+            self._set(ssh_job.ip, values)
+        except sqlite3.Error as e:
+            try:
+                self.conn.rollback()
+            except sqlite3.Error:
+                pass
+            raise ScanStateError("unable to update %s in %s: %s" %
+                                 (ssh_job.ip, self.path, e))
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        self.lock.acquire()
+        try:
+            if self.conn is not None and self.pid == os.getpid():
+                self.conn.commit()
+        finally:
+            self.lock.release()
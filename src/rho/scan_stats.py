@@ -0,0 +1,183 @@
+#
+# Copyright (c) 2009 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+""" Running totals of how a scan is going, for the progress output """
+
+import threading
+import time
+
+import gettext
+t = gettext.translation('rho', 'locale', fallback=True)
+_ = t.ugettext
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds / 3600, seconds / 60 % 60, seconds % 60)
+
+
+class ScanStats(object):
+    """
+    Counts of hosts done, in flight, and how they went. The ssh threads
+    call started() and stopped() around each host, and the report calls
+    add() once a host is done with, however that happened.
+    """
+
+    def __init__(self, total=None, controller=None):
+        # how many hosts the scan has, if we know
+        self.total = total
+        # the ssh_jobs.ConcurrencyController, if the concurrency is
+        # adaptive, for its current limit
+        self.controller = controller
+        self.start_time = time.time()
+        self.done = 0
+        self.in_flight = 0
+        self.success = 0
+        self.auth_failed = 0
+        self.unreachable = 0
+        self.skipped = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def started(self):
+        self.lock.acquire()
+        try:
+            self.in_flight = self.in_flight + 1
+        finally:
+            self.lock.release()
+
+    def stopped(self):
+        self.lock.acquire()
+        try:
+            self.in_flight = self.in_flight - 1
+        finally:
+            self.lock.release()
+
+    def add(self, ssh_job):
+        self.lock.acquire()
+        try:
+            self.done = self.done + 1
+            if ssh_job.skipped:
+                self.skipped = self.skipped + 1
+            elif ssh_job.unreachable:
+                self.unreachable = self.unreachable + 1
+            elif ssh_job.auth_failed:
+                self.auth_failed = self.auth_failed + 1
+            elif ssh_job.error:
+                self.errors = self.errors + 1
+            else:
+                self.success = self.success + 1
+        finally:
+            self.lock.release()
+
+    def rate(self):
+        """ Hosts done a second, so far. """
+        elapsed = time.time() - self.start_time
+        if elapsed <= 0:
+            return 0.0
+        return self.done / elapsed
+
+    def eta(self):
+        """ Seconds until we should be done, or None if we can't tell. """
+        rate = self.rate()
+        if self.total is None or not rate:
+            return None
+        return max(0, self.total - self.done) / rate
+
+    def status_line(self):
+        self.lock.acquire()
+        try:
+            if self.total is None:
+                buf = _("%s hosts") % self.done
+            else:
+                buf = _("%s/%s hosts") % (self.done, self.total)
+            buf = _("%s, %.1f/s, %s in flight") % (buf, self.rate(),
+                                                    self.in_flight)
+            if self.controller is not None:
+                buf = _("%s, limit %s") % (buf, self.controller.limit)
+            buf = _("%s, %s ok, %s login failed, %s unreachable, "
+                    "%s skipped, %s other errors") % \
+                (buf, self.success, self.auth_failed, self.unreachable,
+                 self.skipped, self.errors)
+            eta = self.eta()
+            if eta is not None:
+                buf = _("%s, ETA %s") % (buf, format_duration(eta))
+            return buf
+        finally:
+            self.lock.release()
+
+
+# upper bounds, in seconds, of the buckets for TimingHistogram
+TIMING_BUCKETS = [0.01, 0.1, 0.5, 1, 5, 30, 120]
+
+
+def format_bucket(seconds):
+    if seconds < 1:
+        return "<%dms" % (seconds * 1000)
+    if seconds < 60:
+        return "<%ds" % seconds
+    return "<%dm" % (seconds / 60)
+
+
+class TimingHistogram(object):
+    """
+    How long each phase of the host scans took, over all the hosts: how
+    many fell in each of TIMING_BUCKETS, the total and the longest.
+    """
+
+    def __init__(self):
+        # phase: [counts for each bucket and one for over the last, total,
+        # max]
+        self.phases = {}
+
+    def add(self, phase, seconds):
+        if phase not in self.phases:
+            self.phases[phase] = [[0] * (len(TIMING_BUCKETS) + 1), 0, 0]
+        counts, total, longest = self.phases[phase]
+        bucket = 0
+        while bucket < len(TIMING_BUCKETS) and seconds >= TIMING_BUCKETS[bucket]:
+            bucket = bucket + 1
+        counts[bucket] = counts[bucket] + 1
+        self.phases[phase] = [counts, total + seconds, max(longest, seconds)]
+
+    def merge(self, other):
+        for phase, (counts, total, longest) in other.phases.items():
+            if phase not in self.phases:
+                self.phases[phase] = [list(counts), total, longest]
+                continue
+            mine = self.phases[phase]
+            mine[0] = [a + b for a, b in zip(mine[0], counts)]
+            mine[1] = mine[1] + total
+            mine[2] = max(mine[2], longest)
+
+    def format(self):
+        """ The histogram as a list of lines, one per phase. """
+        headings = [_("phase"), _("count"), _("total"), _("mean"), _("max")]
+        headings.extend([format_bucket(bound) for bound in TIMING_BUCKETS])
+        headings.append(">=%s" % format_bucket(TIMING_BUCKETS[-1])[1:])
+        rows = [headings]
+        for phase in sorted(self.phases.keys()):
+            counts, total, longest = self.phases[phase]
+            count = sum(counts)
+            row = [phase, str(count), "%.2f" % total,
+                   "%.3f" % (total / count), "%.3f" % longest]
+            row.extend([str(c) for c in counts])
+            rows.append(row)
+
+        widths = [max([len(cells[i]) for cells in rows])
+                  for i in range(len(headings))]
+        lines = []
+        for row in rows:
+            cells = [row[0].ljust(widths[0])]
+            cells.extend([row[i].rjust(widths[i])
+                          for i in range(1, len(row))])
+            lines.append("  ".join(cells))
+        return lines
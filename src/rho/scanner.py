@@ -7,27 +7,84 @@
 #
 
 
+import multiprocessing
+import Queue
+import time
+
 from rho.log import log
 
+from rho import profiling
 from rho import rho_cmds
 from rho import rho_ips
+from rho import scan_report
+from rho import scan_state
 from rho import ssh_jobs
 
 import gettext
 t = gettext.translation('rho', 'locale', fallback=True)
 _ = t.ugettext
 
+# how many hosts we look at at once when putting them in order
+ORDER_WINDOW = 10000
+
 
 class Scanner(object):
 
-    def __init__(self, config=None, cache={}, allow_agent=False):
+    def __init__(self, config=None, cache={}, allow_agent=False,
+                 bundle_cmds=False, max_threads=ssh_jobs.DEFAULT_MAX_THREADS,
+                 probe_timeout=0, adaptive=False, workers=1,
+                 cmd_timeout=ssh_jobs.DEFAULT_CMD_TIMEOUT, host_timeout=0,
+                 max_output=ssh_jobs.DEFAULT_MAX_OUTPUT, connect_rate=0,
+                 max_per_subnet=0, subnet_prefix=24, state=None,
+                 rescan=False, learn_auths=True, progress_interval=0,
+                 profile_dir=None, recorder=None, summarize_packages=False):
         self.config = config
         self.profiles = []
         self.cache = cache
+        # a scan_state.ScanState, where past scans left what worked
+        self.state = state
+        # try every host properly, even ones that have been unreachable
+        self.rescan = rescan
         self.allow_agent = allow_agent
+        self.bundle_cmds = bundle_cmds
+        self.cmd_timeout = cmd_timeout
+        self.host_timeout = host_timeout
+        self.max_output = max_output
+        # how many processes to split the scan over
+        self.workers = workers
+        self.max_per_subnet = max_per_subnet
+        self.subnet_prefix = subnet_prefix
+        self.progress_interval = progress_interval
+        self.scan_report = None
+        # seconds the last scan_profiles() took
+        self.scan_duration = None
+        # cProfile everything, and leave the stats in profile_dir?
+        self.profiler = None
+        if profile_dir:
+            self.profiler = profiling.Profiler(profile_dir)
+        # a recording.Recorder to save the raw output of every host in
+        self.recorder = recorder
 
         self.default_rho_cmd_classes = rho_cmds.DEFAULT_CMDS
-        self.ssh_jobs = ssh_jobs.SshJobs()
+        if summarize_packages:
+            # same fields, without the package list crossing the network
+            self.default_rho_cmd_classes = [
+                rho_cmds.RedhatPackagesSummaryRhoCmd
+                if rho_cmd_class is rho_cmds.RedhatPackagesRhoCmd
+                else rho_cmd_class
+                for rho_cmd_class in rho_cmds.DEFAULT_CMDS]
+        # the workers share the connection rate between them
+        self.ssh_jobs = ssh_jobs.SshJobs(max_threads=max_threads,
+                                         probe_timeout=probe_timeout,
+                                         adaptive=adaptive,
+                                         connect_rate=float(connect_rate) / workers,
+                                         max_per_subnet=max_per_subnet,
+                                         subnet_prefix=subnet_prefix,
+                                         state=state,
+                                         learn_auths=learn_auths,
+                                         progress_interval=progress_interval,
+                                         profiler=self.profiler,
+                                         recorder=recorder)
         self.output = []
 
     def get_cmd_fields(self):
@@ -35,6 +92,8 @@ class Scanner(object):
         for cmd in self.default_rho_cmd_classes:
             if cmd.fields:
                 fields.update(cmd.fields)
+            fields["timing.cmd.%s" % cmd.name] = \
+                _("seconds spent running the %s commands") % cmd.name
         return fields
 
     def _find_auths(self, authnames):
@@ -51,52 +110,280 @@ class Scanner(object):
 
         return auth_objs
 
+    def _load_keys(self, profiles):
+        """
+        Decrypt every ssh key we're going to need, just the once. Keys
+        that fail stay failed in the cache, so the ssh threads skip over
+        those auths without trying them again.
+        """
+        authnames = []
+        for profile in profiles:
+            for authname in profile.auth_names:
+                if authname not in authnames:
+                    authnames.append(authname)
+
+        ssh_jobs.load_pkeys(self._find_auths(authnames))
+
     def scan_profiles(self, profilenames):
         missing_profiles = []
-        ssh_job_list = []
+        profiles = []
         for profilename in profilenames:
             profile = self.config.get_profile(profilename)
             if profile is None:
                 missing_profiles.append(profilename)
                 continue
-            ips = []
+            profiles.append(profile)
+
+        self._load_keys(profiles)
+
+        start = time.time()
+        if self.workers > 1:
+            self._run_workers(profiles)
+        else:
+            if self.progress_interval:
+                self.ssh_jobs.total = self._count_targets(profiles)
+            self.ssh_jobs.ssh_jobs = self._gen_ssh_jobs(profiles)
+            self._run_scan()
+            self.scan_report = self.ssh_jobs.output_thread.report
+        self.scan_duration = time.time() - start
+
+        return missing_profiles
+
+    def _gen_ssh_jobs(self, profiles, shard=0, shards=1):
+        """
+        Generator of SshJobs for every ip in profiles. The jobs (and all
+        their rho_cmds) only get built as the ssh threads are ready for
+        them, so we don't need one for every host in hand before we start.
+        """
+        if self.state is None:
+            targets = self._gen_targets(profiles, shard, shards)
+        else:
+            targets = self._order_targets(profiles, shard, shards)
+        for profile, ip in targets:
+            yield self._new_ssh_job(profile, ip)
+
+    def _count_targets(self, profiles, shard=0, shards=1):
+        """ How many hosts _gen_ssh_jobs will give us, for the progress. """
+        count = 0
+        for target in self._gen_targets(profiles, shard, shards):
+            count = count + 1
+        return count
+
+    def _gen_targets(self, profiles, shard=0, shards=1):
+        """
+        Generator of (profile, ip) for every ip in profiles.
+
+        With shards > 1, only every shards'th ip is used, starting at
+        shard. If there's a per subnet limit, whole subnets go to a shard
+        instead, so the limit holds across all of them.
+        """
+        index = 0
+        for profile in profiles:
             for range_str in profile.ranges:
                 ipr = rho_ips.RhoIpRange(range_str)
-                ips.extend(ipr.list_ips())
-
-            for ip in ips:
-
-                # Create a copy of the list of ports and authnames,
-                # we're going to modify them if we have a cache hit:
-                ports = list(profile.ports)
-                authnames = list(profile.auth_names)
-
-                # If a cache hit, move the port/auth to the start of the list:
-                if ip in self.cache:
-                    log.debug("Cache hit for: %s" % ip)
-                    cached_port = self.cache[ip]['port']
-                    log.debug("Cached port: %s %s" % (cached_port,
-                                                      type(cached_port)))
-                    cached_authname = self.cache[ip]['auth']
-                    if cached_port in ports:
-                        ports.remove(cached_port)
-                        ports.insert(0, cached_port)
-                        log.debug("trying port %s first" % cached_port)
-                    if cached_authname in authnames:
-                        authnames.remove(cached_authname)
-                        authnames.insert(0, cached_authname)
-                        log.debug("trying auth %s first" % cached_authname)
-
-                sshj = ssh_jobs.SshJob(ip=ip, ports=ports,
-                                       auths=self._find_auths(authnames),
-                                       rho_cmds=self.get_rho_cmds(),
-                                       allow_agent=self.allow_agent)
-                ssh_job_list.append(sshj)
-
-        self.ssh_jobs.ssh_jobs = ssh_job_list
+                for ip in ipr.list_ips():
+                    if self.max_per_subnet:
+                        index = hash(rho_ips.subnet_key(ip,
+                                                        self.subnet_prefix))
+                    if index % shards == shard:
+                        yield (profile, ip)
+                    index = index + 1
+
+    def _order_targets(self, profiles, shard=0, shards=1):
+        """
+        _gen_targets(), in a better order to scan them in, going by the
+        scan state. The hosts that took longest last time go first, so
+        they aren't what we're still waiting on at the end (longest
+        processing time first scheduling), and the ones that were
+        unreachable go last. Hosts we know nothing about are guessed to
+        take the average.
+
+        Only ORDER_WINDOW (profile, ip, duration)s are sorted at a time,
+        and the unreachable ones are looked up again in the state once the
+        rest are done rather than kept, so we still don't need every host
+        in hand before we start.
+        """
+        start = time.time()
+        window = []
+        for profile, ip in self._gen_targets(profiles, shard, shards):
+            host = self._history(ip)
+            if self._retry_last(host, start):
+                continue
+            if host is None:
+                window.append((profile, ip, None))
+            elif host['fail_count']:
+                # not due another go, so it goes straight to the report
+                # as skipped
+                yield (profile, ip)
+                continue
+            else:
+                window.append((profile, ip, host['scan_duration']))
+            if len(window) >= ORDER_WINDOW:
+                for target in self._longest_first(window):
+                    yield target[:2]
+                window = []
+        for target in self._longest_first(window):
+            yield target[:2]
+
+        for profile, ip in self._gen_targets(profiles, shard, shards):
+            host = self._history(ip)
+            # the ones we've scanned since start were in the window
+            if self._retry_last(host, start) and \
+                    max(host['last_success'] or 0,
+                        host['last_failure'] or 0) < start:
+                yield (profile, ip)
+
+    def _history(self, ip):
+        """ What the scan state has on ip, or None if it can't say. """
+        try:
+            return self.state.get(ip)
+        except scan_state.ScanStateError as e:
+            # we can scan it all the same, just not as cleverly
+            log.error(e)
+            return None
+
+    def _retry_last(self, host, start):
+        """ Is host one that was unreachable, and that we try again? """
+        if host is None or not host['fail_count']:
+            return False
+        return self.rescan or not host['next_attempt'] or \
+            host['next_attempt'] <= start
+
+    def _longest_first(self, window):
+        durations = [duration for profile, ip, duration in window
+                     if duration is not None]
+        guess = 0
+        if durations:
+            guess = sum(durations) / len(durations)
+
+        def expected(target):
+            if target[2] is None:
+                return guess
+            return target[2]
+
+        # sorted() is stable, so otherwise they stay in range order
+        return sorted(window, key=lambda target: -expected(target))
+
+    def _scan_shard(self, profiles, shard, result_queue):
+        """ What each worker process runs. """
+        if self.progress_interval:
+            self.ssh_jobs.total = self._count_targets(profiles, shard,
+                                                      self.workers)
+        self.ssh_jobs.ssh_jobs = self._gen_ssh_jobs(profiles, shard,
+                                                    self.workers)
         self._run_scan()
+        result_queue.put(self.ssh_jobs.output_thread.report)
 
-        return missing_profiles
+    def _run_workers(self, profiles):
+        """
+        paramiko does all its crypto and packet wrangling in python, so
+        one process runs out of cpu long before we run out of network.
+        Split the ips over several processes, each with its own SshJobs,
+        and merge their reports when they're done.
+        """
+        result_queue = multiprocessing.Queue()
+        workers = []
+        for shard in range(self.workers):
+            worker = multiprocessing.Process(target=self._scan_shard,
+                                             name="rho_worker-%s" % shard,
+                                             args=(profiles, shard,
+                                                   result_queue))
+            worker.start()
+            workers.append(worker)
+
+        # the reports have to come off the queue before the workers can
+        # exit, so read them before we join
+        self.scan_report = scan_report.ScanReport()
+        received = 0
+        while received < len(workers):
+            try:
+                shard_report = result_queue.get(True, 1)
+            except Queue.Empty:
+                if [w for w in workers if w.is_alive()]:
+                    continue
+                # they're all gone, anything they sent is already here
+                try:
+                    shard_report = result_queue.get(True, 1)
+                except Queue.Empty:
+                    log.error("%s of %s scan workers died without a report" %
+                              (len(workers) - received, len(workers)))
+                    break
+            self.scan_report.merge(shard_report)
+            received = received + 1
+
+        for worker in workers:
+            worker.join()
+
+    def _cache_hit(self, ip, host):
+        """
+        The port and auth that worked on ip last time, as a dict like
+        {'port': 22, 'auth': 'myauthname'}, or None. A --cache report wins
+        over host, what the scan state has on ip.
+        """
+        if ip in self.cache:
+            return self.cache[ip]
+        if host is None or host['auth_name'] is None:
+            return None
+        return {'port': host['port'], 'auth': host['auth_name']}
+
+    def _backoff(self, ssh_job, host):
+        """
+        Leave out hosts that have been unreachable lately, and don't wait
+        long on the ones that are due another go.
+        """
+        if self.rescan or host is None or not host['fail_count']:
+            return
+        if host['next_attempt'] and host['next_attempt'] > time.time():
+            log.debug("Skipping %s, unreachable %s times" %
+                      (ssh_job.ip, host['fail_count']))
+            ssh_job.skipped = True
+            ssh_job.error = _("skipped as unreachable until %s") % \
+                time.strftime("%Y-%m-%d %H:%M",
+                              time.localtime(host['next_attempt']))
+            return
+        ssh_job.timeout = min(ssh_job.timeout, scan_state.RETRY_TIMEOUT)
+
+    def _new_ssh_job(self, profile, ip):
+        # Create a copy of the list of ports and authnames,
+        # we're going to modify them if we have a cache hit:
+        ports = list(profile.ports)
+        authnames = list(profile.auth_names)
+
+        host = None
+        if self.state is not None:
+            host = self._history(ip)
+
+        # If a cache hit, move the port/auth to the start of the list:
+        cached = self._cache_hit(ip, host)
+        if cached is not None:
+            log.debug("Cache hit for: %s" % ip)
+            cached_port = cached['port']
+            log.debug("Cached port: %s %s" % (cached_port,
+                                              type(cached_port)))
+            cached_authname = cached['auth']
+            if cached_port in ports:
+                ports.remove(cached_port)
+                ports.insert(0, cached_port)
+                log.debug("trying port %s first" % cached_port)
+            if cached_authname in authnames:
+                authnames.remove(cached_authname)
+                authnames.insert(0, cached_authname)
+                log.debug("trying auth %s first" % cached_authname)
+
+        ssh_job = ssh_jobs.SshJob(ip=ip, ports=ports,
+                                  auths=self._find_auths(authnames),
+                                  rho_cmds=self.get_rho_cmds(),
+                                  allow_agent=self.allow_agent,
+                                  bundle_cmds=self.bundle_cmds,
+                                  cmd_timeout=self.cmd_timeout,
+                                  host_timeout=self.host_timeout,
+                                  max_output=self.max_output)
+        ssh_job.keep_output = self.recorder is not None
+        if cached is not None and cached['auth'] in authnames:
+            ssh_job.cached_auth = cached['auth']
+        ssh_job.history = host
+        self._backoff(ssh_job, host)
+        return ssh_job
 
     def get_rho_cmds(self, rho_cmd_classes=None):
         if not rho_cmd_classes:
@@ -107,10 +394,18 @@ class Scanner(object):
         return rho_cmds_list
 
     def _run_scan(self):
-        self.ssh_jobs.run_jobs(callback=self._callback)
+        if self.profiler:
+            # this thread makes the jobs and feeds them to the others
+            self.profiler.runcall(self.ssh_jobs.run_jobs,
+                                  callback=self._callback)
+            self.profiler.dump()
+        else:
+            self.ssh_jobs.run_jobs(callback=self._callback)
+        if self.state is not None:
+            self.state.flush()
 
     def report(self, fileobj, report_format=None):
-        self.ssh_jobs.output_thread.report.report(fileobj, report_format=report_format)
+        self.scan_report.report(fileobj, report_format=report_format)
 
     def _callback(self, *args):
         print args
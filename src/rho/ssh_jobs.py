@@ -13,26 +13,68 @@ import paramiko
 
 from rho import config
 from rho.log import log
+from rho import probe
+from rho import rho_cmds
+from rho import rho_ips
 from rho import scan_report
+from rho import scan_stats
 
+import binascii
+import errno
+import itertools
+import os
 import Queue
+import select
 import socket
 import StringIO
 import sys
 import threading
+import time
 import traceback
 
 import gettext
 t = gettext.translation('rho', 'locale', fallback=True)
 _ = t.ugettext
 
+# how many hosts we talk to at once, unless told otherwise
+DEFAULT_MAX_THREADS = 10
 
-# probably should be in a different module, but nothing else
-# to go with it
-def get_pkey(auth):
-    if auth.type != config.SSH_KEY_TYPE:
-        return None
+# seconds a single remote command gets, unless the RhoCmd says otherwise
+DEFAULT_CMD_TIMEOUT = 120
+
+# how much we read from a channel at a time
+READ_SIZE = 32768
+
+# most we keep of either stream of a remote command's output, in bytes
+DEFAULT_MAX_OUTPUT = 32 * 1024 * 1024
+
+
+class CommandTimeout(Exception):
+    """ A remote command didn't finish in time. Has whatever it did send. """
 
+    def __init__(self, stdout="", stderr=""):
+        Exception.__init__(self, _("timeout"))
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+class OutputTooLarge(Exception):
+    """ A remote command sent more than we'll keep. Has what we kept. """
+
+    def __init__(self, stdout="", stderr=""):
+        Exception.__init__(self, _("output too large"))
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+# parsed private keys, by auth name. Decrypting a key with a passphrase
+# burns real cpu, so we want to do that once per scan, not once per host
+# (and per auth attempt).
+_pkey_cache = {}
+_pkey_cache_lock = threading.Lock()
+
+
+def _load_pkey(auth):
     fo = StringIO.StringIO(auth.key)
     # this is lame, but there doesn't appear to be any API to just
     # DWIM with the the key_data, I have to figure out if its RSA or DSA/DSS myself
@@ -49,6 +91,266 @@ def get_pkey(auth):
     print _("The private key file for %s is not a recognized ssh key type" % auth.name)
     return None
 
+
+# probably should be in a different module, but nothing else
+# to go with it
+def get_pkey(auth):
+    if auth.type != config.SSH_KEY_TYPE:
+        return None
+
+    _pkey_cache_lock.acquire()
+    try:
+        if auth.name not in _pkey_cache:
+            try:
+                _pkey_cache[auth.name] = _load_pkey(auth)
+            except paramiko.SSHException as e:
+                # remember the failure too, so a bad passphrase only
+                # gets tried the one time
+                _pkey_cache[auth.name] = e
+        pkey = _pkey_cache[auth.name]
+    finally:
+        _pkey_cache_lock.release()
+
+    if isinstance(pkey, paramiko.SSHException):
+        raise pkey
+    return pkey
+
+
+def load_pkeys(auths):
+    """
+    Parse the ssh keys for auths into the key cache before we start
+    scanning, so any trouble decrypting them shows up once, right away.
+
+    Returns the list of auths whose keys couldn't be loaded.
+    """
+    bad_auths = []
+    for auth in auths:
+        try:
+            get_pkey(auth)
+        except paramiko.SSHException as e:
+            log.error("ssh key error for %s: %s" % (auth.name, str(e)))
+            print _("Unable to load the ssh key for auth %s: %s") % \
+                (auth.name, str(e))
+            bad_auths.append(auth)
+    return bad_auths
+
+
+# Running every cmd_string through its own exec_command costs a channel
+# open and a round trip each. In "bundled" mode we glue them all into one
+# shell script instead, and wrap each command in begin/end markers (on both
+# stdout and stderr) so we can split the combined output back up. The end
+# marker on stdout carries the exit status of the command.
+def new_bundle_marker():
+    return "RHO-%s" % binascii.hexlify(os.urandom(8))
+
+
+def bundle_cmd_strings(cmd_strings, marker):
+    lines = []
+    for index, cmd_string in enumerate(cmd_strings):
+        tag = "%s:%s" % (marker, index)
+        lines.append("echo '%s:begin'; echo '%s:begin' >&2" % (tag, tag))
+        # eval it in a subshell so an 'exit', a 'cd' or a syntax error
+        # can't leak into the commands after it
+        lines.append("( eval '%s' ) < /dev/null" %
+                     cmd_string.replace("'", "'\\''"))
+        lines.append("printf '\\n%%s\\n' \"%s:end:$?\"; printf '\\n%%s\\n' '%s:end' >&2" % (tag, tag))
+    return "\n".join(lines) + "\n"
+
+
+def _split_bundled_stream(buf, count, marker, with_status):
+    results = []
+    pos = 0
+    for index in range(count):
+        tag = "%s:%s" % (marker, index)
+        begin = buf.find("%s:begin\n" % tag, pos)
+        if begin < 0:
+            results.append((None, None))
+            continue
+        begin = begin + len(tag) + len(":begin\n")
+        end = buf.find("\n%s:end" % tag, begin)
+        if end < 0:
+            results.append((None, None))
+            continue
+
+        status = None
+        if with_status:
+            status_start = end + len(tag) + len("\n:end:")
+            status_end = buf.find("\n", status_start)
+            try:
+                status = int(buf[status_start:status_end])
+            except ValueError:
+                pass
+        results.append((buf[begin:end], status))
+        pos = end
+    return results
+
+
+def split_bundled_output(stdout, stderr, count, marker):
+    """
+    Split the output of a script made by bundle_cmd_strings() back into a
+    list of (stdout, stderr, exit status) tuples, one per command.
+
+    Commands whose output is missing (say, the connection dropped half way
+    through the script) get None for all three.
+    """
+    outs = _split_bundled_stream(stdout, count, marker, True)
+    errs = _split_bundled_stream(stderr, count, marker, False)
+    results = []
+    for (out, status), (err, unused) in zip(outs, errs):
+        if out is None:
+            results.append((None, None, None))
+            continue
+        results.append((out, err or "", status))
+    return results
+
+
+def source_key(rho_cmd, index):
+    """
+    (key, cmd_string, function) for rho_cmd.cmd_strings[index]: what we
+    run to get its output, and what to pass that output's stdout through.
+    Every command on a host with the same key gets run the once.
+    """
+    if index in rho_cmd.sources:
+        name, function = rho_cmd.sources[index]
+        return (name,), rho_cmds.DATA_SOURCES[name], function
+    cmd_string = rho_cmd.cmd_strings[index]
+    return cmd_string, cmd_string, None
+
+
+def cut_output(output, function):
+    stdout, stderr = output
+    if function is None or stdout is None:
+        return output
+    return function(stdout), stderr
+
+
+def wait_readable(chan, timeout):
+    """
+    Wait up to timeout seconds (None for as long as it takes) for chan to
+    be readable. select() can't take fds past FD_SETSIZE, and a scan with
+    lots of threads has plenty of those, so it's poll() where we have it.
+    """
+    if getattr(select, "poll", None) is None:
+        select.select([chan], [], [], timeout)
+        return
+
+    poller = select.poll()
+    poller.register(chan, select.POLLIN)
+    if timeout is not None:
+        timeout = timeout * 1000
+    poller.poll(timeout)
+
+
+class OutputBuffer(object):
+    """
+    Collects one stream of a command's output as it comes in, up to
+    max_bytes of it (0 for no limit).
+
+    With a line_callback, complete lines are handed to that as they
+    arrive and not kept here at all, and getvalue() returns None.
+    """
+
+    def __init__(self, max_bytes=0, line_callback=None):
+        self.max_bytes = max_bytes
+        self.line_callback = line_callback
+        self.size = 0
+        self.chunks = []
+        # a line we've only seen the start of, when handing out lines
+        self.partial = ""
+
+    def write(self, data):
+        """ Add a chunk, returns False if it went past max_bytes. """
+        self.size = self.size + len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            return False
+        if self.line_callback is None:
+            self.chunks.append(data)
+            return True
+
+        data = self.partial + data
+        end = data.rfind("\n") + 1
+        self.partial = data[end:]
+        for line in data[:end].splitlines():
+            self.line_callback(line)
+        return True
+
+    def close(self):
+        if self.partial:
+            self.line_callback(self.partial)
+            self.partial = ""
+
+    def getvalue(self):
+        if self.line_callback is not None:
+            return None
+        return "".join(self.chunks)
+
+
+class CmdDeadline(object):
+    """
+    When a running command has to be done by. timeout is in seconds, and
+    None means no limit; host_deadline is the time the whole host has to
+    be done by, if any.
+    """
+
+    def __init__(self, timeout=None, host_deadline=None):
+        self.timeout = timeout
+        self.host_deadline = host_deadline
+        self.started = time.time()
+
+    def update(self, stdout):
+        """ Called with each new chunk of stdout. """
+        pass
+
+    def current_timeout(self):
+        return self.timeout
+
+    def when(self):
+        timeout = self.current_timeout()
+        deadline = None
+        if timeout is not None:
+            deadline = self.started + timeout
+        if self.host_deadline is not None:
+            if deadline is None or self.host_deadline < deadline:
+                deadline = self.host_deadline
+        return deadline
+
+
+class BundleDeadline(CmdDeadline):
+    """
+    Deadline for a script from bundle_cmd_strings(). timeouts has one
+    entry per bundled command. We follow the end markers in stdout to know
+    which command is running, so each one gets its own timeout.
+    """
+
+    def __init__(self, marker, timeouts, host_deadline=None):
+        CmdDeadline.__init__(self, host_deadline=host_deadline)
+        self.marker = marker
+        self.timeouts = timeouts
+        self.index = 0
+        # when we saw each command's end marker
+        self.ends = []
+        # the unsearched end of stdout, in case a marker spans two chunks
+        self.tail = ""
+
+    def update(self, stdout):
+        buf = self.tail + stdout
+        while self.index < len(self.timeouts):
+            tag = "%s:%s:end:" % (self.marker, self.index)
+            pos = buf.find(tag)
+            if pos < 0:
+                break
+            buf = buf[pos + len(tag):]
+            self.index = self.index + 1
+            self.started = time.time()
+            self.ends.append(self.started)
+        self.tail = buf[-(len(self.marker) + 32):]
+
+    def current_timeout(self):
+        if self.index >= len(self.timeouts):
+            return None
+        return self.timeouts[self.index]
+
+
 # on python 2.4, the Queue class doesnt .join and .task_done,which we use and
 # are nice. So we add them to Queue24 if we need to
 
@@ -123,7 +425,9 @@ def OurQueue(*args, **kwargs):
 class SshJob(object):
 
     def __init__(self, ip=None, ports=[22], rho_cmds=None, auths=None,
-                 timeout=30, cache={}, allow_agent=False):
+                 timeout=30, cache={}, allow_agent=False, bundle_cmds=False,
+                 cmd_timeout=DEFAULT_CMD_TIMEOUT, host_timeout=0,
+                 max_output=DEFAULT_MAX_OUTPUT):
         # rho_cmds really needs to be list like, easy mistake to make...
         assert getattr(rho_cmds, "__iter__")
 
@@ -142,6 +446,24 @@ class SshJob(object):
         # the auth we actually used
         self.auth = None
 
+        # did one of our ports answer the TCP probe?
+        self.probed = False
+        # did any of our ports take a TCP connection, ssh or not?
+        self.listening = False
+        # did we find nothing at all listening on any of our ports?
+        self.unreachable = False
+        # left out of this scan, because it's been unreachable lately
+        self.skipped = False
+        # did we find ssh, but none of the auths got us in?
+        self.auth_failed = False
+        # the name of the auth that worked last time, if we know it. It's
+        # already first in auths, and stays there.
+        self.cached_auth = None
+        # seconds we spent on the host, connecting and running commands
+        self.duration = None
+        # what the scan state had on the host before this scan, if anything
+        self.history = None
+
         # do we try to use an ssh-agent for this connection?
         self.allow_agent = allow_agent
 
@@ -149,22 +471,69 @@ class SshJob(object):
         # this connection?
         self.look_for_keys = False
 
+        # run all the rho_cmds in a single remote exec?
+        self.bundle_cmds = bundle_cmds
+        # keep all of every command's output, even for the line_parser
+        # rho_cmds, so it can be recorded
+        self.keep_output = False
+        # the output of the commands we've run on the host, by source_key(),
+        # for the next rho_cmd that wants the same. Emptied once we're done.
+        self.fetched = {}
+        # commands we didn't run, because we already had their output, and
+        # the (rho_cmd, index in its cmd_strings) we've already counted,
+        # saved or not, so none of them counts twice
+        self.execs_saved = 0
+        self.counted = set()
+
         self.timeout = timeout
+        # seconds each remote command gets, 0 for no limit
+        self.cmd_timeout = cmd_timeout
+        # seconds for everything we do on this host, 0 for no limit
+        self.host_timeout = host_timeout
+        # when we have to be done by, set once we start on the host
+        self.deadline = None
+        # bytes we keep of each command's stdout or stderr, 0 for no limit
+        self.max_output = max_output
         self.command_output = None
         self.connection_result = True
         self.returncode = None
         self.auth_used = None
         self.error = None
 
+        # how many times we went through the ssh handshake, and how many
+        # auths we tried over those
+        self.handshakes = 0
+        self.auth_attempts = 0
+        # seconds the last handshake took
+        self.handshake_latency = None
+
+        # seconds spent on each phase of the scan of this host: "connect"
+        # (tcp), "kex" (ssh banner and key exchange), "auth", "cmd.<name>"
+        # for each rho_cmd, and "parse". Each adds up over retries.
+        self.timing = {}
+        # (auth name, seconds) for every auth we tried
+        self.auth_timing = []
+        # bytes of command output we got, over both streams
+        self.bytes_received = 0
+
+    def add_time(self, phase, seconds):
+        self.timing[phase] = self.timing.get(phase, 0) + seconds
+
     def output_callback(self):
         pass
 
 
 class OutputThread(threading.Thread):
 
-    def __init__(self, report=None):
+    def __init__(self, report=None, stats=None, recorder=None):
         self.out_queue = OurQueue()
-        self.report = scan_report.ScanReport()
+        if report is None:
+            report = scan_report.ScanReport()
+        self.report = report
+        # a scan_stats.ScanStats to count the hosts in, if any
+        self.stats = stats
+        # a recording.Recorder to save each host's output with, if any
+        self.recorder = recorder
         self.quitting = False
         threading.Thread.__init__(self, name="rho_output_thread")
 
@@ -176,30 +545,67 @@ class OutputThread(threading.Thread):
             ssh_job = self.out_queue.get()
             if ssh_job == "quit":
                 self.quit()
+                self.out_queue.task_done()
+                continue
 
+            if self.recorder:
+                self.record(ssh_job)
             try:
                 self.report.add(ssh_job)
+                if self.stats:
+                    self.stats.add(ssh_job)
             except Exception as e:
+                # keep going: with no one to take the rest of the hosts
+                # off out_queue, the scan would never finish
                 log.error("Exception: %s" % e)
                 log.error(traceback.print_tb(sys.exc_info()[2]))
-                self.quit()
 
             self.out_queue.task_done()
 
+    def record(self, ssh_job):
+        try:
+            self.recorder.write(ssh_job)
+        except Exception as e:
+            # the report is what matters, keep going without it. That
+            # includes output we can't encode, not only a full disk.
+            log.error("Unable to record %s to %s: %s" %
+                      (ssh_job.ip, self.recorder.path, e))
+
 
 # thread/queue for progress stuff so it stays synced and in order...
 class ProgressThread(threading.Thread):
+    """
+    Prints whatever the ssh threads put on prog_queue or, with an interval,
+    just a line of stats every interval seconds.
+    """
 
-    def __init__(self):
+    def __init__(self, interval=0, stats=None):
         self.prog_queue = OurQueue()
         self.quitting = False
+        self.interval = interval
+        self.stats = stats
+        self.wakeup = threading.Event()
         threading.Thread.__init__(self, name="rho_output_thread")
 
     def quit(self):
         self.quitting = True
+        self.wakeup.set()
+
+    def finish(self):
+        """ Called once the scan is done. """
+        if self.interval:
+            # let it print the final numbers
+            self.quit()
+            self.join()
 
     def run(self):
         print _("Scanning...")
+        if self.interval:
+            while not self.quitting:
+                self.wakeup.wait(self.interval)
+                print self.stats.status_line()
+            return
+
         while not self.quitting:
             prog_buf = self.prog_queue.get()
             print prog_buf
@@ -207,27 +613,433 @@ class ProgressThread(threading.Thread):
             self.prog_queue.task_done()
 
 
+class ConcurrencyController(object):
+    """
+    Decides how many hosts we talk to at once, AIMD style, somewhere
+    between min_limit and max_limit.
+
+    The ssh threads call acquire() before taking a job and release() when
+    done with it, and report each handshake through record(). Every
+    window of handshakes we look back: if too many of them were timeouts
+    or resets, or the handshakes got a lot slower than the best we've
+    seen, the limit is halved. Otherwise it goes up, doubling until the
+    first back off (like TCP's slow start) and by one after that.
+    """
+
+    def __init__(self, max_limit, min_limit=1, start=DEFAULT_MAX_THREADS,
+                 window=10, error_threshold=0.2, latency_factor=3.0):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = max(min_limit, min(start, max_limit))
+        self.window = window
+        self.error_threshold = error_threshold
+        self.latency_factor = latency_factor
+
+        self.in_flight = 0
+        self.slow_start = True
+        self.best_latency = None
+        # (latency, congested) for each handshake since we last adjusted
+        self.results = []
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        self.cond.acquire()
+        try:
+            while self.in_flight >= self.limit:
+                self.cond.wait()
+            self.in_flight = self.in_flight + 1
+        finally:
+            self.cond.release()
+
+    def release(self):
+        self.cond.acquire()
+        try:
+            self.in_flight = self.in_flight - 1
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def record(self, latency=None, congested=False):
+        """
+        Note a handshake that took latency seconds, or a failed one. Only
+        failures that look like we're pushing too hard (timeouts, resets)
+        should be passed as congested.
+        """
+        self.cond.acquire()
+        try:
+            self.results.append((latency, congested))
+            if len(self.results) >= self.window:
+                self._adjust()
+                self.results = []
+                self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def _adjust(self):
+        errors = len([r for r in self.results if r[1]])
+        latencies = [r[0] for r in self.results if r[0] is not None]
+
+        too_slow = False
+        if latencies:
+            latency = sum(latencies) / len(latencies)
+            if self.best_latency is None or latency < self.best_latency:
+                self.best_latency = latency
+            too_slow = latency > self.best_latency * self.latency_factor
+
+        old_limit = self.limit
+        if too_slow or errors > len(self.results) * self.error_threshold:
+            self.slow_start = False
+            self.limit = max(self.min_limit, self.limit / 2)
+        elif self.slow_start:
+            self.limit = min(self.max_limit, self.limit * 2)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1)
+
+        if self.limit != old_limit:
+            log.info("concurrency %s -> %s (%s of %s handshakes failed)" %
+                     (old_limit, self.limit, errors, len(self.results)))
+
+
+class TokenBucket(object):
+    """
+    Paces new connections to rate a second, allowing bursts of up to
+    burst at once. take() blocks until we're allowed another one.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        if burst is None:
+            burst = max(1, rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def take(self):
+        while True:
+            self.lock.acquire()
+            try:
+                now = time.time()
+                self.tokens = min(self.burst,
+                                  self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens = self.tokens - 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            finally:
+                self.lock.release()
+            time.sleep(wait)
+
+
+class SubnetScheduler(object):
+    """
+    Hands out jobs round robin by subnet (of prefix bits), with at most
+    max_per_subnet from any one subnet being worked on at once.
+
+    We look at up to window jobs ahead to find other subnets to go on
+    with, so a wide scan stays busy while a busy subnet waits. The ssh
+    threads call done() when they're finished with each job.
+    """
+
+    def __init__(self, max_per_subnet, prefix=24, window=1024):
+        self.max_per_subnet = max_per_subnet
+        self.prefix = prefix
+        self.window = window
+        # subnet -> number of its jobs handed out and not done yet
+        self.running = {}
+        self.cond = threading.Condition()
+
+    def done(self, ssh_job):
+        key = rho_ips.subnet_key(ssh_job.ip, self.prefix)
+        self.cond.acquire()
+        try:
+            self.running[key] = self.running[key] - 1
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def _next_subnet(self, subnets, start):
+        """ Index of the first subnet from start with room, or None. """
+        for offset in range(len(subnets)):
+            index = (start + offset) % len(subnets)
+            if self.running.get(subnets[index], 0) < self.max_per_subnet:
+                return index
+        return None
+
+    def jobs(self, ssh_jobs):
+        """ Generator of the jobs in ssh_jobs, in the order to run them. """
+        ssh_jobs = iter(ssh_jobs)
+        exhausted = False
+        # subnets with jobs waiting, in the order we go round them, and
+        # their jobs
+        subnets = []
+        pending = {}
+        waiting = 0
+        turn = 0
+
+        while True:
+            while not exhausted and waiting < self.window:
+                try:
+                    ssh_job = ssh_jobs.next()
+                except StopIteration:
+                    exhausted = True
+                    break
+                key = rho_ips.subnet_key(ssh_job.ip, self.prefix)
+                if key not in pending:
+                    subnets.append(key)
+                    pending[key] = []
+                pending[key].append(ssh_job)
+                waiting = waiting + 1
+
+            if not subnets:
+                return
+
+            self.cond.acquire()
+            try:
+                index = self._next_subnet(subnets, turn)
+                while index is None:
+                    self.cond.wait()
+                    index = self._next_subnet(subnets, turn)
+                key = subnets[index]
+                self.running[key] = self.running.get(key, 0) + 1
+            finally:
+                self.cond.release()
+
+            ssh_job = pending[key].pop(0)
+            waiting = waiting - 1
+            if pending[key]:
+                turn = index + 1
+            else:
+                del pending[key]
+                del subnets[index]
+                turn = index
+            yield ssh_job
+
+
+class AuthLearner(object):
+    """
+    Keeps count of which auths worked on each subnet (of prefix bits) and
+    port during the scan. A credential that works on a few hosts of a
+    subnet usually works on the rest, so the hosts still to come can try
+    that one first, rather than failing their way down the list.
+    """
+
+    def __init__(self, prefix=24):
+        self.prefix = prefix
+        # (subnet, port) -> {auth name: number of hosts it worked on}
+        self.successes = {}
+        self.lock = threading.Lock()
+
+    def record(self, ip, port, auth):
+        key = (rho_ips.subnet_key(ip, self.prefix), port)
+        self.lock.acquire()
+        try:
+            counts = self.successes.setdefault(key, {})
+            counts[auth.name] = counts.get(auth.name, 0) + 1
+        finally:
+            self.lock.release()
+
+    def order(self, ip, port, auths, keep_first=False):
+        """
+        auths, the ones that have worked most around ip first, otherwise
+        in the order given. With keep_first, auths[0] stays where it is.
+        """
+        key = (rho_ips.subnet_key(ip, self.prefix), port)
+        self.lock.acquire()
+        try:
+            counts = dict(self.successes.get(key, {}))
+        finally:
+            self.lock.release()
+        if not counts:
+            return list(auths)
+
+        first = []
+        if keep_first:
+            first, auths = list(auths[:1]), auths[1:]
+        # sorted() is stable, so the ties keep the profile's order
+        return first + sorted(auths,
+                              key=lambda auth: -counts.get(auth.name, 0))
+
+
+def _is_congestion(ssh_job, error):
+    """
+    Does a failed handshake look like the network (or an IDS, or sshd's
+    MaxStartups) pushing back on us?
+    """
+    if isinstance(error, socket.timeout):
+        # unless the port answered the probe, a timeout is most likely
+        # just a dead address
+        return ssh_job.probed
+    if isinstance(error, socket.error):
+        return bool(error.args) and error.args[0] == errno.ECONNRESET
+    # sshd dropping us before the banner is how MaxStartups says no
+    return isinstance(error, paramiko.SSHException) and \
+        str(error).find("banner") > -1
+
+
 class SshThread(threading.Thread):
 
-    def __init__(self, thread_id, ssh_queue, output_queue, prog_queue):
+    def __init__(self, thread_id, ssh_queue, output_queue, prog_queue,
+                 controller=None, bucket=None, scheduler=None, learner=None,
+                 stats=None, show_attempts=True, profiler=None):
         self.ssh_queue = ssh_queue
         self.out_queue = output_queue
         self.prog_queue = prog_queue
+        # a ConcurrencyController, if the concurrency is adaptive
+        self.controller = controller
+        # a TokenBucket every new connection has to wait on, if any
+        self.bucket = bucket
+        # the SubnetScheduler the jobs came through, if any
+        self.scheduler = scheduler
+        # an AuthLearner to pick the order we try auths in, if any
+        self.learner = learner
+        # a scan_stats.ScanStats to tell when we start and stop on a host
+        self.stats = stats
+        # print every port/auth we try? Otherwise they only get logged.
+        self.show_attempts = show_attempts
+        # a profiling.Profiler for the paramiko threads we start, if any
+        self.profiler = profiler
         self.id = thread_id
         self.quitting = False
         threading.Thread.__init__(self, name="rho_ssh_thread-%s" % thread_id)
-        self.ssh = None
+        self.transport = None
+        # who we've tried to log in as over self.transport
+        self.transport_user = None
 
     def quit(self):
         self.quitting = True
 
     def show_connect(self, ssh_job, port, auth):
         buf = _("%s:%s with auth %s") % (ssh_job.ip, port, auth.name)
-        log.info(buf)
-        self.prog_queue.put(buf)
+        if self.controller:
+            buf = _("%s (concurrency %s)") % (buf, self.controller.limit)
+        log.debug(buf)
+        if self.show_attempts:
+            self.prog_queue.put(buf)
+
+    def open_transport(self, ssh_job, port):
+        """
+        TCP connect, banner and key exchange, but no auth. Each one of these
+        is a full handshake, so we try all the auths over the same one.
+        """
+        if self.bucket:
+            self.bucket.take()
+        start = time.time()
+        connected = None
+        transport = None
+        try:
+            sock = socket.create_connection((ssh_job.ip, int(port)),
+                                            ssh_job.timeout)
+            connected = time.time()
+            # whatever goes wrong from here on, even a reset, the host is
+            # there
+            ssh_job.listening = True
+            transport = paramiko.Transport(sock)
+            if self.profiler:
+                # the crypto and packet handling all happen in here
+                self.profiler.wrap(transport)
+            transport.start_client(timeout=ssh_job.timeout)
+        except Exception as e:
+            self.time_handshake(ssh_job, start, connected)
+            if transport:
+                transport.close()
+            if self.controller:
+                self.controller.record(congested=_is_congestion(ssh_job, e))
+            raise
+        self.time_handshake(ssh_job, start, connected)
+        ssh_job.handshakes = ssh_job.handshakes + 1
+        ssh_job.handshake_latency = time.time() - start
+        if self.controller:
+            self.controller.record(latency=ssh_job.handshake_latency)
+        return transport
+
+    def time_handshake(self, ssh_job, start, connected):
+        """ Split the time since start into the tcp connect and the kex. """
+        now = time.time()
+        if connected is None:
+            ssh_job.add_time("connect", now - start)
+            return
+        ssh_job.add_time("connect", connected - start)
+        ssh_job.add_time("kex", now - connected)
+
+    def auth(self, ssh_job, auth, pkey):
+        ssh_job.auth_attempts = ssh_job.auth_attempts + 1
+        start = time.time()
+        try:
+            self._auth(ssh_job, auth, pkey)
+        finally:
+            seconds = time.time() - start
+            ssh_job.add_time("auth", seconds)
+            ssh_job.auth_timing.append((auth.name, seconds))
+
+    def _auth(self, ssh_job, auth, pkey):
+        # this is roughly what paramiko.SSHClient does, minus the hunt for
+        # keys in ~/.ssh, which we never want
+        if pkey is not None:
+            try:
+                self.transport.auth_publickey(auth.username, pkey)
+                return
+            except paramiko.AuthenticationException:
+                if not ssh_job.allow_agent:
+                    raise
+
+        if ssh_job.allow_agent:
+            for agent_key in paramiko.Agent().get_keys():
+                try:
+                    self.transport.auth_publickey(auth.username, agent_key)
+                    return
+                except paramiko.SSHException:
+                    pass
+
+        # the password of a key auth is the passphrase, don't send that
+        if auth.type == config.SSH_KEY_TYPE:
+            raise paramiko.AuthenticationException()
+        self.transport.auth_password(auth.username, auth.password)
+
+    def reopen_transport(self, ssh_job, port):
+        self.transport.close()
+        self.transport_user = None
+        self.transport = self.open_transport(ssh_job, port)
+
+    def try_auth(self, ssh_job, port, auth, pkey):
+        for attempt in range(2):
+            # sshd hangs up on us after MaxAuthTries failures, and won't
+            # let us switch usernames on a connection at all, so we may
+            # need a new transport to keep going
+            if not self.transport.is_active():
+                log.debug("%s:%s closed the connection, reconnecting" %
+                          (ssh_job.ip, port))
+                self.reopen_transport(ssh_job, port)
+            elif self.transport_user not in (None, auth.username):
+                self.reopen_transport(ssh_job, port)
+
+            self.transport_user = auth.username
+            try:
+                self.auth(ssh_job, auth, pkey)
+                return
+            except paramiko.AuthenticationException:
+                raise
+            except (paramiko.SSHException, EOFError):
+                # if it hung up in the middle of this one, give it one
+                # more go on a fresh transport
+                if attempt or self.transport.is_active():
+                    raise
+
+    def order_auths(self, ssh_job, port):
+        if not self.learner:
+            return ssh_job.auths
+        # what worked on this very host last time beats what's working on
+        # its neighbours
+        keep_first = False
+        if ssh_job.cached_auth is not None and ssh_job.auths:
+            keep_first = ssh_job.auths[0].name == ssh_job.cached_auth
+        return self.learner.order(ssh_job.ip, port, ssh_job.auths,
+                                  keep_first=keep_first)
 
     def connect(self, ssh_job):
         # do the actual paramiko ssh connection
+        self.transport = None
 
         # Copy the list of ports, we'll modify it as we go:
         ports_to_try = list(ssh_job.ports)
@@ -248,12 +1060,42 @@ class SshThread(threading.Thread):
                 log.debug("Could not find/connect to ssh on: %s" % ssh_job.ip)
                 err = _("unable to connect")
                 ssh_job.error = err
+                ssh_job.unreachable = not ssh_job.listening
+                break
+
+            if self.past_deadline(ssh_job):
+                ssh_job.error = _("timeout")
                 break
 
             port = ports_to_try.pop(0)
 
-            for auth in ssh_job.auths:
+            try:
+                self.transport = self.open_transport(ssh_job, port)
+                self.transport_user = None
+
+            # No route to host, or a reset during the handshake (which
+            # open_transport has already noted the host was listening for):
+            except socket.error as e:
+                log.warn("Unable to connect, skipping port: %s:%s - %s" %
+                         (ssh_job.ip, port, str(e)))
+                ssh_job.error = str(e)
+                continue
+
+            # Hitting a live port that isn't ssh will land us here, as
+            # will anything else going wrong with the handshake:
+            except Exception as detail:
+                log.warn("Connection error: %s:%s - %s" % (ssh_job.ip, port,
+                                                           str(detail)))
+                ssh_job.error = str(detail)
+                ssh_job.listening = True
+                continue
+
+            for auth in self.order_auths(ssh_job, port):
+                if self.past_deadline(ssh_job):
+                    ssh_job.error = _("timeout")
+                    break
                 ssh_job.error = None
+                ssh_job.auth_failed = False
 
                 debug_str = "%s:%s/%s" % (ssh_job.ip, port, auth.name)
                 # this checks the case of a passphrase we can't decrypt
@@ -265,25 +1107,18 @@ class SshThread(threading.Thread):
                     ssh_job.error = str(e)
                     continue
 
-                self.ssh = paramiko.SSHClient()
-                self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
                 try:
                     log.info("trying: %s" % debug_str)
 
                     self.show_connect(ssh_job, port, auth)
-                    self.ssh.connect(ssh_job.ip, port=int(port),
-                                     username=auth.username,
-                                     password=auth.password,
-                                     pkey=pkey,
-                                     allow_agent=ssh_job.allow_agent,
-                                     look_for_keys=ssh_job.look_for_keys,
-                                     timeout=ssh_job.timeout)
+                    self.try_auth(ssh_job, port, auth, pkey)
                     ssh_job.port = port
                     ssh_job.auth = auth
                     found_port = port
                     found_auth = True
                     log.info("success: %s" % debug_str)
+                    if self.learner:
+                        self.learner.record(ssh_job.ip, port, auth)
                     break
 
                 # Implies we've found an SSH server listening:
@@ -294,18 +1129,16 @@ class SshThread(threading.Thread):
                     err = _("login failed")
                     log.error(err)
                     ssh_job.error = err
+                    ssh_job.auth_failed = True
                     found_port = port
                     continue
 
-                # No route to host:
+                # Lost the server while reconnecting:
                 except socket.error as e:
                     log.warn("No route to host, skipping port: %s" % debug_str)
                     ssh_job.error = str(e)
                     break
 
-                # TODO: Hitting a live port that isn't ssh will result in
-                # paramiko.SSHException, do we need to handle this explicitly?
-
                 # Something else happened:
                 except Exception as detail:
                     log.warn("Connection error: %s - %s" % (debug_str,
@@ -313,28 +1146,283 @@ class SshThread(threading.Thread):
                     ssh_job.error = str(detail)
                     continue
 
+            if not found_auth:
+                self.transport.close()
+                self.transport = None
+
+    def past_deadline(self, ssh_job):
+        return ssh_job.deadline is not None and time.time() >= ssh_job.deadline
+
+    def cmd_timeout(self, ssh_job, rho_cmd):
+        """ Seconds each command of rho_cmd gets, None for no limit. """
+        return rho_cmd.timeout or ssh_job.cmd_timeout or None
+
+    def read_output(self, chan, deadline, stdout, stderr):
+        """
+        Read from chan into the stdout and stderr OutputBuffers, a chunk
+        at a time from whichever has data, until both are done.
+
+        Raises CommandTimeout if deadline passes first, or OutputTooLarge
+        if either buffer fills up.
+        """
+        streams = [(chan.recv, stdout), (chan.recv_stderr, stderr)]
+        chan.settimeout(0.0)
+        while streams:
+            got_some = False
+            for stream in list(streams):
+                recv, buf = stream
+                try:
+                    data = recv(READ_SIZE)
+                except socket.timeout:
+                    continue
+                got_some = True
+                if not data:
+                    buf.close()
+                    streams.remove(stream)
+                    continue
+                if buf is stdout:
+                    deadline.update(data)
+                if not buf.write(data):
+                    raise OutputTooLarge(stdout.getvalue(), stderr.getvalue())
+            if got_some:
+                continue
+
+            wait = None
+            when = deadline.when()
+            if when is not None:
+                wait = when - time.time()
+                if wait <= 0:
+                    raise CommandTimeout(stdout.getvalue(), stderr.getvalue())
+            # the channel's fileno is readable whenever either stream has
+            # something for us
+            wait_readable(chan, wait)
+
+    def exec_command(self, cmd_string, deadline=None, max_output=0,
+                     line_callback=None, ssh_job=None):
+        """
+        Run cmd_string on the connected host, return (stdout, stderr).
+
+        Raises CommandTimeout if it's still going at deadline, a CmdDeadline,
+        and OutputTooLarge if it sends more than max_output bytes on either
+        stream. With a line_callback, stdout goes to that a line at a time
+        as it arrives, and we return None for it. The bytes received are
+        added up in ssh_job, if given.
+        """
+        if deadline is None:
+            deadline = CmdDeadline()
+        when = deadline.when()
+        if when is not None and when <= time.time():
+            raise CommandTimeout()
+
+        stdout = OutputBuffer(max_output, line_callback)
+        stderr = OutputBuffer(max_output)
+        chan = self.transport.open_session()
+        try:
+            chan.exec_command(cmd_string)
+            self.read_output(chan, deadline, stdout, stderr)
+        finally:
+            # if it's still running, this is as much as we can do to stop it
+            chan.close()
+            if ssh_job is not None:
+                ssh_job.bytes_received = ssh_job.bytes_received + \
+                    stdout.size + stderr.size
+        return stdout.getvalue(), stderr.getvalue()
+
     def run_cmds(self, ssh_job,):
+        try:
+            if ssh_job.bundle_cmds:
+                self.run_cmds_bundled(ssh_job)
+                return
+            self.run_rho_cmds(ssh_job, ssh_job.rho_cmds)
+        finally:
+            ssh_job.fetched = {}
+            ssh_job.counted = set()
+
+    def line_callback(self, ssh_job, rho_cmd, index):
+        if not rho_cmd.line_parser or ssh_job.keep_output:
+            return None
+        return lambda line: rho_cmd.parse_line(index, line)
+
+    def populate_data(self, ssh_job, rho_cmd, output):
+        start = time.time()
+        try:
+            rho_cmd.populate_data(output)
+        finally:
+            ssh_job.add_time("parse", time.time() - start)
+
+    def fetch(self, ssh_job, rho_cmd, index):
+        """
+        (stdout, stderr) of rho_cmd.cmd_strings[index]. It only gets run
+        if no other rho_cmd has had the same output off the host already.
+        """
+        deadline = CmdDeadline(self.cmd_timeout(ssh_job, rho_cmd),
+                               ssh_job.deadline)
+        line_callback = self.line_callback(ssh_job, rho_cmd, index)
+        if line_callback is not None:
+            # it all goes to the one parser, there's nothing to share
+            return self.exec_command(rho_cmd.cmd_strings[index], deadline,
+                                     ssh_job.max_output, line_callback,
+                                     ssh_job)
+
+        key, cmd_string, function = source_key(rho_cmd, index)
+        if key in ssh_job.fetched:
+            if (rho_cmd, index) not in ssh_job.counted:
+                ssh_job.counted.add((rho_cmd, index))
+                ssh_job.execs_saved = ssh_job.execs_saved + 1
+            output = ssh_job.fetched[key]
+            if isinstance(output, Exception):
+                # running it again would only go the same way
+                raise output
+            return cut_output(output, function)
+
+        try:
+            output = self.exec_command(cmd_string, deadline,
+                                       ssh_job.max_output, ssh_job=ssh_job)
+        except (CommandTimeout, OutputTooLarge) as e:
+            ssh_job.fetched[key] = e
+            raise
+        ssh_job.fetched[key] = output
+        return cut_output(output, function)
+
+    def run_rho_cmds(self, ssh_job, rho_cmds):
+        for rho_cmd in rho_cmds:
+            output = []
+            start = time.time()
+            try:
+                for index, cmd_string in enumerate(rho_cmd.cmd_strings):
+                    output.append(self.fetch(ssh_job, rho_cmd, index))
+            except CommandTimeout:
+                log.warn("Timed out on %s: %s" % (ssh_job.ip, cmd_string))
+                rho_cmd.populate_timeout()
+                continue
+            except OutputTooLarge:
+                log.warn("Output over %s bytes on %s: %s" %
+                         (ssh_job.max_output, ssh_job.ip, cmd_string))
+                rho_cmd.populate_too_large()
+                continue
+            finally:
+                ssh_job.add_time("cmd.%s" % rho_cmd.name, time.time() - start)
+            self.populate_data(ssh_job, rho_cmd, output)
+
+    def run_cmds_bundled(self, ssh_job):
+        # each distinct command, or data source, goes in the bundle once
+        cmd_strings = []
+        timeouts = []
+        keys = {}
+        # for each rho_cmd, [(index in cmd_strings, function)] for each
+        # of its commands
+        plan = []
         for rho_cmd in ssh_job.rho_cmds:
+            uses = []
+            for index in range(len(rho_cmd.cmd_strings)):
+                key, cmd_string, function = source_key(rho_cmd, index)
+                # anything the bundle runs again on its own, if it has to,
+                # isn't saved all over again
+                ssh_job.counted.add((rho_cmd, index))
+                if key in keys:
+                    ssh_job.execs_saved = ssh_job.execs_saved + 1
+                else:
+                    keys[key] = len(cmd_strings)
+                    cmd_strings.append(cmd_string)
+                    timeouts.append(self.cmd_timeout(ssh_job, rho_cmd))
+                uses.append((keys[key], function))
+            plan.append(uses)
+
+        marker = new_bundle_marker()
+        script = bundle_cmd_strings(cmd_strings, marker)
+        deadline = BundleDeadline(marker, timeouts, ssh_job.deadline)
+        # the whole bundle gets as much as its commands would have had
+        max_output = ssh_job.max_output * len(cmd_strings)
+        timed_out = False
+        too_large = False
+        start = time.time()
+        try:
+            stdout, stderr = self.exec_command(script, deadline, max_output,
+                                               ssh_job=ssh_job)
+        except CommandTimeout as e:
+            # whatever finished before the timeout is still good
+            log.warn("Timed out on %s: %s" %
+                     (ssh_job.ip, cmd_strings[deadline.index]))
+            stdout, stderr = e.stdout, e.stderr
+            timed_out = True
+        except OutputTooLarge as e:
+            # same here, and the unfinished ones get run on their own, to
+            # be held to their own limits
+            log.warn("Bundled output over %s bytes on %s" %
+                     (max_output, ssh_job.ip))
+            stdout, stderr = e.stdout, e.stderr
+            too_large = True
+        results = split_bundled_output(stdout, stderr, len(cmd_strings),
+                                       marker)
+        # each command ran from the end marker of the one before it to its
+        # own, and the one that was cut off ran until we gave up
+        ends = [start] + deadline.ends + [time.time()]
+        # for the ones that get run again on their own
+        for key, index in keys.items():
+            out, err, status = results[index]
+            if out is not None:
+                ssh_job.fetched[key] = (out, err)
+
+        # the ones that never got started because of a timeout
+        not_run = []
+        # a command's time goes to the first rho_cmd that wanted it
+        timed = set()
+        for rho_cmd, uses in zip(ssh_job.rho_cmds, plan):
             output = []
-            for cmd_string in rho_cmd.cmd_strings:
-                stdin, stdout, stderr = self.ssh.exec_command(cmd_string)
-                output.append((stdout.read(), stderr.read()))
-            rho_cmd.populate_data(output)
+            missing = []
+            for index, function in uses:
+                out, err, status = results[index]
+                if index not in timed and index + 1 < len(ends):
+                    ssh_job.add_time("cmd.%s" % rho_cmd.name,
+                                     ends[index + 1] - ends[index])
+                    timed.add(index)
+                if out is None and (timed_out or too_large):
+                    missing.append(index)
+                elif out is None:
+                    log.warn("No output from bundled command on %s: %s" %
+                             (ssh_job.ip, cmd_strings[index]))
+                    out, err = "", ""
+                else:
+                    log.debug("%s: '%s' exited with %s" %
+                              (ssh_job.ip, cmd_strings[index], status))
+                output.append(cut_output((out, err), function))
+            # the one that hung times out, but anyone who didn't need it
+            # gets another go
+            if missing and (too_large or deadline.index not in missing):
+                not_run.append(rho_cmd)
+            elif missing:
+                rho_cmd.populate_timeout()
+            else:
+                self.populate_data(ssh_job, rho_cmd, output)
+
+        # one hung command shouldn't cost us all the ones after it
+        self.run_rho_cmds(ssh_job, not_run)
 
     def get_transport(self, ssh_job):
         if ssh_job.ip is "":
             return None
 
+        start = time.time()
+        if ssh_job.host_timeout:
+            ssh_job.deadline = start + ssh_job.host_timeout
+        try:
+            self.scan_host(ssh_job)
+        finally:
+            ssh_job.duration = time.time() - start
+
+    def scan_host(self, ssh_job):
         try:
             self.connect(ssh_job)
-            if not self.ssh:
+            if not self.transport:
                 return
 
             # there was a connection/auth failure
             if ssh_job.error:
                 return
-            self.run_cmds(ssh_job)
-            self.ssh.close()
+            try:
+                self.run_cmds(ssh_job)
+            finally:
+                self.transport.close()
 
         except Exception as e:
             log.error("Exception on %s: %s" % (ssh_job.ip, e))
@@ -343,50 +1431,182 @@ class SshThread(threading.Thread):
             ssh_job.connection_result = False
             ssh_job.command_output = e
 
+    def scan_job(self, ssh_job):
+        if self.stats:
+            self.stats.started()
+        try:
+            self.get_transport(ssh_job)
+        finally:
+            if self.stats:
+                self.stats.stopped()
+        if self.scheduler:
+            self.scheduler.done(ssh_job)
+        self.out_queue.put(ssh_job)
+
     def run(self):
         while not self.quitting:
+            if self.controller:
+                self.controller.acquire()
             try:
                 # grab a "ssh_job" off the q
                 ssh_job = self.ssh_queue.get()
-                self.get_transport(ssh_job)
-                self.out_queue.put(ssh_job)
+                if ssh_job == "quit":
+                    self.quit()
+                else:
+                    self.scan_job(ssh_job)
                 self.ssh_queue.task_done()
             except Exception as e:
                 log.error("Exception: %s" % e)
                 log.error(traceback.print_tb(sys.exc_info()[2]))
                 self.ssh_queue.task_done()
+            if self.controller:
+                self.controller.release()
 
 
 class SshJobs(object):
 
-    def __init__(self):
+    def __init__(self, max_threads=DEFAULT_MAX_THREADS, probe_timeout=0,
+                 adaptive=False, connect_rate=0, max_per_subnet=0,
+                 subnet_prefix=24, state=None, learn_auths=True,
+                 progress_interval=0, profiler=None, recorder=None):
         # cmdSrc is some sort of list/iterator thing
 
         self.verbose = True
-        self.max_threads = 10
-
-        self.ssh_queue = OurQueue()
+        # every connection costs us a thread here, plus the one paramiko
+        # starts for its Transport, so this is also our concurrency limit
+        self.max_threads = max_threads
+
+        # if set, sweep every ip/port with a plain TCP connect first and
+        # only hand the ones that answer to the ssh threads
+        self.probe_timeout = probe_timeout
+
+        # let a ConcurrencyController pick how many of the threads get
+        # to work at once?
+        self.adaptive = adaptive
+        self.controller = None
+
+        # new connections (and probes) a second, 0 for as fast as we can
+        self.connect_rate = connect_rate
+        self.bucket = None
+        # how many hosts of any one subnet, of subnet_prefix bits, we talk
+        # to at once. 0 for no limit.
+        self.max_per_subnet = max_per_subnet
+        self.subnet_prefix = subnet_prefix
+        self.scheduler = None
+
+        # a scan_state.ScanState the report keeps up to date, if any
+        self.state = state
+
+        # try the auths that have been working nearby first?
+        self.learn_auths = learn_auths
+        self.learner = None
+
+        # print a line of stats this often, rather than every connection
+        # attempt
+        self.progress_interval = progress_interval
+        # how many hosts we're scanning, if known, for the progress
+        self.total = None
+        self.stats = None
+
+        # a profiling.Profiler for all our threads, if we're profiling
+        self.profiler = profiler
+        # a recording.Recorder for the raw output of every host, if any
+        self.recorder = recorder
+
+        # set up in run_jobs(), once we know how many threads we get
+        self.ssh_queue = None
+        self.ssh_threads = []
+        # a list, or any iterable, of SshJobs. Can be a generator, we only
+        # pull jobs from it as the ssh threads are ready for them.
         self.ssh_jobs = []
 
     def queue_jobs(self, ssh_job):
+        # blocks while the queue is full, which keeps the producer from
+        # getting too far ahead of the ssh threads
         self.ssh_queue.put(ssh_job, block=True)
 
-    def start_ssh_queue(self):
-        for thread_num in range(self.max_threads):
-            ssh_thread = SshThread(thread_num,
-                                   self.ssh_queue,
-                                   self.output_thread.out_queue,
-                                   self.prog_thread.prog_queue)
-            ssh_thread.setDaemon(True)
-            ssh_thread.start()
+    def probe_jobs(self, ssh_jobs):
+        """
+        TCP probe every port of every job, and drop the ports that don't
+        answer. Jobs with no ports left go straight to the report as
+        unreachable, the rest are returned.
+        """
+        endpoints = []
+        for ssh_job in ssh_jobs:
+            for port in ssh_job.ports:
+                endpoints.append((ssh_job.ip, int(port)))
+        throttle = None
+        if self.bucket:
+            throttle = self.bucket.take
+        open_endpoints = probe.probe(endpoints, self.probe_timeout,
+                                     throttle=throttle)
+
+        live_jobs = []
+        for ssh_job in ssh_jobs:
+            ssh_job.ports = [port for port in ssh_job.ports
+                             if (ssh_job.ip, int(port)) in open_endpoints]
+            if ssh_job.ports:
+                ssh_job.probed = True
+                live_jobs.append(ssh_job)
+                continue
+            log.debug("probe: nothing listening on %s" % ssh_job.ip)
+            ssh_job.error = _("unable to connect")
+            ssh_job.unreachable = True
+            self.output_thread.out_queue.put(ssh_job)
+        return live_jobs
+
+    def skip_jobs(self, ssh_jobs):
+        """ Send skipped jobs straight to the report, generate the rest. """
+        for ssh_job in ssh_jobs:
+            if ssh_job.skipped:
+                self.output_thread.out_queue.put(ssh_job)
+                continue
+            yield ssh_job
+
+    def live_jobs(self, ssh_jobs):
+        """ Generator of the jobs worth handing to the ssh threads. """
+        ssh_jobs = self.skip_jobs(ssh_jobs)
+        if not self.probe_timeout:
+            for ssh_job in ssh_jobs:
+                yield ssh_job
+            return
+
+        # probe a batch at a time, so we don't need every job in hand first
+        while True:
+            batch = list(itertools.islice(ssh_jobs, probe.DEFAULT_MAX_SOCKETS))
+            if not batch:
+                break
+            for ssh_job in self.probe_jobs(batch):
+                yield ssh_job
+
+    def start_ssh_thread(self):
+        ssh_thread = SshThread(len(self.ssh_threads),
+                               self.ssh_queue,
+                               self.output_thread.out_queue,
+                               self.prog_thread.prog_queue,
+                               controller=self.controller,
+                               bucket=self.bucket,
+                               scheduler=self.scheduler,
+                               learner=self.learner,
+                               stats=self.stats,
+                               show_attempts=not self.progress_interval,
+                               profiler=self.profiler)
+        if self.profiler:
+            self.profiler.wrap(ssh_thread)
+        ssh_thread.setDaemon(True)
+        ssh_thread.start()
+        self.ssh_threads.append(ssh_thread)
 
     def start_output_queue(self):
-        self.output_thread = OutputThread()
+        self.output_thread = OutputThread(scan_report.ScanReport(self.state),
+                                          self.stats, self.recorder)
+        if self.profiler:
+            self.profiler.wrap(self.output_thread)
         self.output_thread.setDaemon(True)
         self.output_thread.start()
 
     def start_prog_queue(self):
-        self.prog_thread = ProgressThread()
+        self.prog_thread = ProgressThread(self.progress_interval, self.stats)
         self.prog_thread.setDaemon(True)
         self.prog_thread.start()
 
@@ -394,21 +1614,48 @@ class SshJobs(object):
         if ssh_jobs:
             self.ssh_jobs = ssh_jobs
 
-        # no point in spinning up 10 threads for one connection...
-        if len(self.ssh_jobs) < self.max_threads:
-            self.max_threads = len(self.ssh_jobs)
+        # a little slack so a thread finishing a job always has the next
+        # one waiting for it
+        self.ssh_queue = OurQueue(maxsize=self.max_threads * 2)
+        if self.adaptive:
+            self.controller = ConcurrencyController(self.max_threads)
+        if self.connect_rate:
+            self.bucket = TokenBucket(self.connect_rate)
+        if self.learn_auths:
+            self.learner = AuthLearner(self.subnet_prefix)
+        total = self.total
+        if total is None and hasattr(self.ssh_jobs, "__len__"):
+            total = len(self.ssh_jobs)
+        self.stats = scan_stats.ScanStats(total, self.controller)
 
         self.start_prog_queue()
         self.start_output_queue()
-        self.start_ssh_queue()
 
-        while self.ssh_jobs:
-            for ssh_job in self.ssh_jobs:
-                # we don't set a cap on Queue size, should we?
-                if not self.ssh_queue.full():
-                    self.queue_jobs(ssh_job)
-                    self.ssh_jobs.remove(ssh_job)
+        jobs = self.live_jobs(self.ssh_jobs)
+        if self.max_per_subnet:
+            self.scheduler = SubnetScheduler(self.max_per_subnet,
+                                             self.subnet_prefix)
+            jobs = self.scheduler.jobs(jobs)
+
+        for ssh_job in jobs:
+            # start the threads as the jobs show up, there's no point in
+            # spinning up 10 threads for one connection...
+            if len(self.ssh_threads) < self.max_threads:
+                self.start_ssh_thread()
+            self.queue_jobs(ssh_job)
 
         self.ssh_queue.join()
         self.prog_thread.prog_queue.join()
         self.output_thread.out_queue.join()
+        self.prog_thread.finish()
+
+        if self.profiler:
+            # their stats only get added up once they're done
+            self.stop_threads()
+
+    def stop_threads(self):
+        for ssh_thread in self.ssh_threads:
+            self.ssh_queue.put("quit")
+        self.output_thread.out_queue.put("quit")
+        for thread in self.ssh_threads + [self.output_thread]:
+            thread.join()
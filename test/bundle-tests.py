@@ -0,0 +1,229 @@
+#!/usr/bin/python
+
+import subprocess
+import unittest
+
+from rho import rho_cmds
+from rho import ssh_jobs
+
+
+# like the rho_cmds tests, we just run these locally
+def _run(cmd):
+    p = subprocess.Popen(["bash", "-c", cmd], stderr=subprocess.PIPE,
+                         stdout=subprocess.PIPE, stdin=subprocess.PIPE)
+    out, err = p.communicate()
+    return out, err, p.returncode
+
+
+class TestBundleCmds(unittest.TestCase):
+
+    cmd_strings = ["echo blippy",
+                   "printf 'no trailing newline'",
+                   "echo to stderr >&2; echo to stdout",
+                   "exit 3",
+                   "",
+                   "cd /; pwd # a comment",
+                   "pwd",
+                   "echo 'single' \"double\" \\'",
+                   "uname -a"]
+
+    def _check(self, cmd_strings, exact_stderr=True):
+        marker = ssh_jobs.new_bundle_marker()
+        script = ssh_jobs.bundle_cmd_strings(cmd_strings, marker)
+        out, err, status = _run(script)
+        results = ssh_jobs.split_bundled_output(out, err, len(cmd_strings),
+                                                marker)
+        self.assertEquals(len(cmd_strings), len(results))
+        for cmd_string, result in zip(cmd_strings, results):
+            expected = _run(cmd_string)
+            if exact_stderr:
+                self.assertEquals(expected, result)
+                continue
+            # error messages from the shell include the line number
+            self.assertEquals(expected[0], result[0])
+            self.assertEquals(bool(expected[1]), bool(result[1]))
+            self.assertEquals(expected[2], result[2])
+
+    def test_bundle(self):
+        self._check(self.cmd_strings)
+
+    def test_bundle_syntax_error(self):
+        self._check(["echo before", "if then", "echo after"],
+                    exact_stderr=False)
+
+    def test_bundle_etc_release(self):
+        self._check(rho_cmds.EtcReleaseRhoCmd().cmd_strings)
+
+    def test_bundle_virt(self):
+        self._check(rho_cmds.VirtRhoCmd().cmd_strings, exact_stderr=False)
+
+    def test_missing_output(self):
+        marker = ssh_jobs.new_bundle_marker()
+        script = ssh_jobs.bundle_cmd_strings(["echo one", "echo two"], marker)
+        out, err, status = _run(script)
+        # chop it off in the middle of the second command's output
+        out = out[:out.find("two")]
+        results = ssh_jobs.split_bundled_output(out, err, 2, marker)
+        self.assertEquals(("one\n", "", 0), results[0])
+        self.assertEquals((None, None, None), results[1])
+
+
+class TestBundleDeadline(unittest.TestCase):
+
+    def test_follows_markers(self):
+        marker = ssh_jobs.new_bundle_marker()
+        script = ssh_jobs.bundle_cmd_strings(["echo one", "echo two",
+                                              "echo three"], marker)
+        out, err, status = _run(script)
+        deadline = ssh_jobs.BundleDeadline(marker, [10, None, 30])
+        self.assertEquals(10, deadline.current_timeout())
+        # feed it a byte at a time so the markers get split up
+        first_end = out.find("%s:0:end:" % marker) + len(marker) + 7
+        for char in out[:first_end]:
+            deadline.update(char)
+        self.assertEquals(1, deadline.index)
+        self.assertEquals(None, deadline.when())
+        for char in out[first_end:]:
+            deadline.update(char)
+        self.assertEquals(3, deadline.index)
+        self.assertEquals(None, deadline.when())
+        # and noted when each one finished, for the timing
+        self.assertEquals(3, len(deadline.ends))
+        self.assertEquals(sorted(deadline.ends), deadline.ends)
+
+    def test_host_deadline(self):
+        deadline = ssh_jobs.CmdDeadline(None, host_deadline=100)
+        self.assertEquals(100, deadline.when())
+        deadline = ssh_jobs.CmdDeadline(10, host_deadline=1e12)
+        self.assertEquals(deadline.started + 10, deadline.when())
+
+
+class LocalThread(ssh_jobs.SshThread):
+    """ Runs the commands here, noting each one. """
+
+    def __init__(self):
+        ssh_jobs.SshThread.__init__(self, 0, None, None, None)
+        self.ran = []
+
+    def exec_command(self, cmd_string, deadline=None, max_output=0,
+                     line_callback=None, ssh_job=None):
+        self.ran.append(cmd_string)
+        out, err, status = _run(cmd_string)
+        if deadline is not None:
+            deadline.update(out)
+        if line_callback is not None:
+            for line in out.splitlines(True):
+                line_callback(line)
+            out = None
+        return out, err
+
+
+class TestSharedSources(unittest.TestCase):
+
+    cmd_classes = [rho_cmds.CpuRhoCmd, rho_cmds.DmiRhoCmd,
+                   rho_cmds.VirtRhoCmd, rho_cmds.UnameRhoCmd]
+
+    def _scan(self, bundle_cmds):
+        thread = LocalThread()
+        ssh_job = ssh_jobs.SshJob(ip="127.0.0.1", bundle_cmds=bundle_cmds,
+                                  rho_cmds=[cmd_class() for cmd_class
+                                            in self.cmd_classes])
+        thread.run_cmds(ssh_job)
+        return thread, ssh_job
+
+    def _expected(self, rho_cmd):
+        # what it gets running its own commands
+        expected = rho_cmd.__class__()
+        expected.populate_data([_run(cmd_string)[:2]
+                                for cmd_string in expected.cmd_strings])
+        return expected
+
+    def _check(self, bundle_cmds):
+        thread, ssh_job = self._scan(bundle_cmds)
+        # cpu and virt share cpuinfo, and the three dmidecode pipelines
+        # are cut from the one dmidecode
+        self.assertEquals(4, ssh_job.execs_saved)
+        self.assertEquals({}, ssh_job.fetched)
+        for rho_cmd in ssh_job.rho_cmds:
+            expected = self._expected(rho_cmd)
+            if not bundle_cmds:
+                self.assertEquals(expected.data, rho_cmd.data)
+            # error messages from the bundle's shell include the line number
+            self.assertEquals([(out, bool(err)) for out, err
+                               in expected.cmd_results],
+                              [(out, bool(err)) for out, err
+                               in rho_cmd.cmd_results])
+            self.assertEquals(None, rho_cmd.error)
+        return thread
+
+    def test_unbundled(self):
+        thread = self._check(False)
+        self.assertEquals(1, thread.ran.count("cat /proc/cpuinfo"))
+        self.assertEquals(1, thread.ran.count("dmidecode"))
+        total = sum([len(cmd_class().cmd_strings)
+                     for cmd_class in self.cmd_classes])
+        self.assertEquals(total - 4, len(thread.ran))
+
+    def test_bundled(self):
+        thread = self._check(True)
+        self.assertEquals(1, len(thread.ran))
+        self.assertEquals(1, thread.ran[0].count("eval 'cat /proc/cpuinfo'"))
+        self.assertEquals(1, thread.ran[0].count("eval 'dmidecode'"))
+
+    def test_timeout_shared(self):
+        thread = LocalThread()
+        ssh_job = ssh_jobs.SshJob(ip="127.0.0.1",
+                                  rho_cmds=[rho_cmds.CpuRhoCmd(),
+                                            rho_cmds.VirtRhoCmd()])
+
+        def exec_command(cmd_string, deadline=None, max_output=0,
+                         line_callback=None, ssh_job=None):
+            thread.ran.append(cmd_string)
+            raise ssh_jobs.CommandTimeout("", "")
+        thread.exec_command = exec_command
+        thread.run_cmds(ssh_job)
+        # the one that hung didn't get another go
+        self.assertEquals(["cat /proc/cpuinfo"], thread.ran)
+        for rho_cmd in ssh_job.rho_cmds:
+            self.assertEquals(rho_cmds.TIMEOUT_VALUE, rho_cmd.error)
+
+    def test_bundle_timeout_counted_once(self):
+        thread = LocalThread()
+        ssh_job = ssh_jobs.SshJob(ip="127.0.0.1", bundle_cmds=True,
+                                  rho_cmds=[rho_cmds.CpuRhoCmd(),
+                                            rho_cmds.DmiRhoCmd(),
+                                            rho_cmds.UnameRhoCmd(),
+                                            rho_cmds.VirtRhoCmd()])
+        # where uname's first command is in the bundle
+        keys = []
+        for rho_cmd in ssh_job.rho_cmds:
+            for index in range(len(rho_cmd.cmd_strings)):
+                key = ssh_jobs.source_key(rho_cmd, index)[0]
+                if key not in keys:
+                    keys.append(key)
+        hung = keys.index(ssh_job.rho_cmds[2].cmd_strings[0])
+
+        def exec_command(cmd_string, deadline=None, max_output=0,
+                         line_callback=None, ssh_job=None):
+            if thread.ran:
+                return LocalThread.exec_command(thread, cmd_string, deadline,
+                                                max_output, line_callback,
+                                                ssh_job)
+            thread.ran.append(cmd_string)
+            out, err, status = _run(cmd_string)
+            # it hangs on uname
+            out = out[:out.find("%s:%s:begin" % (deadline.marker, hung))]
+            deadline.update(out)
+            raise ssh_jobs.CommandTimeout(out, err)
+        thread.exec_command = exec_command
+        thread.run_cmds(ssh_job)
+
+        cpu, dmi, uname, virt = ssh_job.rho_cmds
+        self.assertEquals(None, cpu.error)
+        self.assertEquals(None, dmi.error)
+        self.assertEquals(rho_cmds.TIMEOUT_VALUE, uname.error)
+        # virt got run again on its own, with what it shared from the
+        # bundle, and none of that is counted again
+        self.assertEquals(None, virt.error)
+        self.assertEquals(len(virt.cmd_strings) - 3, len(thread.ran) - 1)
+        self.assertEquals(4, ssh_job.execs_saved)
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+import errno
+import socket
+import threading
+import unittest
+
+from rho import ssh_jobs
+
+
+class TestConcurrencyController(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = ssh_jobs.ConcurrencyController(100, start=10,
+                                                         window=10)
+
+    def _record(self, count, latency=0.1, congested=False):
+        for i in range(count):
+            if congested:
+                self.controller.record(congested=True)
+            else:
+                self.controller.record(latency=latency)
+
+    def test_slow_start(self):
+        self._record(10)
+        self.assertEquals(20, self.controller.limit)
+        self._record(10)
+        self.assertEquals(40, self.controller.limit)
+
+    def test_max(self):
+        self._record(100)
+        self.assertEquals(100, self.controller.limit)
+
+    def test_back_off(self):
+        self._record(10)
+        self._record(5)
+        self._record(5, congested=True)
+        self.assertEquals(10, self.controller.limit)
+        # additive from here on
+        self._record(10)
+        self.assertEquals(11, self.controller.limit)
+
+    def test_latency_back_off(self):
+        self._record(10)
+        self._record(10, latency=1.0)
+        self.assertEquals(10, self.controller.limit)
+
+    def test_min(self):
+        self._record(100, congested=True)
+        self.assertEquals(1, self.controller.limit)
+
+    def test_acquire_blocks(self):
+        controller = ssh_jobs.ConcurrencyController(10, start=1)
+        controller.acquire()
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(
+            controller.acquire()))
+        thread.start()
+        thread.join(0.1)
+        self.assertEquals([], acquired)
+        controller.release()
+        thread.join(1)
+        self.assertEquals([None], acquired)
+
+
+class TestIsCongestion(unittest.TestCase):
+
+    def setUp(self):
+        self.ssh_job = ssh_jobs.SshJob(ip="10.0.0.1", rho_cmds=[])
+
+    def test_timeout(self):
+        self.assertFalse(ssh_jobs._is_congestion(self.ssh_job,
+                                                 socket.timeout()))
+        self.ssh_job.probed = True
+        self.assertTrue(ssh_jobs._is_congestion(self.ssh_job,
+                                                socket.timeout()))
+
+    def test_reset(self):
+        self.assertTrue(ssh_jobs._is_congestion(
+            self.ssh_job, socket.error(errno.ECONNRESET, "Connection reset by peer")))
+        self.assertFalse(ssh_jobs._is_congestion(
+            self.ssh_job, socket.error(errno.ECONNREFUSED, "Connection refused")))
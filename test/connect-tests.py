@@ -0,0 +1,219 @@
+#!/usr/bin/python
+
+import errno
+import socket
+import StringIO
+import unittest
+
+import paramiko
+
+from rho import config
+from rho import scan_report
+from rho import ssh_jobs
+
+
+class ResetTransport(object):
+    """ An sshd at MaxStartups: takes the connection, then resets it. """
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def start_client(self, timeout=None):
+        raise socket.error(errno.ECONNRESET, "Connection reset by peer")
+
+    def close(self):
+        self.sock.close()
+
+
+class TestConnect(unittest.TestCase):
+
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+        self.auth = config.SshAuth({'name': 'auth', 'username': 'root',
+                                    'password': 'pw', 'type': 'ssh'})
+        self.transport_class = paramiko.Transport
+
+    def tearDown(self):
+        paramiko.Transport = self.transport_class
+        self.listener.close()
+
+    def _connect(self, port):
+        ssh_job = ssh_jobs.SshJob(ip="127.0.0.1", ports=[port],
+                                  auths=[self.auth], rho_cmds=[], timeout=5)
+        thread = ssh_jobs.SshThread(0, None, None, None)
+        thread.connect(ssh_job)
+        return ssh_job
+
+    def test_reset_in_handshake_is_not_unreachable(self):
+        paramiko.Transport = ResetTransport
+        ssh_job = self._connect(self.port)
+        self.assertTrue(ssh_job.error)
+        self.assertTrue(ssh_job.listening)
+        self.assertFalse(ssh_job.unreachable)
+
+    def test_nothing_listening(self):
+        self.listener.close()
+        ssh_job = self._connect(self.port)
+        self.assertFalse(ssh_job.listening)
+        self.assertTrue(ssh_job.unreachable)
+
+
+class FakeServer(object):
+    """ The sshd the StubTransports all talk to. """
+
+    def __init__(self, logins=(), max_tries=6, hangups=()):
+        # (username, password or key) that get us in
+        self.logins = logins
+        # failures before it hangs up on a connection, like MaxAuthTries
+        self.max_tries = max_tries
+        # which attempts, counting from 1 over all connections, it hangs
+        # up in the middle of
+        self.hangups = hangups
+        self.handshakes = 0
+        # (method, username, password or key)
+        self.attempts = []
+
+
+class StubTransport(object):
+
+    server = None
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.active = True
+        self.username = None
+        self.failures = 0
+
+    def start_client(self, timeout=None):
+        self.server.handshakes = self.server.handshakes + 1
+
+    def is_active(self):
+        return self.active
+
+    def close(self):
+        self.active = False
+        self.sock.close()
+
+    def _attempt(self, method, username, secret):
+        server = self.server
+        server.attempts.append((method, username, secret))
+        if len(server.attempts) in server.hangups:
+            self.active = False
+            raise EOFError()
+        if self.username not in (None, username):
+            # sshd won't let us switch users on a connection
+            self.active = False
+            raise paramiko.SSHException("no switching users")
+        self.username = username
+        if (username, secret) in server.logins:
+            return
+        self.failures = self.failures + 1
+        if self.failures >= server.max_tries:
+            self.active = False
+        raise paramiko.AuthenticationException()
+
+    def auth_password(self, username, password):
+        self._attempt("password", username, password)
+
+    def auth_publickey(self, username, key):
+        self._attempt("publickey", username, key.get_base64())
+
+
+class TestAuths(unittest.TestCase):
+
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(50)
+        self.port = self.listener.getsockname()[1]
+        self.transport_class = paramiko.Transport
+        paramiko.Transport = StubTransport
+
+    def tearDown(self):
+        paramiko.Transport = self.transport_class
+        StubTransport.server = None
+        self.listener.close()
+
+    def _auth(self, name, username, password):
+        return config.SshAuth({'name': name, 'username': username,
+                               'password': password, 'type': 'ssh'})
+
+    def _connect(self, server, auths):
+        StubTransport.server = server
+        ssh_job = ssh_jobs.SshJob(ip="127.0.0.1", ports=[self.port],
+                                  auths=auths, rho_cmds=[], timeout=5)
+        thread = ssh_jobs.SshThread(0, None, None, None, show_attempts=False)
+        thread.connect(ssh_job)
+        if thread.transport is not None:
+            thread.transport.close()
+        return ssh_job
+
+    def _handshakes_saved(self, ssh_job):
+        report = scan_report.ScanReport()
+        report.add(ssh_job)
+        return report.ips[ssh_job.ip]['ssh.handshakes_saved']
+
+    def test_one_handshake(self):
+        server = FakeServer(logins=[("root", "right")])
+        ssh_job = self._connect(server, [self._auth("a", "root", "wrong"),
+                                         self._auth("b", "root", "wrong too"),
+                                         self._auth("c", "root", "right")])
+        self.assertEquals("c", ssh_job.auth.name)
+        self.assertEquals(1, server.handshakes)
+        self.assertEquals(1, ssh_job.handshakes)
+        self.assertEquals(3, ssh_job.auth_attempts)
+        self.assertEquals(2, self._handshakes_saved(ssh_job))
+
+    def test_hangup_mid_auth(self):
+        # it hangs up while we're trying b, which gets another go
+        server = FakeServer(logins=[("root", "right")], hangups=[2])
+        ssh_job = self._connect(server, [self._auth("a", "root", "wrong"),
+                                         self._auth("b", "root", "right")])
+        self.assertEquals("b", ssh_job.auth.name)
+        self.assertEquals(2, server.handshakes)
+        self.assertEquals(2, ssh_job.handshakes)
+        self.assertEquals(3, ssh_job.auth_attempts)
+        self.assertEquals(ssh_job.auth_attempts - ssh_job.handshakes,
+                          self._handshakes_saved(ssh_job))
+
+    def test_max_auth_tries(self):
+        server = FakeServer(logins=[("root", "right")], max_tries=2)
+        ssh_job = self._connect(server, [self._auth("a", "root", "wrong"),
+                                         self._auth("b", "root", "wrong"),
+                                         self._auth("c", "root", "right")])
+        self.assertEquals("c", ssh_job.auth.name)
+        self.assertEquals(2, server.handshakes)
+        self.assertEquals(1, self._handshakes_saved(ssh_job))
+
+    def test_username_change(self):
+        server = FakeServer(logins=[("admin", "right")])
+        ssh_job = self._connect(server, [self._auth("a", "root", "wrong"),
+                                         self._auth("b", "admin", "right")])
+        self.assertEquals("b", ssh_job.auth.name)
+        self.assertEquals(2, server.handshakes)
+        self.assertEquals(0, self._handshakes_saved(ssh_job))
+
+    def test_all_fail(self):
+        server = FakeServer()
+        ssh_job = self._connect(server, [self._auth("a", "root", "wrong"),
+                                         self._auth("b", "root", "wrong")])
+        self.assertTrue(ssh_job.auth_failed)
+        self.assertFalse(ssh_job.unreachable)
+        self.assertEquals(1, server.handshakes)
+
+    def test_key_passphrase_not_sent(self):
+        key = paramiko.RSAKey.generate(1024)
+        key_file = StringIO.StringIO()
+        key.write_private_key(key_file, password="passphrase")
+        auth = config.SshKeyAuth({'name': 'key-for-key-test',
+                                  'username': 'root', 'type': 'ssh_key',
+                                  'key': key_file.getvalue(),
+                                  'password': 'passphrase'})
+        server = FakeServer()
+        ssh_job = self._connect(server, [auth])
+        self.assertTrue(ssh_job.auth_failed)
+        self.assertEquals([("publickey", "root", key.get_base64())],
+                          server.attempts)
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import simplejson as json
+
+from rho import config
+from rho import metrics
+from rho import rho_cmds
+from rho import scan_report
+from rho import ssh_jobs
+
+
+def make_job(ip, auth=None, error=None, unreachable=False, auth_failed=False,
+             skipped=False, rho_cmds=[]):
+    job = ssh_jobs.SshJob(ip=ip, ports=[22], rho_cmds=rho_cmds, auths=[])
+    job.port = 22
+    job.auth = auth
+    job.error = error
+    job.unreachable = unreachable
+    job.auth_failed = auth_failed
+    job.skipped = skipped
+    job.handshakes = 1
+    job.auth_attempts = 1
+    job.duration = 1.5
+    job.timing = {'connect': 0.05, 'cmd.uname': 0.2}
+    job.auth_timing = [('auth', 0.1)]
+    job.bytes_received = 100
+    job.execs_saved = 4
+    return job
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        auth = config.SshAuth({'name': 'auth', 'username': 'root',
+                               'password': 'pw', 'type': 'ssh'})
+        timed_out = rho_cmds.UnameRhoCmd()
+        timed_out.populate_timeout()
+        self.report = scan_report.ScanReport()
+        self.report.add(make_job("10.0.0.1", auth,
+                                rho_cmds=[rho_cmds.UnameRhoCmd()]))
+        self.report.add(make_job("10.0.0.2", auth, rho_cmds=[timed_out]))
+        self.report.add(make_job("10.0.0.3", error="login failed",
+                                auth_failed=True))
+        self.report.add(make_job("10.0.0.4", error="unable to connect",
+                                unreachable=True))
+        self.report.add(make_job("10.0.0.5", error="skipped", skipped=True))
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_counts(self):
+        hosts = self.report.metrics.hosts
+        self.assertEquals(4, hosts['attempted'])
+        self.assertEquals(2, hosts['succeeded'])
+        self.assertEquals(1, hosts['auth_failed'])
+        self.assertEquals(1, hosts['unreachable'])
+        self.assertEquals(1, hosts['skipped'])
+        self.assertEquals(0, hosts['failed'])
+        self.assertEquals(400, self.report.metrics.bytes_received)
+        self.assertEquals(16, self.report.metrics.execs_saved)
+        self.assertEquals({'uname': {rho_cmds.TIMEOUT_VALUE: 1}},
+                          self.report.metrics.cmd_errors)
+
+    def test_merge(self):
+        other = scan_report.ScanReport()
+        other.add(make_job("10.0.1.1", error="unable to connect",
+                          unreachable=True))
+        self.report.merge(other)
+        self.assertEquals(5, self.report.metrics.hosts['attempted'])
+        self.assertEquals(2, self.report.metrics.hosts['unreachable'])
+        self.assertEquals(500, self.report.metrics.bytes_received)
+        self.assertEquals(20, self.report.metrics.execs_saved)
+
+    def test_json(self):
+        path = os.path.join(self.dir, "rho.json")
+        metrics.write(self.report, path, metrics.JSON_FORMAT, 12.5)
+        data = json.load(open(path))
+        self.assertEquals(12.5, data['scan_duration'])
+        self.assertEquals(2, data['hosts']['succeeded'])
+        self.assertEquals(16, data['execs_saved'])
+        uname = data['commands']['uname']
+        self.assertEquals({rho_cmds.TIMEOUT_VALUE: 1}, uname['errors'])
+        self.assertEquals(5, uname['latency']['count'])
+        self.assertEquals(5, uname['latency']['buckets']['0.5'])
+        self.assertEquals(0, uname['latency']['buckets']['0.1'])
+        # one auth attempt each
+        self.assertEquals(5, data['phases']['auth']['count'])
+        self.assertEquals(["auth", "connect", "total"],
+                          sorted(data['phases'].keys()))
+
+    def test_prometheus(self):
+        path = os.path.join(self.dir, "rho.prom")
+        metrics.write(self.report, path, metrics.PROMETHEUS_FORMAT, 12.5)
+        lines = open(path).read().splitlines()
+        self.assertTrue('rho_last_scan_hosts{result="succeeded"} 2' in lines)
+        self.assertTrue('# TYPE rho_last_scan_hosts gauge' in lines)
+        self.assertTrue('rho_last_scan_bytes_received 400' in lines)
+        self.assertTrue('rho_last_scan_execs_saved 16' in lines)
+        self.assertTrue('rho_scan_duration_seconds 12.5' in lines)
+        self.assertTrue('rho_last_scan_cmd_errors{cmd="uname",error="timeout"} 1'
+                        in lines)
+        self.assertTrue('rho_cmd_duration_seconds_bucket{cmd="uname",le="0.1"} 0'
+                        in lines)
+        self.assertTrue('rho_cmd_duration_seconds_bucket{cmd="uname",le="+Inf"} 5'
+                        in lines)
+        self.assertTrue('rho_phase_duration_seconds_count{phase="connect"} 5'
+                        in lines)
+        # and nothing left lying around
+        self.assertEquals(["rho.prom"], os.listdir(self.dir))
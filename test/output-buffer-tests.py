@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+import os
+import resource
+import socket
+import unittest
+
+from rho import ssh_jobs
+
+
+class TestOutputBuffer(unittest.TestCase):
+
+    def test_keeps_output(self):
+        buf = ssh_jobs.OutputBuffer()
+        self.assertTrue(buf.write("one\ntw"))
+        self.assertTrue(buf.write("o\n"))
+        buf.close()
+        self.assertEquals("one\ntwo\n", buf.getvalue())
+
+    def test_max_bytes(self):
+        buf = ssh_jobs.OutputBuffer(max_bytes=5)
+        self.assertTrue(buf.write("12345"))
+        self.assertFalse(buf.write("6"))
+
+    def test_lines(self):
+        output = "first\nsec\r\nthird\n\nlast, no newline"
+        lines = []
+        buf = ssh_jobs.OutputBuffer(line_callback=lines.append)
+        # a byte at a time, so lines get split every way they can be
+        for char in output:
+            buf.write(char)
+        buf.close()
+        self.assertEquals(output.splitlines(), lines)
+        self.assertEquals(None, buf.getvalue())
+
+
+class FakeChannel(object):
+    """ Has nothing the first time it's asked, then output. """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.output = {'stdout': [None, "some output\n", ""],
+                       'stderr': [None, ""]}
+
+    def fileno(self):
+        return self.fd
+
+    def settimeout(self, timeout):
+        pass
+
+    def _recv(self, stream):
+        data = self.output[stream].pop(0)
+        if data is None:
+            raise socket.timeout()
+        return data
+
+    def recv(self, size):
+        return self._recv('stdout')
+
+    def recv_stderr(self, size):
+        return self._recv('stderr')
+
+
+class TestReadOutput(unittest.TestCase):
+
+    def test_high_fd(self):
+        # past FD_SETSIZE, where select() gives up
+        fd = 1500
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft <= fd:
+            if hard != resource.RLIM_INFINITY and hard <= fd:
+                return
+            resource.setrlimit(resource.RLIMIT_NOFILE, (fd + 1, hard))
+        r, w = os.pipe()
+        os.dup2(r, fd)
+        try:
+            os.write(w, "x")
+            thread = ssh_jobs.SshThread(0, None, None, None)
+            stdout = ssh_jobs.OutputBuffer()
+            stderr = ssh_jobs.OutputBuffer()
+            thread.read_output(FakeChannel(fd), ssh_jobs.CmdDeadline(10),
+                               stdout, stderr)
+            self.assertEquals("some output\n", stdout.getvalue())
+            self.assertEquals("", stderr.getvalue())
+        finally:
+            for each in (fd, r, w):
+                os.close(each)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
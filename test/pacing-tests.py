@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+import threading
+import time
+import unittest
+
+from rho import ssh_jobs
+
+
+def make_job(ip):
+    return ssh_jobs.SshJob(ip=ip, ports=[22], rho_cmds=[], auths=[])
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_rate(self):
+        bucket = ssh_jobs.TokenBucket(50, burst=1)
+        start = time.time()
+        for i in range(11):
+            bucket.take()
+        # the first one is free, the other ten are 1/50th of a second each
+        self.assertTrue(time.time() - start >= 0.19)
+
+    def test_burst(self):
+        bucket = ssh_jobs.TokenBucket(1, burst=5)
+        start = time.time()
+        for i in range(5):
+            bucket.take()
+        self.assertTrue(time.time() - start < 0.5)
+
+
+class TestSubnetScheduler(unittest.TestCase):
+
+    def _ips(self, subnets, hosts):
+        ips = []
+        for subnet in range(subnets):
+            for host in range(1, hosts + 1):
+                ips.append("10.0.%s.%s" % (subnet, host))
+        return ips
+
+    def test_interleave(self):
+        scheduler = ssh_jobs.SubnetScheduler(max_per_subnet=10)
+        ips = [job.ip for job in
+               scheduler.jobs([make_job(ip) for ip in self._ips(3, 2)])]
+        self.assertEquals(["10.0.0.1", "10.0.1.1", "10.0.2.1",
+                           "10.0.0.2", "10.0.1.2", "10.0.2.2"], ips)
+
+    def test_max_per_subnet(self):
+        scheduler = ssh_jobs.SubnetScheduler(max_per_subnet=2)
+        jobs = scheduler.jobs([make_job(ip) for ip in self._ips(2, 3)])
+        handed_out = [jobs.next() for i in range(4)]
+        self.assertEquals(["10.0.0.1", "10.0.1.1", "10.0.0.2", "10.0.1.2"],
+                          [job.ip for job in handed_out])
+
+        # both subnets are full, so the next one has to wait for a done()
+        timer = threading.Timer(0.2, scheduler.done, [handed_out[1]])
+        start = time.time()
+        timer.start()
+        self.assertEquals("10.0.1.3", jobs.next().ip)
+        self.assertTrue(time.time() - start >= 0.15)
+        timer.join()
+
+    def test_window(self):
+        # with no look ahead, we just go in order
+        scheduler = ssh_jobs.SubnetScheduler(max_per_subnet=1, window=1)
+        ips = []
+        for job in scheduler.jobs([make_job(ip) for ip in self._ips(2, 2)]):
+            ips.append(job.ip)
+            scheduler.done(job)
+        self.assertEquals(["10.0.0.1", "10.0.0.2", "10.0.1.1", "10.0.1.2"],
+                          ips)
+
+
+class FakeAuth(object):
+
+    def __init__(self, name):
+        self.name = name
+
+
+class TestAuthLearner(unittest.TestCase):
+
+    def setUp(self):
+        self.learner = ssh_jobs.AuthLearner()
+        self.auths = [FakeAuth(name) for name in ["a", "b", "c"]]
+
+    def _order(self, ip, port=22, keep_first=False):
+        return [auth.name for auth in
+                self.learner.order(ip, port, self.auths, keep_first)]
+
+    def test_nothing_learned(self):
+        self.assertEquals(["a", "b", "c"], self._order("10.0.0.1"))
+
+    def test_learns_per_subnet_and_port(self):
+        self.learner.record("10.0.0.1", 22, self.auths[2])
+        self.learner.record("10.0.0.2", 22, self.auths[2])
+        self.learner.record("10.0.0.3", 22, self.auths[1])
+        self.assertEquals(["c", "b", "a"], self._order("10.0.0.200"))
+        self.assertEquals(["a", "b", "c"], self._order("10.0.1.1"))
+        self.assertEquals(["a", "b", "c"], self._order("10.0.0.200", 2222))
+
+    def test_keep_first(self):
+        self.learner.record("10.0.0.1", 22, self.auths[2])
+        self.assertEquals(["a", "c", "b"],
+                          self._order("10.0.0.2", keep_first=True))
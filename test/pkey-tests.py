@@ -0,0 +1,48 @@
+#!/usr/bin/python
+
+import StringIO
+import unittest
+
+import paramiko
+
+from rho import config
+from rho import ssh_jobs
+
+
+class TestPkeyCache(unittest.TestCase):
+
+    key = paramiko.RSAKey.generate(1024)
+
+    def setUp(self):
+        ssh_jobs._pkey_cache.clear()
+
+    def _auth(self, name, passphrase=None, password=None):
+        key_data = StringIO.StringIO()
+        self.key.write_private_key(key_data, password=passphrase)
+        auth_dict = {'name': name, 'username': 'rho', 'type': 'ssh_key',
+                     'key': key_data.getvalue()}
+        if password is not None:
+            auth_dict['password'] = password
+        return config.SshKeyAuth(auth_dict)
+
+    def test_password_auth(self):
+        auth = config.SshAuth({'name': 'pw', 'username': 'rho',
+                               'password': 'pw', 'type': 'ssh'})
+        self.assertEquals(None, ssh_jobs.get_pkey(auth))
+
+    def test_cached(self):
+        auth = self._auth("plain")
+        pkey = ssh_jobs.get_pkey(auth)
+        self.assertEquals(self.key, pkey)
+        self.assertTrue(pkey is ssh_jobs.get_pkey(auth))
+
+    def test_passphrase(self):
+        auth = self._auth("secret", passphrase="sekrit", password="sekrit")
+        self.assertEquals([], ssh_jobs.load_pkeys([auth]))
+        self.assertEquals(self.key, ssh_jobs.get_pkey(auth))
+
+    def test_bad_passphrase(self):
+        auth = self._auth("secret", passphrase="sekrit", password="wrong")
+        self.assertEquals([auth], ssh_jobs.load_pkeys([auth]))
+        # still failed, without having to decrypt again
+        self.assertRaises(paramiko.SSHException, ssh_jobs.get_pkey, auth)
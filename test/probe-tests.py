@@ -0,0 +1,46 @@
+#!/usr/bin/python
+
+import socket
+import unittest
+
+from rho import probe
+
+
+class TestProbe(unittest.TestCase):
+
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.open_port = self.listener.getsockname()[1]
+
+        # grab a port, then let it go, so nothing is listening on it
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(("127.0.0.1", 0))
+        self.closed_port = closed.getsockname()[1]
+        closed.close()
+
+    def tearDown(self):
+        self.listener.close()
+
+    def test_open_and_closed(self):
+        endpoints = [("127.0.0.1", self.open_port),
+                     ("127.0.0.1", self.closed_port)]
+        self.assertEquals(set([("127.0.0.1", self.open_port)]),
+                          probe.probe(endpoints, 2))
+
+    def test_hostname(self):
+        endpoints = [("localhost", self.open_port)]
+        self.assertEquals(set(endpoints), probe.probe(endpoints, 2))
+
+    def test_bad_hostname(self):
+        self.assertEquals(set(), probe.probe([("no.such.host.invalid", 22)], 2))
+
+    def test_more_than_max_sockets(self):
+        endpoints = [("127.0.0.1", self.open_port)] * 5 + \
+            [("127.0.0.1", self.closed_port)] * 5
+        self.assertEquals(set([("127.0.0.1", self.open_port)]),
+                          probe.probe(endpoints, 2, max_sockets=2))
+
+    def test_empty(self):
+        self.assertEquals(set(), probe.probe([], 2))
@@ -0,0 +1,52 @@
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+
+from rho import profiling
+
+
+def busy():
+    return sum([i * i for i in range(10000)])
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_prepare(self):
+        path = os.path.join(self.dir, "profile")
+        self.assertEquals(path, profiling.prepare(path))
+        stale = os.path.join(path, "rho-1.pstats")
+        open(stale, "w").close()
+        profiling.prepare(path)
+        self.assertFalse(os.path.exists(stale))
+
+    def test_threads_merged(self):
+        profiler = profiling.Profiler(self.dir)
+        threads = [profiler.wrap(threading.Thread(target=busy))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        profiler.runcall(busy)
+        profiler.dump()
+
+        stats_path, summary_path = profiling.merge(self.dir)
+        self.assertEquals(sorted([profiling.SUMMARY_FILE, profiling.STATS_FILE]),
+                          sorted(os.listdir(self.dir)))
+        stats = pstats.Stats(stats_path)
+        calls = [value[1] for key, value in stats.stats.items()
+                 if key[2] == "busy"]
+        self.assertEquals([4], calls)
+        self.assertTrue("busy" in open(summary_path).read())
+
+    def test_nothing_to_merge(self):
+        self.assertEquals(None, profiling.merge(self.dir))
@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rho import config
+from rho import recording
+from rho import rho_cmds
+from rho import scan_report
+from rho import ssh_jobs
+
+UNAME_OUTPUT = [("Linux\n", ""), ("2.6.32\n", ""), ("x86_64\n", ""),
+                ("x86_64\n", ""), ("host1\n", ""), ("x86_64\n", "")]
+PACKAGES_OUTPUT = [("bash|4.2|1.el7|1500000000|Red Hat, Inc.|1400000000|"
+                    "x86-01.build.redhat.com|bash-4.2.src.rpm|GPLv3+|"
+                    "Red Hat, Inc.|Fri Jul 14 2017|Tue May 13 2014\n"
+                    "caf\xe9|1|1|1500000001|Someone|1400000001|"
+                    "build.example.com|cafe.src.rpm|MIT|Someone|"
+                    "Fri Jul 14 2017|Tue May 13 2014\n", "")]
+
+
+class TestRecording(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "scan.rec")
+
+        auth = config.SshAuth({'name': 'auth', 'username': 'root',
+                               'password': 'secret', 'type': 'ssh'})
+        uname = rho_cmds.UnameRhoCmd()
+        uname.populate_data(UNAME_OUTPUT)
+        packages = rho_cmds.RedhatPackagesRhoCmd()
+        packages.populate_data(PACKAGES_OUTPUT)
+        timed_out = rho_cmds.CpuRhoCmd()
+        timed_out.populate_timeout()
+        self.job = ssh_jobs.SshJob(ip="10.0.0.1", auths=[auth],
+                                   rho_cmds=[uname, packages, timed_out])
+        self.job.port = 22
+        self.job.auth = auth
+        self.job.duration = 1.5
+        self.job.add_time("connect", 0.05)
+        self.job.auth_timing = [("auth", 0.1)]
+
+        self.failed = ssh_jobs.SshJob(ip="10.0.0.2", auths=[auth],
+                                      rho_cmds=[rho_cmds.UnameRhoCmd()])
+        self.failed.error = "unable to connect"
+        self.failed.unreachable = True
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def record(self, *ssh_jobs):
+        recorder = recording.Recorder(self.path)
+        for ssh_job in ssh_jobs:
+            recorder.write(ssh_job)
+        recorder.close()
+
+    def report(self, ssh_jobs):
+        report = scan_report.ScanReport()
+        for ssh_job in ssh_jobs:
+            report.add(ssh_job)
+        return report
+
+    def test_replay_matches_scan(self):
+        self.record(self.job, self.failed)
+        replayed = [recording.from_record(record)
+                    for record in recording.read(self.path)]
+        self.assertEquals(2, len(replayed))
+
+        scanned = self.report([self.job, self.failed])
+        report = self.report(replayed)
+        for ip in scanned.ips:
+            for field, value in scanned.ips[ip].items():
+                if field == 'auth.password':
+                    continue
+                self.assertEquals(value, report.ips[ip][field])
+        self.assertEquals(scanned.metrics.hosts, report.metrics.hosts)
+
+    def test_output_bytes_kept(self):
+        self.record(self.job)
+        replayed = recording.from_record(list(recording.read(self.path))[0])
+        self.assertEquals(PACKAGES_OUTPUT, replayed.rho_cmds[1].cmd_results)
+        self.assertTrue(isinstance(replayed.rho_cmds[1].cmd_results[0][0],
+                                   str))
+
+    def test_no_password(self):
+        self.record(self.job)
+        record = list(recording.read(self.path))[0]
+        self.assertFalse('password' in record['auth'])
+        self.assertEquals("", recording.from_record(record).auth.password)
+
+    def test_errors_replayed(self):
+        self.record(self.job)
+        replayed = recording.from_record(list(recording.read(self.path))[0])
+        self.assertEquals(rho_cmds.TIMEOUT_VALUE, replayed.rho_cmds[2].error)
+        self.assertEquals(rho_cmds.TIMEOUT_VALUE,
+                          replayed.rho_cmds[2].data['cpu.count'])
+
+    def test_appends(self):
+        self.record(self.job)
+        self.record(self.failed)
+        ips = [record['ip'] for record in recording.read(self.path)]
+        self.assertEquals(["10.0.0.1", "10.0.0.2"], ips)
+
+    def test_short_last_record(self):
+        self.record(self.job, self.failed)
+        size = os.path.getsize(self.path)
+        fileobj = open(self.path, "r+b")
+        fileobj.truncate(size - 10)
+        fileobj.close()
+        ips = [record['ip'] for record in recording.read(self.path)]
+        self.assertEquals(["10.0.0.1"], ips)
+
+    def test_bad_record(self):
+        fileobj = open(self.path, "wb")
+        fileobj.write(recording.LENGTH.pack(5) + "junk!")
+        fileobj.close()
+        self.assertRaises(recording.RecordingError, list,
+                          recording.read(self.path))
+
+    def test_unknown_cmds_left_out(self):
+        self.record(self.job)
+        record = list(recording.read(self.path))[0]
+        replayed = recording.from_record(record, [rho_cmds.UnameRhoCmd])
+        self.assertEquals(["uname"],
+                          [rho_cmd.name for rho_cmd in replayed.rho_cmds])
+
+
+class TestOutputThread(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "scan.rec")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_unrecordable_host_still_reported(self):
+        recorder = recording.Recorder(self.path)
+        thread = ssh_jobs.OutputThread(recorder=recorder)
+        thread.start()
+        ssh_job = ssh_jobs.SshJob(ip="10.0.0.1", rho_cmds=[])
+        # not UTF-8, so there's no JSON for it
+        ssh_job.error = "unable to connect: \xff\xfe"
+        ssh_job.unreachable = True
+        thread.out_queue.put(ssh_job)
+        ok = ssh_jobs.SshJob(ip="10.0.0.2", rho_cmds=[], auths=[])
+        ok.auth = config.SshAuth({'name': 'auth', 'username': 'root',
+                                  'password': 'secret', 'type': 'ssh'})
+        thread.out_queue.put(ok)
+        thread.out_queue.put("quit")
+        thread.join(10)
+        recorder.close()
+        self.assertFalse(thread.isAlive())
+        self.assertEquals(["10.0.0.1", "10.0.0.2"],
+                          sorted(thread.report.ips.keys()))
+
+
+class TestKeepOutput(unittest.TestCase):
+
+    def test_line_parsers_not_streamed(self):
+        thread = ssh_jobs.SshThread(0, None, None, None)
+        ssh_job = ssh_jobs.SshJob(ip="10.0.0.1", rho_cmds=[])
+        packages = rho_cmds.RedhatPackagesRhoCmd()
+        self.assertTrue(thread.line_callback(ssh_job, packages, 0))
+        ssh_job.keep_output = True
+        self.assertEquals(None, thread.line_callback(ssh_job, packages, 0))
@@ -38,6 +38,13 @@ class _TestRhoCmd(unittest.TestCase):
 class TestUnameCmd(_TestRhoCmd):
     cmd_class = rho_cmds.UnameRhoCmd
 
+    def test_populate_timeout(self):
+        self.rho_cmd.populate_timeout()
+        self.assertEquals(sorted(self.rho_cmd.fields.keys()),
+                          sorted(self.rho_cmd.data.keys()))
+        for value in self.rho_cmd.data.values():
+            self.assertEquals(rho_cmds.TIMEOUT_VALUE, value)
+
     def test_data_display(self):
         self.rho_cmd.populate_data(self.out)
         print "uname: %(uname.os)s\n hostname:%(uname.hostname)s\n%(uname.processor)s\n" % self.rho_cmd.data
@@ -134,3 +141,164 @@ class TestRedHatPackagesRhoCmd(_TestRhoCmd):
     def test_last_built(self):
         self.rho_cmd.populate_data(self.out)
         print "redhat-packages.last_built: %(redhat-packages.last_built)s" % self.rho_cmd.data
+
+    rpm_output = ("bash|4.1.2|15.el6|1300000002|Red Hat, Inc.|1200000001|x86-01.bos.redhat.com|bash.src.rpm|GPL|Red Hat|Tue 01|Wed 01\n"
+                  "zsh|4.3|1.fc12|1300000009|Fedora|1200000009|x86-02.fedoraproject.org|zsh.src.rpm|GPL|Fedora|Tue 02|Wed 02\n"
+                  "glibc|2.12|1.el6|1300000001|Red Hat, Inc.|1200000005|x86-03.bos.redhat.com|glibc.src.rpm|LGPL|Red Hat|Tue 03|Wed 03\n")
+
+    def test_lines_match_whole_output(self):
+        whole = self.cmd_class()
+        whole.populate_data([(self.rpm_output, "")])
+
+        streamed = self.cmd_class()
+        for line in self.rpm_output.splitlines():
+            streamed.parse_line(0, line)
+        streamed.populate_data([(None, "")])
+
+        self.assertEquals(whole.data, streamed.data)
+        self.assertEquals(3, streamed.data['redhat-packages.num_installed_packages'])
+        self.assertEquals(2, streamed.data['redhat-packages.num_rh_packages'])
+        self.assertEquals("bash-4.1.2-15.el6 Installed: Tue 01",
+                          streamed.data['redhat-packages.last_installed'])
+        self.assertEquals("glibc-2.12-1.el6 Built: Wed 03",
+                          streamed.data['redhat-packages.last_built'])
+
+    def test_short_lines_skipped(self):
+        rho_cmd = self.cmd_class()
+        rho_cmd.populate_data([("bash|4.1.2|15.el6\n\n" + self.rpm_output +
+                                "glibc|2.12|1.el6|1300000001|Red Hat, Inc.|\n",
+                                "")])
+        self.assertEquals(3, rho_cmd.data['redhat-packages.num_installed_packages'])
+        self.assertEquals(3, rho_cmd.bad_lines)
+        self.assertEquals("bash-4.1.2-15.el6 Installed: Tue 01",
+                          rho_cmd.data['redhat-packages.last_installed'])
+
+    def test_no_packages(self):
+        rho_cmd = self.cmd_class()
+        rho_cmd.populate_data([("", "")])
+        self.assertEquals("", rho_cmd.data['redhat-packages.is_redhat'])
+        self.assertEquals(0, rho_cmd.data['redhat-packages.num_installed_packages'])
+        self.assertEquals("", rho_cmd.data['redhat-packages.last_built'])
+
+
+class TestDataSources(unittest.TestCase):
+
+    dmidecode = ("# dmidecode 3.2\n"
+                 "SMBIOS 3.0.0 present.\n"
+                 "\n"
+                 "Handle 0x0100, DMI type 1, 27 bytes\n"
+                 "System Information\n"
+                 "\tManufacturer: Dell Inc.\n"
+                 "\tProduct Name: PowerEdge R640\n"
+                 "\n"
+                 "Handle 0x0300, DMI type 3, 22 bytes\n"
+                 "Chassis Information\n"
+                 "\tManufacturer: Dell Inc.\n"
+                 "\n"
+                 "Handle 0x0400, DMI type 4, 48 bytes\n"
+                 "Processor Information\n"
+                 "\tSocket Designation: CPU1\n"
+                 "\tManufacturer: Intel\n"
+                 "\n"
+                 "Handle 0x0401, DMI type 4, 48 bytes\n"
+                 "Processor Information\n"
+                 "\tSocket Designation: CPU2\n"
+                 "\n"
+                 "Handle 0x0700, DMI type 7, 27 bytes\n"
+                 "Cache Information\n"
+                 "\tSocket Designation: L1 Cache\n")
+
+    def _pipeline(self, cmd_string, dmidecode):
+        # the rho_cmd's own grep and sed, over output we already have
+        cmd_string = cmd_string.replace("dmidecode | ", "", 1)
+        p = subprocess.Popen(cmd_string, shell=True, stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return p.communicate(dmidecode)[0]
+
+    def _check(self, rho_cmd, index, dmidecode):
+        name, function = rho_cmd.sources[index]
+        self.assertEquals("dmidecode-full", name)
+        self.assertEquals(self._pipeline(rho_cmd.cmd_strings[index],
+                                         dmidecode),
+                          function(dmidecode))
+
+    def test_processors(self):
+        self._check(rho_cmds.CpuRhoCmd(), 1, self.dmidecode)
+
+    def test_system_manufacturer(self):
+        self._check(rho_cmds.DmiRhoCmd(), 2, self.dmidecode)
+
+    def test_virt(self):
+        rho_cmd = rho_cmds.VirtRhoCmd()
+        for index in rho_cmd.sources:
+            if rho_cmd.sources[index][0] == "dmidecode-full":
+                self._check(rho_cmd, index, self.dmidecode)
+
+    def test_more_than_one_match(self):
+        dmidecode = self.dmidecode + self.dmidecode
+        self._check(rho_cmds.CpuRhoCmd(), 1, dmidecode)
+        self._check(rho_cmds.DmiRhoCmd(), 2, dmidecode)
+
+    def test_nothing(self):
+        self._check(rho_cmds.CpuRhoCmd(), 1, "")
+        self._check(rho_cmds.DmiRhoCmd(), 2, "")
+        self._check(rho_cmds.DmiRhoCmd(), 2, "dmidecode: command not found\n")
+
+
+class TestRedHatPackagesSummaryRhoCmd(_TestRhoCmd):
+    cmd_class = rho_cmds.RedhatPackagesSummaryRhoCmd
+
+    def _summarize(self, rpm_output):
+        # just the awk half, over output we already have
+        p = subprocess.Popen(rho_cmds.PKG_SUMMARY, shell=True,
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        out, err = p.communicate(rpm_output)
+        rho_cmd = self.cmd_class()
+        rho_cmd.populate_data([(out, err)])
+        return rho_cmd
+
+    def _full(self, rpm_output):
+        rho_cmd = rho_cmds.RedhatPackagesRhoCmd()
+        rho_cmd.populate_data([(rpm_output, "")])
+        return rho_cmd
+
+    def test_matches_full_list(self):
+        rpm_output = TestRedHatPackagesRhoCmd.rpm_output
+        self.assertEquals(self._full(rpm_output).data,
+                          self._summarize(rpm_output).data)
+
+    def test_first_of_a_tie_wins(self):
+        rpm_output = ("a|1|1|1300000005|Red Hat|1200000005|x.redhat.com|a.src.rpm|GPL|Red Hat|Tue 01|Wed 01\n"
+                      "b|1|1|1300000005|Red Hat|1200000005|y.redhat.com|b.src.rpm|GPL|Red Hat|Tue 02|Wed 02\n")
+        self.assertEquals(self._full(rpm_output).data,
+                          self._summarize(rpm_output).data)
+        self.assertEquals("a-1-1 Installed: Tue 01",
+                          self._summarize(rpm_output).data['redhat-packages.last_installed'])
+
+    def test_no_red_hat_packages(self):
+        rpm_output = ("zsh|4.3|1.fc12|1300000009|Fedora|1200000009|x86-02.fedora.redhat.com|zsh.src.rpm|GPL|Fedora|Tue 02|Wed 02\n")
+        self.assertEquals(self._full(rpm_output).data,
+                          self._summarize(rpm_output).data)
+        self.assertEquals(0, self._summarize(rpm_output).data['redhat-packages.num_rh_packages'])
+
+    def test_short_lines_skipped(self):
+        rpm_output = "not a package\n" + TestRedHatPackagesRhoCmd.rpm_output
+        self.assertEquals(self._full(rpm_output).data,
+                          self._summarize(rpm_output).data)
+        self.assertEquals(3, self._summarize(rpm_output).data['redhat-packages.num_installed_packages'])
+
+    def test_bad_summary(self):
+        for stdout in ["nonsense\n", "1|2|3\n", "many|0|0||\n",
+                       "3|1|0|a|b|c\n", ""]:
+            rho_cmd = self.cmd_class()
+            rho_cmd.populate_data([(stdout, "")])
+            self.assertEquals("error", rho_cmd.error)
+            for field in rho_cmd.fields:
+                self.assertEquals("error", rho_cmd.data[field])
+
+    def test_rpm_error(self):
+        rho_cmd = self.cmd_class()
+        rho_cmd.populate_data([("0|0|0||\n", "rpm: command not found\n")])
+        self.assertEquals("error",
+                          rho_cmd.data['redhat-packages.num_installed_packages'])
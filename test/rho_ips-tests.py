@@ -110,3 +110,18 @@ class TestRhoIps(unittest.TestCase):
             for j in range(0, 256):
                 expected.append("10.0.%s.%s" % (i, j))
         self._check_ipr("10.0.0.0 - 10.0.3.255", expected)
+
+
+class TestSubnetKey(unittest.TestCase):
+
+    def test_24(self):
+        self.assertEquals("10.1.2.0/24", rho_ips.subnet_key("10.1.2.3"))
+        self.assertEquals("10.1.2.0/24", rho_ips.subnet_key("10.1.2.255"))
+
+    def test_prefix(self):
+        self.assertEquals("10.1.0.0/16", rho_ips.subnet_key("10.1.2.3", 16))
+        self.assertEquals("10.1.2.3/32", rho_ips.subnet_key("10.1.2.3", 32))
+        self.assertEquals("0.0.0.0/0", rho_ips.subnet_key("10.1.2.3", 0))
+
+    def test_hostname(self):
+        self.assertEquals("example.com", rho_ips.subnet_key("example.com"))
@@ -0,0 +1,250 @@
+#!/usr/bin/python
+
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from rho import config
+from rho import scan_report
+from rho import scan_state
+from rho import scanner
+from rho import ssh_jobs
+
+
+def make_job(ip, port=None, auth=None, error=None, unreachable=False):
+    job = ssh_jobs.SshJob(ip=ip, ports=[port or 22], rho_cmds=[], auths=[])
+    job.port = port
+    job.auth = auth
+    job.error = error
+    job.unreachable = unreachable
+    job.handshakes = 1
+    job.auth_attempts = 1
+    job.handshake_latency = 0.25
+    return job
+
+
+class TestScanState(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "rho", "scan_state.db")
+        self.state = scan_state.ScanState(self.path)
+        self.auth = config.SshAuth({'name': 'auth', 'username': 'root',
+                                    'password': 'pw', 'type': 'ssh'})
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_unknown(self):
+        self.assertEquals(None, self.state.get("10.0.0.1"))
+
+    def test_success_then_failure(self):
+        self.state.update(make_job("10.0.0.1", 22, self.auth))
+        self.state.update(make_job("10.0.0.1", error="login failed"))
+        host = self.state.get("10.0.0.1")
+        # a failure doesn't forget what worked before
+        self.assertEquals(22, host['port'])
+        self.assertEquals("auth", host['auth_name'])
+        self.assertEquals(0.25, host['handshake_latency'])
+        self.assertEquals("login failed", host['failure_reason'])
+        self.assertTrue(host['last_success'] <= host['last_failure'])
+
+    def test_persists(self):
+        self.state.update(make_job("10.0.0.1", 22, self.auth))
+        self.state.flush()
+        self.assertEquals(22, scan_state.ScanState(self.path).get("10.0.0.1")['port'])
+
+    def test_two_writers(self):
+        # another --workers process, or another scan, on the same file
+        other = scan_state.ScanState(self.path)
+        other.conn.execute("PRAGMA busy_timeout = 100")
+        self.state.update(make_job("10.0.0.1", 22, self.auth))
+        other.update(make_job("10.0.0.2", 2222, self.auth))
+        self.state.update(make_job("10.0.0.3", 22, self.auth))
+        self.assertEquals(2222, self.state.get("10.0.0.2")['port'])
+        self.assertEquals(22, other.get("10.0.0.3")['port'])
+
+    def test_failed_update_still_reported(self):
+        report = scan_report.ScanReport(state=self.state)
+        locker = sqlite3.connect(self.path, timeout=0)
+        locker.execute("BEGIN EXCLUSIVE")
+        self.state.conn.execute("PRAGMA busy_timeout = 100")
+        try:
+            report.add(make_job("10.0.0.1", error="unable to connect",
+                               unreachable=True))
+        finally:
+            locker.rollback()
+            locker.close()
+        self.assertTrue("10.0.0.1" in report.ips)
+        # and the next one goes through
+        report.add(make_job("10.0.0.2", 22, self.auth))
+        self.assertEquals(22, self.state.get("10.0.0.2")['port'])
+
+    def test_not_a_database(self):
+        path = os.path.join(self.dir, "junk.db")
+        open(path, "w").write("not a database, " * 100)
+        self.assertRaises(scan_state.ScanStateError, scan_state.ScanState,
+                          path)
+
+    def test_failed_get(self):
+        self.state.conn.execute("DROP TABLE hosts")
+        self.assertRaises(scan_state.ScanStateError, self.state.get,
+                          "10.0.0.1")
+        # the scanner goes on without it
+        scan = scanner.Scanner(config=config.Config(auths=[self.auth]),
+                               state=self.state)
+        profile = config.Profile(name='p', ranges=['10.0.0.1'],
+                                 auth_names=['auth'], ports=[22])
+        self.assertEquals(["10.0.0.1"], [ssh_job.ip for ssh_job
+                                         in scan._gen_ssh_jobs([profile])])
+
+    def test_pickle(self):
+        state = pickle.loads(pickle.dumps(self.state))
+        state.update(make_job("10.0.0.1", 22, self.auth))
+        self.assertEquals(22, state.get("10.0.0.1")['port'])
+
+    def test_adds_columns(self):
+        path = os.path.join(self.dir, "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE hosts (ip TEXT PRIMARY KEY, port INTEGER)")
+        conn.execute("INSERT INTO hosts VALUES ('10.0.0.1', 2222)")
+        conn.commit()
+        conn.close()
+        host = scan_state.ScanState(path).get("10.0.0.1")
+        self.assertEquals(2222, host['port'])
+        self.assertEquals(None, host['auth_name'])
+
+    def test_backoff(self):
+        for i in range(3):
+            self.state.update(make_job("10.0.0.1", error="unable to connect",
+                                      unreachable=True))
+        host = self.state.get("10.0.0.1")
+        self.assertEquals(3, host['fail_count'])
+        self.assertAlmostEquals(host['last_failure'] +
+                                scan_state.BACKOFF_BASE * 4,
+                                host['next_attempt'], 2)
+        self.assertEquals(scan_state.BACKOFF_MAX, scan_state.backoff(100))
+
+        self.state.update(make_job("10.0.0.1", error="login failed"))
+        host = self.state.get("10.0.0.1")
+        self.assertEquals(0, host['fail_count'])
+        self.assertEquals(None, host['next_attempt'])
+
+    def _scanner(self, rescan=False):
+        profile = config.Profile(name='p', ranges=['10.0.0.4'],
+                                 auth_names=['auth'], ports=[22])
+        scan = scanner.Scanner(config=config.Config(auths=[self.auth],
+                                                    profiles=[profile]),
+                               state=self.state, rescan=rescan)
+        return scan._new_ssh_job(profile, "10.0.0.4")
+
+    def test_skip_unreachable(self):
+        self.state.update(make_job("10.0.0.4", error="unable to connect",
+                                  unreachable=True))
+        ssh_job = self._scanner()
+        self.assertTrue(ssh_job.skipped)
+        self.assertFalse(self._scanner(rescan=True).skipped)
+
+        # skipping it doesn't count as another failure
+        self.state.update(ssh_job)
+        self.assertEquals(1, self.state.get("10.0.0.4")['fail_count'])
+
+    def test_retry_unreachable(self):
+        job = make_job("10.0.0.4", error="unable to connect", unreachable=True)
+        self.state.update(job)
+        self.state.conn.execute("UPDATE hosts SET next_attempt = 0")
+        ssh_job = self._scanner()
+        self.assertFalse(ssh_job.skipped)
+        self.assertEquals(scan_state.RETRY_TIMEOUT, ssh_job.timeout)
+
+    def test_report_updates(self):
+        report = scan_report.ScanReport(self.state)
+        report.add(make_job("10.0.0.2", 22, self.auth))
+        self.assertEquals("auth", self.state.get("10.0.0.2")['auth_name'])
+
+    def test_scanner_reorders(self):
+        self.state.update(make_job("10.0.0.3", 2222, self.auth))
+        other = config.SshAuth({'name': 'other', 'username': 'root',
+                                'password': 'pw', 'type': 'ssh'})
+        profile = config.Profile(name='p', ranges=['10.0.0.3'],
+                                 auth_names=['other', 'auth'],
+                                 ports=[22, 2222])
+        scan = scanner.Scanner(config=config.Config(auths=[self.auth, other],
+                                                    profiles=[profile]),
+                               state=self.state)
+        ssh_job = scan._new_ssh_job(profile, "10.0.0.3")
+        self.assertEquals([2222, 22], ssh_job.ports)
+        self.assertEquals(["auth", "other"],
+                          [auth.name for auth in ssh_job.auths])
+
+
+class TestJobOrder(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.state = scan_state.ScanState(os.path.join(self.dir, "state.db"))
+        self.auth = config.SshAuth({'name': 'auth', 'username': 'root',
+                                    'password': 'pw', 'type': 'ssh'})
+        self.profile = config.Profile(name='p', ranges=['10.0.0.1 - 10.0.0.5'],
+                                      auth_names=['auth'], ports=[22])
+        self.scanner = scanner.Scanner(config=config.Config(auths=[self.auth],
+                                            profiles=[self.profile]),
+                                       state=self.state)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _record(self, ip, duration, unreachable=False):
+        job = make_job(ip, 22, self.auth)
+        if unreachable:
+            job = make_job(ip, error="unable to connect", unreachable=True)
+        job.duration = duration
+        self.state.update(job)
+
+    def test_longest_first(self):
+        self._record("10.0.0.1", 1.0)
+        self._record("10.0.0.2", 0.5, unreachable=True)
+        self._record("10.0.0.3", 20.0)
+        self._record("10.0.0.5", 5.0)
+        # let the unreachable one be tried
+        self.state.conn.execute("UPDATE hosts SET next_attempt = 0")
+
+        ssh_jobs = self.scanner._gen_ssh_jobs([self.profile])
+        # .4 is new, so it's guessed at the average of the others
+        self.assertEquals(["10.0.0.3", "10.0.0.4", "10.0.0.5", "10.0.0.1",
+                           "10.0.0.2"], [ssh_job.ip for ssh_job in ssh_jobs])
+
+    def test_jobs_built_as_needed(self):
+        built = []
+        new_ssh_job = self.scanner._new_ssh_job
+
+        def _new_ssh_job(profile, ip):
+            built.append(ip)
+            return new_ssh_job(profile, ip)
+        self.scanner._new_ssh_job = _new_ssh_job
+        ssh_jobs = self.scanner._gen_ssh_jobs([self.profile])
+        ssh_jobs.next()
+        self.assertEquals(1, len(built))
+
+    def test_skipped_not_retried(self):
+        self._record("10.0.0.2", 0.5, unreachable=True)
+        ips = [ssh_job.ip for ssh_job
+               in self.scanner._gen_ssh_jobs([self.profile])]
+        # straight to the report as skipped, and only the once
+        self.assertEquals(["10.0.0.2", "10.0.0.1", "10.0.0.3", "10.0.0.4",
+                           "10.0.0.5"], ips)
+
+    def test_newly_unreachable_not_retried(self):
+        self._record("10.0.0.2", 0.5, unreachable=True)
+        self.scanner.rescan = True
+        ips = []
+        for ssh_job in self.scanner._gen_ssh_jobs([self.profile]):
+            ips.append(ssh_job.ip)
+            if ssh_job.ip == "10.0.0.1":
+                # scanned while the rest are still being handed out
+                self._record(ssh_job.ip, 3.0, unreachable=True)
+        self.assertEquals(["10.0.0.1", "10.0.0.3", "10.0.0.4", "10.0.0.5",
+                           "10.0.0.2"], ips)
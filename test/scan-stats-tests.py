@@ -0,0 +1,116 @@
+import unittest
+
+from rho import scan_stats
+from rho import ssh_jobs
+
+
+def make_job(error=None, unreachable=False, skipped=False, auth_failed=False):
+    job = ssh_jobs.SshJob(ip="10.0.0.1", ports=[22], rho_cmds=[], auths=[])
+    job.error = error
+    job.unreachable = unreachable
+    job.skipped = skipped
+    job.auth_failed = auth_failed
+    return job
+
+
+class TestFormatDuration(unittest.TestCase):
+
+    def test_format(self):
+        self.assertEquals("0:00:05", scan_stats.format_duration(5))
+        self.assertEquals("1:01:01", scan_stats.format_duration(3661.5))
+        self.assertEquals("27:46:40", scan_stats.format_duration(100000))
+
+
+class FakeController(object):
+
+    def __init__(self, limit):
+        self.limit = limit
+
+
+class TestScanStats(unittest.TestCase):
+
+    def test_add(self):
+        stats = scan_stats.ScanStats(10)
+        stats.add(make_job())
+        stats.add(make_job())
+        stats.add(make_job(error="login failed", auth_failed=True))
+        stats.add(make_job(error="no ssh", unreachable=True))
+        stats.add(make_job(error="skipped", unreachable=True, skipped=True))
+        stats.add(make_job(error="timeout"))
+        self.assertEquals(6, stats.done)
+        self.assertEquals(2, stats.success)
+        self.assertEquals(1, stats.auth_failed)
+        self.assertEquals(1, stats.unreachable)
+        self.assertEquals(1, stats.skipped)
+        self.assertEquals(1, stats.errors)
+
+    def test_in_flight(self):
+        stats = scan_stats.ScanStats()
+        stats.started()
+        stats.started()
+        stats.stopped()
+        self.assertEquals(1, stats.in_flight)
+
+    def test_eta(self):
+        stats = scan_stats.ScanStats(30)
+        stats.start_time = stats.start_time - 10
+        for i in range(10):
+            stats.add(make_job())
+        # 1 host a second, with 20 to go
+        self.assertAlmostEquals(20, stats.eta(), 0)
+        self.assertTrue(stats.status_line().startswith("10/30 hosts, 1.0/s"))
+        self.assertTrue(stats.status_line().endswith("ETA 0:00:20"))
+
+    def test_no_total(self):
+        stats = scan_stats.ScanStats()
+        stats.add(make_job())
+        self.assertEquals(None, stats.eta())
+        self.assertTrue(stats.status_line().startswith("1 hosts,"))
+        self.assertTrue("ETA" not in stats.status_line())
+
+    def test_adaptive_limit(self):
+        stats = scan_stats.ScanStats(5)
+        self.assertTrue("limit" not in stats.status_line())
+        stats = scan_stats.ScanStats(5, FakeController(40))
+        stats.started()
+        self.assertTrue("1 in flight, limit 40, 0 ok" in stats.status_line())
+
+    def test_nothing_done(self):
+        stats = scan_stats.ScanStats(5)
+        self.assertEquals(None, stats.eta())
+
+
+class TestTimingHistogram(unittest.TestCase):
+
+    def test_add(self):
+        histogram = scan_stats.TimingHistogram()
+        histogram.add("connect", 0.005)
+        histogram.add("connect", 0.05)
+        histogram.add("connect", 0.01)
+        histogram.add("connect", 500)
+        counts, total, longest = histogram.phases["connect"]
+        self.assertEquals([1, 2, 0, 0, 0, 0, 0, 1], counts)
+        self.assertAlmostEquals(500.065, total)
+        self.assertEquals(500, longest)
+
+    def test_merge(self):
+        one = scan_stats.TimingHistogram()
+        one.add("kex", 0.2)
+        two = scan_stats.TimingHistogram()
+        two.add("kex", 2)
+        two.add("auth", 0.3)
+        one.merge(two)
+        self.assertEquals(2, sum(one.phases["kex"][0]))
+        self.assertEquals(2, one.phases["kex"][2])
+        self.assertEquals(1, sum(one.phases["auth"][0]))
+
+    def test_format(self):
+        histogram = scan_stats.TimingHistogram()
+        histogram.add("kex", 0.2)
+        histogram.add("cmd.uname", 0.05)
+        lines = histogram.format()
+        self.assertEquals(3, len(lines))
+        self.assertTrue(lines[0].startswith("phase"))
+        self.assertTrue(lines[0].endswith(">=2m"))
+        self.assertTrue(lines[1].startswith("cmd.uname"))
+        self.assertTrue(lines[2].startswith("kex"))
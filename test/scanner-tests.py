@@ -0,0 +1,50 @@
+#!/usr/bin/python
+
+import unittest
+
+from rho import config
+from rho import scan_report
+from rho import scanner
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self):
+        auth = config.SshAuth({'name': 'auth', 'username': 'root',
+                               'password': 'pw', 'type': 'ssh'})
+        self.profiles = [
+            config.Profile(name='one', ranges=['10.0.0.1 - 10.0.0.5'],
+                           auth_names=['auth'], ports=[22]),
+            config.Profile(name='two', ranges=['10.0.1.1', '10.0.1.2'],
+                           auth_names=['auth'], ports=[22])]
+        self.scanner = scanner.Scanner(config=config.Config(auths=[auth],
+                                            profiles=self.profiles))
+
+    def _ips(self, shard=0, shards=1):
+        return [job.ip for job in
+                self.scanner._gen_ssh_jobs(self.profiles, shard, shards)]
+
+    def test_shards_cover_all_ips(self):
+        all_ips = self._ips()
+        self.assertEquals(7, len(all_ips))
+        shards = [self._ips(shard, 3) for shard in range(3)]
+        self.assertEquals([3, 2, 2], [len(ips) for ips in shards])
+        self.assertEquals(sorted(all_ips), sorted(sum(shards, [])))
+
+    def test_merge(self):
+        one = scan_report.ScanReport()
+        one.ips['10.0.0.1'] = {'ip': '10.0.0.1'}
+        two = scan_report.ScanReport()
+        two.ips['10.0.0.2'] = {'ip': '10.0.0.2'}
+        one.merge(two)
+        self.assertEquals(['10.0.0.1', '10.0.0.2'], sorted(one.ips.keys()))
+
+    def test_summarize_packages(self):
+        names = [rho_cmd.name for rho_cmd in self.scanner.get_rho_cmds()]
+        self.assertTrue("redhat-packages" in names)
+
+        summarizing = scanner.Scanner(config=self.scanner.config,
+                                      summarize_packages=True)
+        names = [rho_cmd.name for rho_cmd in summarizing.get_rho_cmds()]
+        self.assertFalse("redhat-packages" in names)
+        self.assertTrue("redhat-packages-summary" in names)